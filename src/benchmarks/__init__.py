@@ -0,0 +1,3 @@
+"""This module contains benchmarks comparing the latency, memory and outputs of
+    alternative implementations used in the project.
+"""
@@ -0,0 +1,241 @@
+"""Load tests the crowd status API with concurrent readers while the status is
+    updated, for several numbers of API workers.
+
+The API is started as :mod:`deployment.api` with ``API_WORKERS`` workers,
+which share the status through shared memory. Client processes request the status over
+keep-alive connections as fast as they can, while a thread posts updates whose
+timestamp encodes the status, so that a status served with the timestamp of
+another update is counted as inconsistent.
+"""
+
+import argparse
+import datetime
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Optional, TypedDict
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+#: Seconds to wait for the API to start.
+STARTUP_TIMEOUT = 60.0
+
+#: Timestamp of the update with status 0, each status is one second later.
+BASE_TIME = datetime.datetime(2024, 1, 1)
+
+
+class ApiLoadBenchmark(TypedDict):
+    """Load test results of a number of API workers.
+
+    :param workers: Number of API worker processes
+    :type workers: int
+    :param clients: Number of client processes
+    :type clients: int
+    :param requests: Status requests served
+    :type requests: int
+    :param throughput: Status requests served per second
+    :type throughput: float
+    :param p50_ms: Median request latency in ms
+    :type p50_ms: float
+    :param p99_ms: 99th percentile request latency in ms
+    :type p99_ms: float
+    :param updates: Status updates posted during the test
+    :type updates: int
+    :param inconsistent: Responses whose status and timestamp came from
+        different updates
+    :type inconsistent: int
+    """
+
+    workers: int
+    clients: int
+    requests: int
+    throughput: float
+    p50_ms: float
+    p99_ms: float
+    updates: int
+    inconsistent: int
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(port: int, server: subprocess.Popen) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("The API exited on startup.")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/api/get_crowd_status")
+            connection.getresponse().read()
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"The API did not start in {STARTUP_TIMEOUT}s.")
+
+
+def _read_status(port: int, duration: float, results: Any) -> None:
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    latencies = []
+    inconsistent = 0
+    deadline = time.perf_counter() + duration
+    while (start := time.perf_counter()) < deadline:
+        connection.request("GET", "/api/get_crowd_status")
+        status = json.loads(connection.getresponse().read())
+        latencies.append(time.perf_counter() - start)
+        expected = BASE_TIME + datetime.timedelta(seconds=status["status"])
+        if status["timestamp"] != expected.isoformat():
+            inconsistent += 1
+    connection.close()
+    results.put((latencies, inconsistent))
+
+
+def _post_updates(port: int, rate: float, stop: threading.Event) -> int:
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    updates = 0
+    while not stop.wait(1 / rate):
+        updates += 1
+        timestamp = BASE_TIME + datetime.timedelta(seconds=updates)
+        connection.request(
+            "POST",
+            "/api/update_crowd_status",
+            json.dumps({"status": updates, "timestamp": timestamp.isoformat()}),
+            {"Content-Type": "application/json"},
+        )
+        connection.getresponse().read()
+    connection.close()
+    return updates
+
+
+def benchmark_api(
+    workers: int, clients: int, duration: float, update_rate: float = 10.0
+) -> ApiLoadBenchmark:
+    """Load tests the API with a number of workers.
+
+    :param workers: Number of API worker processes
+    :type workers: int
+    :param clients: Number of client processes requesting the status
+    :type clients: int
+    :param duration: Seconds to request for
+    :type duration: float
+    :param update_rate: Status updates posted per second, defaults to 10.0
+    :type update_rate: float, optional
+    :return: Load test results
+    :rtype: ApiLoadBenchmark
+    """
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "deployment.api"],
+        cwd=SRC_DIR,
+        env=dict(
+            os.environ,
+            PYTHONPATH=SRC_DIR,
+            UVICORN_HOST="127.0.0.1",
+            API_PORT=str(port),
+            API_WORKERS=str(workers),
+        ),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_until_up(port, server)
+        stop = threading.Event()
+        updates: list[int] = []
+        updater = threading.Thread(
+            target=lambda: updates.append(_post_updates(port, update_rate, stop))
+        )
+        updater.start()
+        # Wait for the first update, so that every response has a status.
+        time.sleep(2 / update_rate)
+
+        ctx = multiprocessing.get_context("spawn")
+        results = ctx.Queue()
+        readers = [
+            ctx.Process(target=_read_status, args=(port, duration, results))
+            for _ in range(clients)
+        ]
+        for reader in readers:
+            reader.start()
+        outcomes = [results.get() for _ in readers]
+        for reader in readers:
+            reader.join()
+        stop.set()
+        updater.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = sorted(latency for outcome in outcomes for latency in outcome[0])
+    return ApiLoadBenchmark(
+        workers=workers,
+        clients=clients,
+        requests=len(latencies),
+        throughput=len(latencies) / duration,
+        p50_ms=1000 * latencies[len(latencies) // 2],
+        p99_ms=1000 * latencies[int(len(latencies) * 0.99)],
+        updates=updates[0],
+        inconsistent=sum(outcome[1] for outcome in outcomes),
+    )
+
+
+def main(
+    workers: Optional[list[int]] = None,
+    clients: int = 8,
+    duration: float = 5.0,
+    update_rate: float = 10.0,
+) -> list[ApiLoadBenchmark]:
+    """Load tests the API for each number of workers and prints a comparison.
+
+    :param workers: Numbers of API workers, defaults to 1, 2 and 4
+    :type workers: Optional[list[int]], optional
+    :param clients: Number of client processes, defaults to 8
+    :type clients: int, optional
+    :param duration: Seconds to request for per number of workers, defaults
+        to 5.0
+    :type duration: float, optional
+    :param update_rate: Status updates posted per second, defaults to 10.0
+    :type update_rate: float, optional
+    :return: Load test results of each number of workers
+    :rtype: list[ApiLoadBenchmark]
+    """
+    results = []
+    print(f"{clients} clients for {duration}s, {update_rate} updates/s")
+    print("workers  requests    req/s   p50 ms   p99 ms  updates  inconsistent")
+    for n_workers in workers or [1, 2, 4]:
+        result = benchmark_api(n_workers, clients, duration, update_rate)
+        print(
+            f"{n_workers:7d} {result['requests']:9d} {result['throughput']:8.0f} "
+            f"{result['p50_ms']:8.2f} {result['p99_ms']:8.2f} "
+            f"{result['updates']:8d} {result['inconsistent']:13d}"
+        )
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(
+        description="Load test the crowd status API with several workers."
+    )
+    args.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4],
+        help="Numbers of API workers to test",
+    )
+    args.add_argument("--clients", type=int, default=8, help="Client processes")
+    args.add_argument("--duration", type=float, default=5.0)
+    args.add_argument(
+        "--update_rate", type=float, default=10.0, help="Status updates per second"
+    )
+    main(**vars(args.parse_args()))
@@ -0,0 +1,395 @@
+"""Micro-benchmarks of the data preparation stages on synthetic raw data, with
+    baselines to catch regressions.
+
+:func:`write_synthetic_raw_data` writes collector directories in the raw data
+format, of a size set by the number of days, collectors, WiFi APs and Bluetooth
+devices per scan. Each stage of :mod:`dataset.build_dataframe` and
+:func:`train_and_score.load_data` is timed (best of several runs) and its peak
+memory measured with :mod:`tracemalloc` in a separate run, as tracing slows the
+stage down. Results can be saved as a baseline per data profile, and later runs
+flag stages that got slower or use more memory than the baseline by more than a
+threshold. Everything runs offline.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Optional, TypedDict
+
+import numpy as np
+
+from dataset.build_dataframe import (
+    COLLECTOR_MANIFEST_FILENAME,
+    get_bluetooth_dataframe,
+    get_top_N_wifi_aps_only,
+    get_wifi_dataframe,
+    merge_dfs,
+    pivot_tables,
+)
+from train_and_score import load_data
+
+DEFAULT_BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data_prep_baseline.json"
+)
+
+#: First day of the synthetic data, a Monday.
+START_DATE = datetime.date(2024, 3, 4)
+
+#: Opening hours covered by the scans and population counts each day.
+OPENING_HOURS = (9, 18)
+
+#: Minutes between the population counts.
+POPULATION_COUNT_INTERVAL = 30
+
+
+class StageBenchmark(TypedDict):
+    """Benchmark results of a data preparation stage.
+
+    :param stage: Stage name
+    :type stage: str
+    :param seconds: Fastest wall time of the runs in seconds
+    :type seconds: float
+    :param peak_mib: Peak memory allocated during the stage in MiB
+    :type peak_mib: float
+    """
+
+    stage: str
+    seconds: float
+    peak_mib: float
+
+
+def get_profile(
+    days: int, collectors: int, aps: int, bt_density: float, scans_per_day: int
+) -> str:
+    """Returns the key of a synthetic data size in the baselines.
+
+    :param days: Number of days
+    :type days: int
+    :param collectors: Number of collectors
+    :type collectors: int
+    :param aps: Number of WiFi APs seen per scan
+    :type aps: int
+    :param bt_density: Mean number of Bluetooth devices per scan
+    :type bt_density: float
+    :param scans_per_day: Number of scans per collector and day
+    :type scans_per_day: int
+    :return: Profile key
+    :rtype: str
+    """
+    return (
+        f"days={days},collectors={collectors},aps={aps},"
+        f"bt_density={bt_density:g},scans_per_day={scans_per_day}"
+    )
+
+
+def write_synthetic_raw_data(
+    data_dir: str | os.PathLike,
+    days: int = 2,
+    collectors: int = 4,
+    aps: int = 30,
+    bt_density: float = 20.0,
+    scans_per_day: int = 48,
+    seed: int = 0,
+) -> tuple[str, str, str]:
+    """Writes synthetic raw data, bounding box counts and population counts.
+
+    Each collector scans ``scans_per_day`` times during the opening hours, a
+    few seconds apart from the other collectors, and sees every AP with a
+    signal strength around a per-collector level. The number of Bluetooth
+    devices per scan is Poisson distributed around ``bt_density``.
+
+    :param data_dir: Directory to write the data to
+    :type data_dir: str | os.PathLike
+    :param days: Number of days, defaults to 2
+    :type days: int, optional
+    :param collectors: Number of collectors, defaults to 4
+    :type collectors: int, optional
+    :param aps: Number of WiFi APs seen per scan, defaults to 30
+    :type aps: int, optional
+    :param bt_density: Mean number of Bluetooth devices per scan, defaults to 20.0
+    :type bt_density: float, optional
+    :param scans_per_day: Number of scans per collector and day, defaults to 48
+    :type scans_per_day: int, optional
+    :param seed: Random seed, defaults to 0
+    :type seed: int, optional
+    :return: Raw data, bounding box CSV and population count CSV paths
+    :rtype: tuple[str, str, str]
+    """
+    rng = np.random.default_rng(seed)
+    open_minutes = 60 * (OPENING_HOURS[1] - OPENING_HOURS[0])
+    scan_interval = max(1, open_minutes // scans_per_day)
+    scan_times = [
+        datetime.datetime.combine(
+            START_DATE + datetime.timedelta(days=day),
+            datetime.time(OPENING_HOURS[0]),
+        )
+        + datetime.timedelta(minutes=scan * scan_interval)
+        for day in range(days)
+        for scan in range(scans_per_day)
+    ]
+
+    raw_data_path = os.path.join(data_dir, "raw_data")
+    names = [f"collector_{i:02d}" for i in range(collectors)]
+    os.makedirs(raw_data_path, exist_ok=True)
+    with open(
+        os.path.join(raw_data_path, COLLECTOR_MANIFEST_FILENAME), "w", encoding="utf-8"
+    ) as f:
+        json.dump({name: i for i, name in enumerate(names)}, f)
+
+    bt_pool = [f"{i // 256:02X}:{i % 256:02X}" for i in range(int(5 * bt_density) + 1)]
+    # The bounding box and population counts are read with the second line as
+    # the header.
+    bbox_lines = ["Timestamp,Device_ID,Bbox Count"] * 2
+    for device_idx, name in enumerate(names):
+        collector_dir = os.path.join(raw_data_path, name)
+        os.makedirs(collector_dir, exist_ok=True)
+        levels = rng.uniform(30, 95, aps)
+        wifi_lines, bt_lines = [], []
+        for scan_time in scan_times:
+            timestamp = (scan_time + datetime.timedelta(seconds=device_idx)).strftime(
+                "%Y%m%d%H%M%S"
+            )
+            strengths = np.clip(levels + rng.normal(0, 5, aps), 1, 100).astype(int)
+            wifi_lines.extend(
+                f"{timestamp},AA:BB:{ap // 256:02X}:{ap % 256:02X},SIT-POLY,{strength}"
+                for ap, strength in enumerate(strengths)
+            )
+            n_bt = min(len(bt_pool), rng.poisson(bt_density))
+            bt_lines.extend(
+                f"{timestamp} - [NEW] Device CC:DD:{address} phone"
+                for address in rng.choice(bt_pool, n_bt, replace=False)
+            )
+            bbox_lines.append(f"{timestamp[:12]},{device_idx},{rng.poisson(10)}")
+
+        with open(
+            os.path.join(collector_dir, "wifi_signal_strength.csv"),
+            "w",
+            encoding="utf-8",
+        ) as f:
+            f.write("\n".join(wifi_lines) + "\n")
+        with open(
+            os.path.join(collector_dir, "btoutput.txt"), "w", encoding="utf-8"
+        ) as f:
+            f.write("\n".join(bt_lines) + "\n")
+
+    bbox_csv_path = os.path.join(data_dir, "bbox_results.csv")
+    with open(bbox_csv_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(bbox_lines) + "\n")
+
+    pop_count_csv_path = os.path.join(data_dir, "manual_counts.csv")
+    with open(pop_count_csv_path, "w", encoding="utf-8") as f:
+        f.write("Timestamp,Count,Comment\nTimestamp,Count,Comment\n")
+        for day in range(days):
+            date = START_DATE + datetime.timedelta(days=day)
+            for minutes in range(0, open_minutes + 1, POPULATION_COUNT_INTERVAL):
+                count_time = datetime.datetime.combine(
+                    date, datetime.time(OPENING_HOURS[0])
+                ) + datetime.timedelta(minutes=minutes)
+                f.write(f"{count_time:%d/%m/%Y %H:%M:%S},{rng.poisson(60)},\n")
+
+    return raw_data_path, bbox_csv_path, pop_count_csv_path
+
+
+def benchmark_stage(stage: str, fn: Callable[[], Any], repeats: int) -> StageBenchmark:
+    """Benchmarks a stage.
+
+    :param stage: Stage name
+    :type stage: str
+    :param fn: Runs the stage, must not modify its inputs
+    :type fn: Callable[[], Any]
+    :param repeats: Number of timed runs
+    :type repeats: int
+    :return: Benchmark results
+    :rtype: StageBenchmark
+    """
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    return StageBenchmark(stage=stage, seconds=min(seconds), peak_mib=peak / 2**20)
+
+
+def benchmark_data_prep(
+    paths: tuple[str, str, str], top_n_aps: int = 5, repeats: int = 3
+) -> list[StageBenchmark]:
+    """Benchmarks each data preparation stage of ``train_and_score.main``.
+
+    :param paths: Raw data, bounding box CSV and population count CSV paths
+    :type paths: tuple[str, str, str]
+    :param top_n_aps: Top N WiFi APs, defaults to 5
+    :type top_n_aps: int, optional
+    :param repeats: Number of timed runs per stage, defaults to 3
+    :type repeats: int, optional
+    :return: Benchmark results of each stage
+    :rtype: list[StageBenchmark]
+    """
+    raw_data_path = paths[0]
+    wifi_df, bt_df, bbox_df, pop_df = load_data(*paths)
+    top_n_wifi_df = get_top_N_wifi_aps_only(wifi_df, top_n_aps)
+    tabulars = pivot_tables(top_n_wifi_df, bt_df, bbox_df)
+
+    stages: dict[str, Callable[[], Any]] = {
+        "get_wifi_dataframe": lambda: get_wifi_dataframe(raw_data_path),
+        "get_bluetooth_dataframe": lambda: get_bluetooth_dataframe(raw_data_path),
+        "load_data": lambda: load_data(*paths),
+        "get_top_N_wifi_aps_only": lambda: get_top_N_wifi_aps_only(wifi_df, top_n_aps),
+        "pivot_tables": lambda: pivot_tables(top_n_wifi_df, bt_df, bbox_df),
+        "merge_dfs": lambda: merge_dfs(*tabulars, pop_df),
+    }
+    return [benchmark_stage(stage, fn, repeats) for stage, fn in stages.items()]
+
+
+def compare_to_baseline(
+    results: list[StageBenchmark],
+    baseline: dict[str, StageBenchmark],
+    threshold: float = 0.2,
+) -> list[str]:
+    """Finds the stages that regressed from a baseline.
+
+    :param results: Benchmark results
+    :type results: list[StageBenchmark]
+    :param baseline: Baseline results by stage
+    :type baseline: dict[str, StageBenchmark]
+    :param threshold: Relative increase of the time or peak memory that is a
+        regression, defaults to 0.2
+    :type threshold: float, optional
+    :return: Description of each regression
+    :rtype: list[str]
+    """
+    regressions = []
+    for result in results:
+        reference = baseline.get(result["stage"])
+        if reference is None:
+            continue
+        for key in ("seconds", "peak_mib"):
+            if result[key] > reference[key] * (1 + threshold):
+                regressions.append(
+                    f"{result['stage']}: {key} {reference[key]:.4g} -> "
+                    f"{result[key]:.4g} (+{result[key] / reference[key] - 1:.0%})"
+                )
+    return regressions
+
+
+def main(
+    days: int = 2,
+    collectors: int = 4,
+    aps: int = 30,
+    bt_density: float = 20.0,
+    scans_per_day: int = 48,
+    top_n_aps: int = 5,
+    repeats: int = 3,
+    data_dir: Optional[str] = None,
+    baseline_path: str = DEFAULT_BASELINE_PATH,
+    save_baseline: bool = False,
+    threshold: float = 0.2,
+) -> list[str]:
+    """Benchmarks the data preparation on synthetic data and compares the
+    results with the baseline of the same data profile.
+
+    :param days: Number of days, defaults to 2
+    :type days: int, optional
+    :param collectors: Number of collectors, defaults to 4
+    :type collectors: int, optional
+    :param aps: Number of WiFi APs seen per scan, defaults to 30
+    :type aps: int, optional
+    :param bt_density: Mean number of Bluetooth devices per scan, defaults to 20.0
+    :type bt_density: float, optional
+    :param scans_per_day: Number of scans per collector and day, defaults to 48
+    :type scans_per_day: int, optional
+    :param top_n_aps: Top N WiFi APs, defaults to 5
+    :type top_n_aps: int, optional
+    :param repeats: Number of timed runs per stage, defaults to 3
+    :type repeats: int, optional
+    :param data_dir: Directory to write the synthetic data to, defaults to None
+        for a temporary directory
+    :type data_dir: Optional[str], optional
+    :param baseline_path: Baselines JSON file, defaults to
+        ``benchmarks/data_prep_baseline.json``
+    :type baseline_path: str, optional
+    :param save_baseline: Whether to save the results as the baseline of the
+        data profile, defaults to False
+    :type save_baseline: bool, optional
+    :param threshold: Relative increase that is a regression, defaults to 0.2
+    :type threshold: float, optional
+    :return: Description of each regression
+    :rtype: list[str]
+    """
+    profile = get_profile(days, collectors, aps, bt_density, scans_per_day)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = write_synthetic_raw_data(
+            data_dir or tmp_dir, days, collectors, aps, bt_density, scans_per_day
+        )
+        results = benchmark_data_prep(paths, top_n_aps, repeats)
+
+    baselines: dict[str, dict[str, StageBenchmark]] = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+    baseline = baselines.get(profile, {})
+
+    print(profile)
+    print(f"{'stage':<24} {'seconds':>9} {'peak MiB':>9} {'baseline s':>11}")
+    for result in results:
+        reference = baseline.get(result["stage"])
+        print(
+            f"{result['stage']:<24} {result['seconds']:9.4f} "
+            f"{result['peak_mib']:9.2f} "
+            f"{reference['seconds'] if reference else float('nan'):11.4f}"
+        )
+
+    regressions = compare_to_baseline(results, baseline, threshold)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    if not baseline:
+        print(f"No baseline for this profile in {baseline_path}.")
+
+    if save_baseline:
+        baselines[profile] = {result["stage"]: result for result in results}
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"Saved the baseline to {baseline_path}.")
+    return regressions
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(
+        description="Benchmark the data preparation on synthetic raw data."
+    )
+    args.add_argument("--days", type=int, default=2)
+    args.add_argument("--collectors", type=int, default=4)
+    args.add_argument("--aps", type=int, default=30, help="WiFi APs per scan")
+    args.add_argument(
+        "--bt_density", type=float, default=20.0, help="Bluetooth devices per scan"
+    )
+    args.add_argument("--scans_per_day", type=int, default=48)
+    args.add_argument("--top_n_aps", type=int, default=5)
+    args.add_argument("--repeats", type=int, default=3)
+    args.add_argument(
+        "--data_dir", type=str, default=None, help="Keep the synthetic data here"
+    )
+    args.add_argument("--baseline_path", type=str, default=DEFAULT_BASELINE_PATH)
+    args.add_argument(
+        "--save_baseline",
+        action="store_true",
+        help="Save the results as the baseline of the data profile",
+    )
+    args.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative slowdown or memory increase that is a regression",
+    )
+    sys.exit(1 if main(**vars(args.parse_args())) else 0)
@@ -0,0 +1,172 @@
+"""Benchmarks the people detector backends on the same images.
+
+Each backend runs in its own process so that its peak memory is not inflated by
+the other backend's runtime (e.g. torch).
+"""
+
+import argparse
+import glob
+import multiprocessing
+import os
+import resource
+import statistics
+import time
+from typing import TypedDict
+
+import cv2
+
+from util.people_detection import DETECTOR_BACKENDS, count_people
+
+DEMO_IMAGES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "deployment", "demo", "*.jpg"
+)
+
+
+class DetectorBenchmark(TypedDict):
+    """Benchmark results of a detector backend.
+
+    :param backend: Detector backend
+    :type backend: str
+    :param load_time: Wall time of loading the model and the first inference in
+        seconds
+    :type load_time: float
+    :param median_latency: Median per-image latency in seconds
+    :type median_latency: float
+    :param peak_rss_mib: Peak resident memory of the process in MiB
+    :type peak_rss_mib: float
+    :param counts: People count of each image
+    :type counts: list[int]
+    """
+
+    backend: str
+    load_time: float
+    median_latency: float
+    peak_rss_mib: float
+    counts: list[int]
+
+
+def benchmark_backend(
+    backend: str,
+    model_path: str,
+    image_paths: list[str],
+    imgsz: int,
+    repeats: int,
+    tile_size: int = 0,
+) -> DetectorBenchmark:
+    """Benchmarks a detector backend in the current process.
+
+    :param backend: Detector backend
+    :type backend: str
+    :param model_path: Detector weights
+    :type model_path: str
+    :param image_paths: Images to count the people in
+    :type image_paths: list[str]
+    :param imgsz: Detector input size
+    :type imgsz: int
+    :param repeats: Number of timed passes over the images
+    :type repeats: int
+    :param tile_size: Side of the detection tiles, 0 to disable tiling.
+        Defaults to 0.
+    :type tile_size: int, optional
+    :return: Benchmark results
+    :rtype: DetectorBenchmark
+    """
+    images = [cv2.imread(path) for path in image_paths]
+
+    start = time.perf_counter()
+    count_people(images[0], backend, model_path, imgsz, tile_size=tile_size)
+    load_time = time.perf_counter() - start
+
+    latencies = []
+    counts = []
+    for _ in range(repeats):
+        counts = []
+        for image in images:
+            start = time.perf_counter()
+            counts.append(
+                count_people(image, backend, model_path, imgsz, tile_size=tile_size)
+            )
+            latencies.append(time.perf_counter() - start)
+
+    return DetectorBenchmark(
+        backend=backend,
+        load_time=load_time,
+        median_latency=statistics.median(latencies),
+        peak_rss_mib=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        counts=counts,
+    )
+
+
+def main(
+    yolo_model: str = "yolov8s.pt",
+    onnx_model: str = "yolov8s.onnx",
+    images: str = DEMO_IMAGES,
+    imgsz: int = 640,
+    repeats: int = 5,
+    tile_size: int = 0,
+) -> list[DetectorBenchmark]:
+    """Benchmarks both detector backends and prints a comparison.
+
+    :param yolo_model: Weights of the ``yolo`` backend, defaults to "yolov8s.pt"
+    :type yolo_model: str, optional
+    :param onnx_model: Weights of the ``onnx`` backend, defaults to "yolov8s.onnx"
+    :type onnx_model: str, optional
+    :param images: Glob of the images, defaults to the demo images
+    :type images: str, optional
+    :param imgsz: Input size of the ``onnx`` backend, defaults to 640
+    :type imgsz: int, optional
+    :param repeats: Number of timed passes over the images, defaults to 5
+    :type repeats: int, optional
+    :param tile_size: Side of the detection tiles, 0 to disable tiling.
+        Defaults to 0.
+    :type tile_size: int, optional
+    :return: Benchmark results of each backend
+    :rtype: list[DetectorBenchmark]
+    """
+    image_paths = sorted(glob.glob(images))
+    assert image_paths, f"No images match {images}."
+    models = dict(zip(DETECTOR_BACKENDS, (yolo_model, onnx_model)))
+
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for backend, model_path in models.items():
+        with ctx.Pool(1) as pool:
+            results.append(
+                pool.apply(
+                    benchmark_backend,
+                    (backend, model_path, image_paths, imgsz, repeats, tile_size),
+                )
+            )
+
+    baseline = results[0]["counts"]
+    print(f"{len(image_paths)} images, {repeats} repeats, tile size {tile_size}")
+    for result in results:
+        diffs = [abs(a - b) for a, b in zip(result["counts"], baseline)]
+        print(
+            f"{result['backend']:>6}: "
+            f"load {result['load_time']:.2f}s, "
+            f"median latency {result['median_latency'] * 1000:.1f}ms, "
+            f"peak RSS {result['peak_rss_mib']:.0f}MiB, "
+            f"count agreement {diffs.count(0)}/{len(diffs)} "
+            f"(mean abs diff {statistics.mean(diffs):.2f})"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(
+        description="Benchmark the people detector backends on the same images."
+    )
+    args.add_argument("--yolo_model", type=str, default="yolov8s.pt")
+    args.add_argument("--onnx_model", type=str, default="yolov8s.onnx")
+    args.add_argument(
+        "--images", type=str, default=DEMO_IMAGES, help="Glob of the images"
+    )
+    args.add_argument(
+        "--imgsz", type=int, default=640, help="Input size of the ONNX model"
+    )
+    args.add_argument("--repeats", type=int, default=5)
+    args.add_argument(
+        "--tile_size", type=int, default=0, help="Detection tile size, 0 for none"
+    )
+    main(**vars(args.parse_args()))
@@ -0,0 +1,162 @@
+"""Reports the import time of the deployment entry points and the heaviest
+    packages they load, measured with ``python -X importtime`` in fresh
+    processes.
+
+Heavy dependencies (torch, ultralytics, OpenCV on the fog, pandas, sklearn and
+uvicorn) are imported on first use rather than when the entry points start, so
+they should not show up here. Set a budget to fail when an entry point becomes
+slower to import.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Optional, TypedDict
+
+#: Modules started on the edge, the fog and the API server.
+ENTRY_POINTS = (
+    "deployment.edge_publisher",
+    "deployment.fog_subscriber",
+    "deployment.api",
+)
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+class ImportTime(TypedDict):
+    """Import time of a module.
+
+    :param module: Module name
+    :type module: str
+    :param total_ms: Time to import the module and its dependencies in ms
+    :type total_ms: float
+    :param packages: Cumulative import time of each top-level package loaded,
+        in ms. Nested packages are included in their parent's time.
+    :type packages: dict[str, float]
+    """
+
+    module: str
+    total_ms: float
+    packages: dict[str, float]
+
+
+def parse_importtime(stderr: str, module: str) -> dict[str, float]:
+    """Parses the output of ``python -X importtime`` for a module.
+
+    Modules are listed after the modules they import, indented by nesting
+    level, so the modules imported by ``module`` are the nested lines right
+    before its own. Imports of the interpreter startup (e.g. ``site``) are
+    not included.
+
+    :param stderr: Standard error of the process
+    :type stderr: str
+    :param module: Module imported by the process
+    :type module: str
+    :return: Cumulative import time in ms of the module and each module it
+        imported, by name
+    :rtype: dict[str, float]
+    """
+    subtree: dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # The header line.
+        subtree[name.strip()] = int(cumulative) / 1000
+        if len(name) - len(name.lstrip()) <= 1:
+            # A top-level import, which ends the previous subtree.
+            if name.strip() == module:
+                return subtree
+            subtree = {}
+    raise ValueError(f"{module} is not in the import times.")
+
+
+def measure_import_time(module: str, repeats: int = 3) -> ImportTime:
+    """Measures the import time of a module in fresh processes.
+
+    :param module: Module name
+    :type module: str
+    :param repeats: Number of processes, the fastest is reported, defaults to 3
+    :type repeats: int, optional
+    :raises RuntimeError: If the module fails to import
+    :return: Import time of the module
+    :rtype: ImportTime
+    """
+    fastest: Optional[ImportTime] = None
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=SRC_DIR,
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+        modules = parse_importtime(result.stderr, module)
+        packages: dict[str, float] = {}
+        for name, cumulative in modules.items():
+            package = name.split(".")[0]
+            packages[package] = max(packages.get(package, 0.0), cumulative)
+        packages.pop(module.split(".")[0], None)
+
+        import_time = ImportTime(
+            module=module, total_ms=modules[module], packages=packages
+        )
+        if fastest is None or import_time["total_ms"] < fastest["total_ms"]:
+            fastest = import_time
+    assert fastest is not None
+    return fastest
+
+
+def main(
+    modules: Optional[list[str]] = None,
+    top: int = 8,
+    repeats: int = 3,
+    budget_ms: Optional[float] = None,
+) -> list[ImportTime]:
+    """Prints the import time of each module and its heaviest packages.
+
+    :param modules: Modules to measure, defaults to the deployment entry points
+    :type modules: Optional[list[str]], optional
+    :param top: Number of heaviest packages listed, defaults to 8
+    :type top: int, optional
+    :param repeats: Number of processes per module, defaults to 3
+    :type repeats: int, optional
+    :param budget_ms: Import time budget in ms, defaults to None for none
+    :type budget_ms: Optional[float], optional
+    :return: The modules over the budget
+    :rtype: list[ImportTime]
+    """
+    over_budget = []
+    for module in modules or ENTRY_POINTS:
+        import_time = measure_import_time(module, repeats)
+        heaviest = sorted(import_time["packages"].items(), key=lambda kv: -kv[1])
+        print(f"{module}: {import_time['total_ms']:.0f}ms")
+        for package, cumulative in heaviest[:top]:
+            print(f"  {package:<24} {cumulative:8.1f}ms")
+        if budget_ms is not None and import_time["total_ms"] > budget_ms:
+            print(f"  over the budget of {budget_ms:.0f}ms")
+            over_budget.append(import_time)
+    return over_budget
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(
+        description="Report the import time of the deployment entry points."
+    )
+    args.add_argument(
+        "--modules", type=str, nargs="+", default=None, help="Modules to measure"
+    )
+    args.add_argument("--top", type=int, default=8, help="Heaviest packages listed")
+    args.add_argument("--repeats", type=int, default=3)
+    args.add_argument(
+        "--budget_ms",
+        type=float,
+        default=None,
+        help="Exit with status 1 if a module takes longer to import",
+    )
+    sys.exit(1 if main(**vars(args.parse_args())) else 0)
@@ -0,0 +1,428 @@
+"""Benchmarks the throughput and latency of the fog and the API with a synthetic
+    fleet of edge devices.
+
+Virtual devices replay the demo readings (and optionally the demo images) at a
+fixed rate through a queue that stands in for the MQTT broker. The fog
+subscriber and the API each run in their own process, so that their CPU time
+and peak memory are measured separately, and the end-to-end latency of each
+reading is taken from its trace, see :mod:`util.tracing`.
+
+The crowd model only has TOTAL_DEVICES feature slots, so virtual device ``v``
+fills slot ``v % TOTAL_DEVICES``.
+"""
+
+import argparse
+import contextlib
+import glob
+import heapq
+import json
+import math
+import multiprocessing
+import os
+import resource
+import socket
+import threading
+import time
+from typing import Any, Callable, Optional, TypedDict
+
+import cv2
+import paho.mqtt.client as mqtt
+import pandas as pd
+
+from deployment.config import TOP_N_APS, TOPIC, TOTAL_DEVICES
+from util.capture_image import encode_image
+from util.tracing import mark_sent, new_trace
+from util.wifi_bt_processing import (
+    get_bbox_counts_column_index,
+    get_bt_column_index,
+    get_wifi_column_indices,
+)
+
+DEMO_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "deployment", "demo"
+)
+
+#: Seconds to wait for the fog and the API processes to start.
+STARTUP_TIMEOUT = 120.0
+
+
+class ProcessUsage(TypedDict):
+    """Resource usage of a process during a benchmark.
+
+    :param cpu_seconds: User and system CPU time in seconds
+    :type cpu_seconds: float
+    :param wall_seconds: Wall time in seconds
+    :type wall_seconds: float
+    :param peak_rss_mib: Peak resident memory in MiB
+    :type peak_rss_mib: float
+    """
+
+    cpu_seconds: float
+    wall_seconds: float
+    peak_rss_mib: float
+
+
+class PipelineBenchmark(TypedDict):
+    """Benchmark results of a fleet size.
+
+    :param devices: Number of virtual edge devices
+    :type devices: int
+    :param rate: Messages per second sent by each device
+    :type rate: float
+    :param sent: Messages sent
+    :type sent: int
+    :param processed: Crowd status updates received by the API
+    :type processed: int
+    :param throughput: Processed messages per second, from the first message
+        the fog received until it was drained
+    :type throughput: float
+    :param latency: End-to-end latency count and percentiles in seconds, see
+        :meth:`util.tracing.LatencyRecorder.summary`
+    :type latency: dict[str, float]
+    :param fog: Resource usage of the fog subscriber
+    :type fog: ProcessUsage
+    :param api: Resource usage of the API
+    :type api: ProcessUsage
+    """
+
+    devices: int
+    rate: float
+    sent: int
+    processed: int
+    throughput: float
+    latency: dict[str, float]
+    fog: ProcessUsage
+    api: ProcessUsage
+
+
+def make_fleet_payloads(
+    n_devices: int,
+    return_image: bool = False,
+    koufu_csv_path: str = os.path.join(DEMO_DIR, "koufu.csv"),
+    images: str = os.path.join(DEMO_DIR, "*.jpg"),
+) -> list[list[dict[str, Any]]]:
+    """Makes the payloads replayed by each virtual device from the demo data.
+
+    :param n_devices: Number of virtual devices
+    :type n_devices: int
+    :param return_image: Whether the devices return their image to the fog
+        instead of the people count, defaults to False
+    :type return_image: bool, optional
+    :param koufu_csv_path: Readings to replay, defaults to the demo readings
+    :type koufu_csv_path: str, optional
+    :param images: Glob of the images returned, defaults to the demo images
+    :type images: str, optional
+    :return: Payloads of each device without the timestamp and the trace
+    :rtype: list[list[dict[str, Any]]]
+    """
+    df = pd.read_csv(koufu_csv_path)
+    encoded_images = (
+        [encode_image(cv2.imread(path)) for path in sorted(glob.glob(images))]
+        if return_image
+        else []
+    )
+    assert encoded_images or not return_image, f"No images match {images}."
+
+    fleet = []
+    for virtual_id in range(n_devices):
+        device_id = virtual_id % TOTAL_DEVICES
+        wifi_col_idx = get_wifi_column_indices(device_id, top_n=TOP_N_APS)
+        bt_col_idx = get_bt_column_index(
+            device_id, total_devices=TOTAL_DEVICES, top_n=TOP_N_APS
+        )
+        bbox_col_idx = get_bbox_counts_column_index(
+            device_id, total_devices=TOTAL_DEVICES, top_n=TOP_N_APS
+        )
+        fleet.append(
+            [
+                {
+                    "image": (
+                        encoded_images[virtual_id % len(encoded_images)]
+                        if return_image
+                        else int(row.iloc[bbox_col_idx])
+                    ),
+                    "wifi_strength": row.iloc[wifi_col_idx].astype(int).tolist(),
+                    "bt_output": math.ceil(row.iloc[bt_col_idx]),
+                    "device_id": device_id,
+                    "return_image": return_image,
+                }
+                for _, row in df.iterrows()
+            ]
+        )
+    return fleet
+
+
+def make_message(payload: dict[str, Any], virtual_id: int) -> bytes:
+    """Stamps a payload with a new trace, as the edge publisher does.
+
+    :param payload: Payload from :func:`make_fleet_payloads`
+    :type payload: dict[str, Any]
+    :param virtual_id: Virtual device sending the payload, used as the trace's
+        device
+    :type virtual_id: int
+    :return: Message payload
+    :rtype: bytes
+    """
+    trace = new_trace(virtual_id)
+    return json.dumps(
+        {**payload, "timestamp": trace["created_at"], "trace": mark_sent(trace)}
+    ).encode()
+
+
+def run_fleet(
+    fleet: list[list[dict[str, Any]]],
+    rate: float,
+    duration: float,
+    publish: Callable[[bytes], Any],
+) -> int:
+    """Sends the payloads of each device at a fixed rate, with the devices'
+    phases spread evenly over the interval.
+
+    :param fleet: Payloads of each device from :func:`make_fleet_payloads`
+    :type fleet: list[list[dict[str, Any]]]
+    :param rate: Messages per second sent by each device
+    :type rate: float
+    :param duration: Seconds to send for
+    :type duration: float
+    :param publish: Sends a message, e.g. ``queue.put``
+    :type publish: Callable[[bytes], Any]
+    :return: Number of messages sent
+    :rtype: int
+    """
+    interval = 1 / rate
+    start = time.perf_counter()
+    schedule = [
+        (start + virtual_id * interval / len(fleet), virtual_id, 0)
+        for virtual_id in range(len(fleet))
+    ]
+    heapq.heapify(schedule)
+
+    sent = 0
+    while schedule:
+        due, virtual_id, n = heapq.heappop(schedule)
+        if due - start >= duration:
+            break
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        payloads = fleet[virtual_id]
+        publish(make_message(payloads[n % len(payloads)], virtual_id))
+        sent += 1
+        heapq.heappush(schedule, (due + interval, virtual_id, n + 1))
+    return sent
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _usage_since(start: float, start_cpu: float) -> ProcessUsage:
+    return ProcessUsage(
+        cpu_seconds=_cpu_seconds() - start_cpu,
+        wall_seconds=time.perf_counter() - start,
+        peak_rss_mib=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    )
+
+
+def _run_api(
+    port: int,
+    reservoir_size: int,
+    ready: Any,
+    stop: Any,
+    results: Any,
+) -> None:
+    # pylint: disable=import-outside-toplevel
+    import uvicorn
+
+    from deployment import api
+    from util.tracing import LatencyRecorder
+
+    api.latency_recorder = LatencyRecorder(reservoir_size)
+    server = uvicorn.Server(
+        uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    start, start_cpu = time.perf_counter(), _cpu_seconds()
+    ready.set()
+    stop.wait()
+    usage = _usage_since(start, start_cpu)
+    server.should_exit = True
+    thread.join()
+
+    latency = api.latency_recorder.summary().get("end_to_end", {}).get("all", {})
+    results.put((usage, int(api.status_updates.value), latency))
+
+
+def _run_fog(messages: Any, ready: Any, results: Any) -> None:
+    # pylint: disable=import-outside-toplevel
+    from deployment import fog_subscriber
+
+    fog_subscriber.load_model()
+    ready.set()
+
+    # The fog prints a line per message, which would dominate at high rates.
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(
+        devnull
+    ):
+        payload = messages.get()
+        start, start_cpu = time.perf_counter(), _cpu_seconds()
+        while payload is not None:
+            message = mqtt.MQTTMessage(topic=TOPIC.encode())
+            message.payload = payload
+            fog_subscriber.on_message(None, None, message)  # type: ignore
+            payload = messages.get()
+        if fog_subscriber.message_executor is not None:
+            fog_subscriber.message_executor.shutdown(wait=True)
+    results.put(_usage_since(start, start_cpu))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start(process: Any, ready: Any, name: str) -> None:
+    process.start()
+    if not ready.wait(STARTUP_TIMEOUT):
+        process.terminate()
+        raise RuntimeError(f"The {name} did not start in {STARTUP_TIMEOUT}s.")
+
+
+def benchmark_pipeline(
+    n_devices: int, rate: float, duration: float, return_image: bool = False
+) -> PipelineBenchmark:
+    """Runs a fleet of virtual devices against a fog and an API process.
+
+    :param n_devices: Number of virtual devices
+    :type n_devices: int
+    :param rate: Messages per second sent by each device
+    :type rate: float
+    :param duration: Seconds to send for
+    :type duration: float
+    :param return_image: Whether the devices return their image to the fog,
+        which then runs the people detector, defaults to False
+    :type return_image: bool, optional
+    :return: Benchmark results
+    :rtype: PipelineBenchmark
+    """
+    ctx = multiprocessing.get_context("spawn")
+    port = _free_port()
+    messages, fog_results, api_results = ctx.Queue(), ctx.Queue(), ctx.Queue()
+    api_ready, fog_ready, api_stop = ctx.Event(), ctx.Event(), ctx.Event()
+
+    api_process = ctx.Process(
+        target=_run_api,
+        args=(port, math.ceil(rate * duration) + 1, api_ready, api_stop, api_results),
+    )
+    _start(api_process, api_ready, "API")
+    fog_process = ctx.Process(target=_run_fog, args=(messages, fog_ready, fog_results))
+    # Spawned processes read the config from the environment they start with.
+    api_url = os.environ.get("CROWD_API_URL")
+    os.environ["CROWD_API_URL"] = f"http://127.0.0.1:{port}"
+    try:
+        _start(fog_process, fog_ready, "fog subscriber")
+        if api_url is None:
+            del os.environ["CROWD_API_URL"]
+        else:
+            os.environ["CROWD_API_URL"] = api_url
+        fleet = make_fleet_payloads(n_devices, return_image)
+        sent = run_fleet(fleet, rate, duration, messages.put)
+        messages.put(None)
+        fog_usage: ProcessUsage = fog_results.get()
+    finally:
+        api_stop.set()
+    api_usage, processed, latency = api_results.get()
+    fog_process.join()
+    api_process.join()
+
+    return PipelineBenchmark(
+        devices=n_devices,
+        rate=rate,
+        sent=sent,
+        processed=processed,
+        throughput=processed / fog_usage["wall_seconds"],
+        latency=latency,
+        fog=fog_usage,
+        api=api_usage,
+    )
+
+
+def _format_usage(usage: ProcessUsage) -> str:
+    cpu = 100 * usage["cpu_seconds"] / usage["wall_seconds"]
+    return f"{cpu:7.1f}% {usage['peak_rss_mib']:6.0f}MiB"
+
+
+def main(
+    devices: Optional[list[int]] = None,
+    rate: float = 1.0,
+    duration: float = 10.0,
+    return_image: bool = False,
+) -> list[PipelineBenchmark]:
+    """Benchmarks the pipeline for each fleet size and prints a comparison.
+
+    :param devices: Fleet sizes, defaults to 1, 4, 16 and 64 devices
+    :type devices: Optional[list[int]], optional
+    :param rate: Messages per second sent by each device, defaults to 1.0
+    :type rate: float, optional
+    :param duration: Seconds to send for per fleet size, defaults to 10.0
+    :type duration: float, optional
+    :param return_image: Whether the devices return their image to the fog,
+        defaults to False
+    :type return_image: bool, optional
+    :return: Benchmark results of each fleet size
+    :rtype: list[PipelineBenchmark]
+    """
+    results = []
+    print(
+        f"{rate} msg/s per device for {duration}s, "
+        f"{'images' if return_image else 'counts'} returned"
+    )
+    print(
+        "devices  sent  processed    msg/s   p50 ms   p95 ms   p99 ms"
+        "    fog CPU   fog RSS    API CPU   API RSS"
+    )
+    for n_devices in devices or [1, 4, 16, 64]:
+        result = benchmark_pipeline(n_devices, rate, duration, return_image)
+        latency = {
+            key: result["latency"].get(key, math.nan) * 1000
+            for key in ("p50", "p95", "p99")
+        }
+        print(
+            f"{n_devices:7d} {result['sent']:5d} {result['processed']:10d} "
+            f"{result['throughput']:8.1f} "
+            f"{latency['p50']:8.1f} {latency['p95']:8.1f} {latency['p99']:8.1f} "
+            f"{_format_usage(result['fog'])} {_format_usage(result['api'])}"
+        )
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(
+        description="Benchmark the fog and the API with a synthetic edge fleet."
+    )
+    args.add_argument(
+        "--devices",
+        type=int,
+        nargs="+",
+        default=[1, 4, 16, 64],
+        help="Fleet sizes to benchmark",
+    )
+    args.add_argument(
+        "--rate", type=float, default=1.0, help="Messages per second per device"
+    )
+    args.add_argument(
+        "--duration", type=float, default=10.0, help="Seconds to send for"
+    )
+    args.add_argument(
+        "--return_image",
+        action="store_true",
+        help="Return the demo images to the fog, which needs the detector",
+    )
+    main(**vars(args.parse_args()))
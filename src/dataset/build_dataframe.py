@@ -1,13 +1,51 @@
 """Builds DataFrames from raw data for early analysis.
 """
 
+import json
 import os
 import re
+from typing import Iterable
 
 import numpy as np
 import pandas as pd
 from tqdm.auto import tqdm
 
+#: Name of the collector manifest in the raw data directory.
+COLLECTOR_MANIFEST_FILENAME = "collectors.json"
+
+#: Collectors used when the raw data directory has no manifest.
+DEFAULT_COLLECTOR_NAMES = ["bryan", "chris", "jiayu", "jurgen"]
+
+#: Pattern of a Bluetooth scan line: timestamp and device address.
+BT_LINE_PATTERN = re.compile(r"(\d{14}) - .*?Device (\S+)")
+
+
+def get_collector_names(raw_data_path: os.PathLike | str) -> list[str]:
+    """Gets the collector names, ordered by device index, from the collector
+    manifest in the raw data path.
+
+    The manifest maps each collector name to its device index, e.g.
+    ``{"bryan": 0, "chris": 1}``. If it does not exist,
+    :data:`DEFAULT_COLLECTOR_NAMES` is returned.
+
+    :param raw_data_path: Path to the raw data
+    :type raw_data_path: os.PathLike | str
+    :return: Collector names where the list index is the device index
+    :rtype: list[str]
+    """
+    manifest_path = os.path.join(raw_data_path, COLLECTOR_MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return list(DEFAULT_COLLECTOR_NAMES)
+
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest: dict[str, int] = json.load(f)
+
+    collector_names = sorted(manifest, key=manifest.__getitem__)
+    assert [manifest[name] for name in collector_names] == list(
+        range(len(collector_names))
+    ), f"Device indices in {manifest_path} must be contiguous from 0."
+    return collector_names
+
 
 def convert_timestamps_to_datetime(
     df: pd.DataFrame,
@@ -62,7 +100,7 @@ def get_wifi_dataframe(
     collector_names = (
         collector_names
         if collector_names is not None
-        else ["bryan", "chris", "jiayu", "jurgen"]
+        else get_collector_names(raw_data_path)
     )
 
     super_df = pd.DataFrame(columns=columns)
@@ -103,16 +141,10 @@ def get_bluetooth_dataframe(
     assert os.path.exists(raw_data_path), f"{raw_data_path} does not exist."
 
     all_dfs = []
-    pattern = r"(\d{14}) - .*?Device (\S+)"
-    columns = (
-        columns
-        if columns is not None
-        else ["timestamp", "bt_device_count", "device_idx"]
-    )
     collector_names = (
         collector_names
         if collector_names is not None
-        else ["bryan", "chris", "jiayu", "jurgen"]
+        else get_collector_names(raw_data_path)
     )
 
     for root, _, files in tqdm(os.walk(raw_data_path)):
@@ -122,31 +154,52 @@ def get_bluetooth_dataframe(
                 continue
 
             device_idx = collector_names.index(name)
-            unique_bt_devices = {}
             with open(os.path.join(root, file), "r", encoding="utf-8") as f:
                 lines = f.readlines()
-            for line in lines:
-                matches = re.findall(pattern, line)
-                for timestamp, bt_device_id in matches:
-                    if timestamp not in unique_bt_devices:
-                        unique_bt_devices[timestamp] = {bt_device_id}
-                    else:
-                        unique_bt_devices[timestamp].add(bt_device_id)
-
-            df = pd.DataFrame(
-                [
-                    (timestamp, len(devices), device_idx)
-                    for timestamp, devices in unique_bt_devices.items()
-                ],
-                columns=columns,
-            )
-            all_dfs.append(df)
+            all_dfs.append(parse_bluetooth_lines(lines, device_idx, columns))
 
     bluetooth_df = pd.concat(all_dfs, ignore_index=True)
     bluetooth_df = convert_timestamps_to_datetime(bluetooth_df)
     return bluetooth_df
 
 
+def parse_bluetooth_lines(
+    lines: Iterable[str], device_idx: int, columns: list[str] | None = None
+) -> pd.DataFrame:
+    """Counts the unique Bluetooth devices per timestamp in `bluetoothctl` output.
+
+    :param lines: Lines of the Bluetooth log
+    :type lines: Iterable[str]
+    :param device_idx: Device index of the collector
+    :type device_idx: int
+    :param columns: Column names, defaults to None
+    :type columns: list[str], optional
+    :return: DataFrame of unconverted timestamps and Bluetooth device counts
+    :rtype: pd.DataFrame
+    """
+    columns = (
+        columns
+        if columns is not None
+        else ["timestamp", "bt_device_count", "device_idx"]
+    )
+    unique_bt_devices = {}
+    for line in lines:
+        matches = BT_LINE_PATTERN.findall(line)
+        for timestamp, bt_device_id in matches:
+            if timestamp not in unique_bt_devices:
+                unique_bt_devices[timestamp] = {bt_device_id}
+            else:
+                unique_bt_devices[timestamp].add(bt_device_id)
+
+    return pd.DataFrame(
+        [
+            (timestamp, len(devices), device_idx)
+            for timestamp, devices in unique_bt_devices.items()
+        ],
+        columns=columns,
+    )
+
+
 def get_population_count_df(
     csv_path: os.PathLike | str, columns: list[str] | None = None
 ) -> pd.DataFrame:
@@ -207,6 +260,28 @@ def get_nearest_timestamp(
     return ref_timestamps[np.argmin(np.abs(ref_timestamps - x))]
 
 
+def align_to_reference_timestamps(
+    df: pd.DataFrame,
+    ref_timestamps: pd.Series,
+    timestamp_col: str = "timestamp",
+) -> pd.DataFrame:
+    """Snaps every timestamp in the DataFrame to its nearest reference timestamp.
+
+    :param df: DataFrame containing timestamps
+    :type df: pd.DataFrame
+    :param ref_timestamps: Reference timestamps, usually from the population counts
+    :type ref_timestamps: pd.Series
+    :param timestamp_col: Timestamp column name, defaults to "timestamp"
+    :type timestamp_col: str, optional
+    :return: DataFrame with aligned timestamps
+    :rtype: pd.DataFrame
+    """
+    df[timestamp_col] = df[timestamp_col].apply(
+        lambda x: get_nearest_timestamp(x, ref_timestamps)
+    )
+    return df
+
+
 def get_top_N_wifi_aps_only(df: pd.DataFrame, N: int = 5) -> pd.DataFrame:
     """Gets the top N wifi ap signal strengths, grouped by timestamp and device_idx
 
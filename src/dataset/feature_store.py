@@ -0,0 +1,569 @@
+"""Persists the aligned training features as partitioned Parquet files so that
+    unchanged raw data does not have to be re-parsed on every training run.
+
+The store is laid out as follows::
+
+    <store_dir>/manifest.json
+    <store_dir>/population.parquet
+    <store_dir>/combined.parquet
+    <store_dir>/<kind>/date=<YYYY-MM-DD>/collector=<name>/part.parquet
+
+where ``<kind>`` is one of ``wifi``, ``bt`` or ``bbox``. Each partition holds
+the long-form rows of one collector for one day, already aligned to the
+population count timestamps. ``combined.parquet`` is the output of
+:func:`dataset.build_dataframe.merge_dfs` over all partitions, after reducing the
+WiFi rows to the top :math:`N` APs.
+
+Raw inputs are fingerprinted in the manifest. A collector's partitions are only
+rebuilt when one of its raw files changes, and removed with its raw data
+directory, while a change in the shared inputs (bounding box results or
+population counts) rebuilds everything. Changing ``top_n_aps`` only
+reassembles ``combined.parquet``.
+The manifest also keeps a :class:`Watermark` per raw file so that
+:mod:`dataset.ingestion` can append newly collected lines without a rebuild.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Optional, TypedDict
+
+import pandas as pd
+
+from dataset.build_dataframe import (
+    align_to_reference_timestamps,
+    get_bbox_df,
+    get_bluetooth_dataframe,
+    get_collector_names,
+    get_population_count_df,
+    get_top_N_wifi_aps_only,
+    get_wifi_dataframe,
+    merge_dfs,
+    pivot_tables,
+)
+
+#: Version of the on-disk layout, bump to invalidate existing stores.
+STORE_VERSION = 2
+
+#: Kinds of partitioned tables kept by the store.
+PARTITION_KINDS = ("wifi", "bt", "bbox")
+
+MANIFEST_FILENAME = "manifest.json"
+POPULATION_FILENAME = "population.parquet"
+COMBINED_FILENAME = "combined.parquet"
+
+#: Number of bytes before a watermark that are hashed to detect rewritten files.
+WATERMARK_TAIL_BYTES = 4096
+
+#: Leading timestamp of a raw data line.
+LINE_TIMESTAMP_PATTERN = re.compile(rb"^\s*(\d{12,14})")
+
+
+class FileFingerprint(TypedDict):
+    """Fingerprint of a raw input file.
+
+    :param size: File size in bytes
+    :type size: int
+    :param mtime_ns: Modification time in nanoseconds
+    :type mtime_ns: int
+    :param sha256: SHA-256 digest of the file contents, None if the file was
+        only read incrementally
+    :type sha256: str | None
+    """
+
+    size: int
+    mtime_ns: int
+    sha256: str | None
+
+
+class Watermark(TypedDict):
+    """Position up to which a raw file has been ingested.
+
+    :param offset: Byte offset of the first line not yet ingested
+    :type offset: int
+    :param last_timestamp: Last raw timestamp ingested, lines at or before it are skipped
+    :type last_timestamp: str | None
+    :param tail_sha256: SHA-256 digest of the bytes just before ``offset``
+    :type tail_sha256: str
+    """
+
+    offset: int
+    last_timestamp: str | None
+    tail_sha256: str
+
+
+class CollectorEntry(TypedDict):
+    """Manifest entry for the partitions of one collector.
+
+    :param inputs: Fingerprints of the collector's raw files, keyed by file name
+    :type inputs: dict[str, FileFingerprint]
+    :param dates: Dates (ISO format) of the partitions written for the collector
+    :type dates: list[str]
+    :param watermarks: Ingestion watermarks of the collector's raw files
+    :type watermarks: dict[str, Watermark]
+    """
+
+    inputs: dict[str, FileFingerprint]
+    dates: list[str]
+    watermarks: dict[str, Watermark]
+
+
+class StoreManifest(TypedDict):
+    """Manifest of the feature store.
+
+    :param version: Layout version, see :data:`STORE_VERSION`
+    :type version: int
+    :param top_n_aps: Top :math:`N` WiFi APs kept in the combined table
+    :type top_n_aps: int
+    :param shared_inputs: Fingerprints of inputs shared by all collectors
+    :type shared_inputs: dict[str, FileFingerprint]
+    :param shared_watermarks: Ingestion watermarks of the shared inputs
+    :type shared_watermarks: dict[str, Watermark]
+    :param collectors: Per-collector entries
+    :type collectors: dict[str, CollectorEntry]
+    """
+
+    version: int
+    top_n_aps: int
+    shared_inputs: dict[str, FileFingerprint]
+    shared_watermarks: dict[str, Watermark]
+    collectors: dict[str, CollectorEntry]
+
+
+def fingerprint_file(
+    path: str | os.PathLike, previous: Optional[FileFingerprint] = None
+) -> FileFingerprint:
+    """Fingerprints a file, reusing the previous digest if the size and
+    modification time are unchanged.
+
+    :param path: Path to the file
+    :type path: str | os.PathLike
+    :param previous: Previously recorded fingerprint, defaults to None
+    :type previous: Optional[FileFingerprint], optional
+    :return: Fingerprint of the file
+    :rtype: FileFingerprint
+    """
+    stat = os.stat(path)
+    if (
+        previous is not None
+        and previous["size"] == stat.st_size
+        and previous["mtime_ns"] == stat.st_mtime_ns
+    ):
+        return previous
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return FileFingerprint(
+        size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=digest.hexdigest()
+    )
+
+
+def get_tail_digest(path: str | os.PathLike, offset: int) -> str:
+    """Hashes the :data:`WATERMARK_TAIL_BYTES` bytes before an offset.
+
+    :param path: Path to the file
+    :type path: str | os.PathLike
+    :param offset: Byte offset
+    :type offset: int
+    :return: SHA-256 digest of the bytes before the offset
+    :rtype: str
+    """
+    start = max(0, offset - WATERMARK_TAIL_BYTES)
+    with open(path, "rb") as f:
+        f.seek(start)
+        return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+
+def get_eof_watermark(path: str | os.PathLike) -> Watermark:
+    """Gets the watermark after the last complete line of a file.
+
+    :param path: Path to the file
+    :type path: str | os.PathLike
+    :return: Watermark at the end of the file
+    :rtype: Watermark
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.seek(max(0, size - (1 << 16)))
+        tail = f.read()
+
+    offset = size - len(tail) + tail.rfind(b"\n") + 1
+    last_timestamp = None
+    for line in reversed(tail[: offset - size + len(tail)].splitlines()):
+        match = LINE_TIMESTAMP_PATTERN.match(line)
+        if match:
+            last_timestamp = match.group(1).decode()
+            break
+
+    return Watermark(
+        offset=offset,
+        last_timestamp=last_timestamp,
+        tail_sha256=get_tail_digest(path, offset),
+    )
+
+
+def read_manifest(store_dir: str | os.PathLike) -> StoreManifest | None:
+    """Reads the manifest of the feature store.
+
+    :param store_dir: Feature store directory
+    :type store_dir: str | os.PathLike
+    :return: The manifest, or None if the store has not been built
+    :rtype: StoreManifest | None
+    """
+    manifest_path = os.path.join(store_dir, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(store_dir: str | os.PathLike, manifest: StoreManifest) -> None:
+    """Writes the manifest of the feature store atomically.
+
+    :param store_dir: Feature store directory
+    :type store_dir: str | os.PathLike
+    :param manifest: Manifest to write
+    :type manifest: StoreManifest
+    """
+    manifest_path = os.path.join(store_dir, MANIFEST_FILENAME)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def write_table(df: pd.DataFrame, path: str | os.PathLike) -> None:
+    """Writes a DataFrame to Parquet atomically, so that readers which have the
+    previous file memory-mapped are unaffected.
+
+    :param df: DataFrame to write
+    :type df: pd.DataFrame
+    :param path: Destination path
+    :type path: str | os.PathLike
+    """
+    tmp_path = f"{path}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def get_partition_path(
+    store_dir: str | os.PathLike, kind: str, date: str, collector: str
+) -> str:
+    """Gets the path of a partition file.
+
+    :param store_dir: Feature store directory
+    :type store_dir: str | os.PathLike
+    :param kind: One of :data:`PARTITION_KINDS`
+    :type kind: str
+    :param date: Partition date in ISO format
+    :type date: str
+    :param collector: Collector name
+    :type collector: str
+    :return: Path to the partition file
+    :rtype: str
+    """
+    return os.path.join(
+        store_dir, kind, f"date={date}", f"collector={collector}", "part.parquet"
+    )
+
+
+def _get_collector_inputs(
+    collector_dir: str | os.PathLike, previous: dict[str, FileFingerprint]
+) -> dict[str, FileFingerprint]:
+    return {
+        file: fingerprint_file(os.path.join(collector_dir, file), previous.get(file))
+        for file in sorted(os.listdir(collector_dir))
+        if file.endswith((".csv", ".txt"))
+    }
+
+
+def _remove_collector_partitions(
+    store_dir: str | os.PathLike, collector: str, dates: list[str]
+) -> None:
+    for kind in PARTITION_KINDS:
+        for date in dates:
+            partition_dir = os.path.dirname(
+                get_partition_path(store_dir, kind, date, collector)
+            )
+            shutil.rmtree(partition_dir, ignore_errors=True)
+
+
+def write_partitions(
+    store_dir: str | os.PathLike,
+    kind: str,
+    collector: str,
+    df: pd.DataFrame,
+    append: bool = False,
+) -> set[str]:
+    """Splits a long-form DataFrame by date and writes one partition per date.
+
+    :param store_dir: Feature store directory
+    :type store_dir: str | os.PathLike
+    :param kind: One of :data:`PARTITION_KINDS`
+    :type kind: str
+    :param collector: Collector name
+    :type collector: str
+    :param df: Aligned long-form DataFrame with a ``timestamp`` column
+    :type df: pd.DataFrame
+    :param append: Adds a new part file next to the existing ones instead of
+        replacing them, defaults to False
+    :type append: bool, optional
+    :return: Dates written
+    :rtype: set[str]
+    """
+    dates = set()
+    for date, partition in df.groupby(df["timestamp"].dt.date):
+        date = date.isoformat()
+        path = get_partition_path(store_dir, kind, date, collector)
+        partition_dir = os.path.dirname(path)
+        os.makedirs(partition_dir, exist_ok=True)
+        if append:
+            num_parts = len(list(Path(partition_dir).glob("part*.parquet")))
+            path = os.path.join(partition_dir, f"part-{num_parts:05d}.parquet")
+        partition.reset_index(drop=True).to_parquet(path, index=False)
+        dates.add(date)
+    return dates
+
+
+def _build_collector_partitions(
+    store_dir: str | os.PathLike,
+    collector_dir: str | os.PathLike,
+    collector: str,
+    collector_names: list[str],
+    bbox_df: pd.DataFrame,
+    ref_timestamps: pd.Series,
+) -> list[str]:
+    files = os.listdir(collector_dir)
+    device_idx = collector_names.index(collector)
+    frames = {}
+
+    if any(file.endswith(".csv") for file in files):
+        wifi_df = get_wifi_dataframe(collector_dir, collector_names=collector_names)
+        wifi_df["device_idx"] = wifi_df["device_idx"].astype(int)
+        frames["wifi"] = align_to_reference_timestamps(wifi_df, ref_timestamps)
+
+    if any(file.endswith(".txt") for file in files):
+        bt_df = get_bluetooth_dataframe(collector_dir, collector_names=collector_names)
+        frames["bt"] = align_to_reference_timestamps(bt_df, ref_timestamps)
+
+    collector_bbox_df = bbox_df.loc[bbox_df["device_idx"] == device_idx].copy()
+    frames["bbox"] = align_to_reference_timestamps(collector_bbox_df, ref_timestamps)
+
+    dates = set()
+    for kind, df in frames.items():
+        dates |= write_partitions(store_dir, kind, collector, df)
+    return sorted(dates)
+
+
+def load_partitions(
+    store_dir: str | os.PathLike,
+    kind: str,
+    dates: Optional[list[str]] = None,
+    collectors: Optional[list[str]] = None,
+) -> pd.DataFrame:
+    """Loads and concatenates partitions of one kind from the store.
+
+    :param store_dir: Feature store directory
+    :type store_dir: str | os.PathLike
+    :param kind: One of :data:`PARTITION_KINDS`
+    :type kind: str
+    :param dates: Dates to load (ISO format), defaults to None for all dates
+    :type dates: Optional[list[str]], optional
+    :param collectors: Collectors to load, defaults to None for all collectors
+    :type collectors: Optional[list[str]], optional
+    :return: Long-form DataFrame of the selected partitions
+    :rtype: pd.DataFrame
+    """
+    paths = sorted(Path(store_dir, kind).glob("date=*/collector=*/part*.parquet"))
+    frames = []
+    for path in paths:
+        date = path.parent.parent.name.split("=", 1)[1]
+        collector = path.parent.name.split("=", 1)[1]
+        if dates is not None and date not in dates:
+            continue
+        if collectors is not None and collector not in collectors:
+            continue
+        frames.append(pd.read_parquet(path, memory_map=True))
+
+    if not frames:
+        return pd.DataFrame(columns=["timestamp", "device_idx"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def assemble_combined_table(
+    store_dir: str | os.PathLike, top_n_aps: int, dates: Optional[list[str]] = None
+) -> pd.DataFrame:
+    """Pivots and merges the partitions into the combined training table.
+
+    :param store_dir: Feature store directory
+    :type store_dir: str | os.PathLike
+    :param top_n_aps: Top :math:`N` WiFi APs to keep
+    :type top_n_aps: int
+    :param dates: Dates to assemble (ISO format), defaults to None for all dates
+    :type dates: Optional[list[str]], optional
+    :return: Combined DataFrame as returned by :func:`dataset.build_dataframe.merge_dfs`
+    :rtype: pd.DataFrame
+    """
+    wifi_df = get_top_N_wifi_aps_only(
+        load_partitions(store_dir, "wifi", dates), top_n_aps
+    )
+    bt_df = load_partitions(store_dir, "bt", dates)
+    bbox_df = load_partitions(store_dir, "bbox", dates)
+    population_count_df = pd.read_parquet(os.path.join(store_dir, POPULATION_FILENAME))
+
+    wifi_tabular, bt_tabular, bbox_tabular = pivot_tables(wifi_df, bt_df, bbox_df)
+    combined_tabular = merge_dfs(
+        wifi_tabular, bt_tabular, bbox_tabular, population_count_df
+    )
+
+    # Free-text columns are mixed with the zeros from :func:`merge_dfs`.
+    for col in combined_tabular.select_dtypes(include="object").columns:
+        combined_tabular[col] = combined_tabular[col].astype(str)
+    return combined_tabular.reset_index(drop=True)
+
+
+def build_feature_store(
+    raw_data_path: str | os.PathLike,
+    bbox_csv_path: str | os.PathLike,
+    pop_count_csv_path: str | os.PathLike,
+    store_dir: str | os.PathLike,
+    top_n_aps: int = 5,
+    collector_names: Optional[list[str]] = None,
+    bbox_cols: Optional[list[str]] = None,
+    pop_count_cols: Optional[list[str]] = None,
+) -> list[str]:
+    """Builds or refreshes the feature store from the raw data.
+
+    :param raw_data_path: Path to raw collected data
+    :type raw_data_path: str | os.PathLike
+    :param bbox_csv_path: Path to the bounding box inference results
+    :type bbox_csv_path: str | os.PathLike
+    :param pop_count_csv_path: Population count CSV path
+    :type pop_count_csv_path: str | os.PathLike
+    :param store_dir: Feature store directory
+    :type store_dir: str | os.PathLike
+    :param top_n_aps: Top :math:`N` WiFi APs to keep, defaults to 5
+    :type top_n_aps: int, optional
+    :param collector_names: Collector names in the raw data path, defaults to
+        None to read them from the collector manifest
+    :type collector_names: Optional[list[str]], optional
+    :param bbox_cols: Bounding Box DF desired column names, defaults to None
+    :type bbox_cols: Optional[list[str]], optional
+    :param pop_count_cols: Population count DF desired column names, defaults to None
+    :type pop_count_cols: Optional[list[str]], optional
+    :return: Names of the collectors whose partitions were rebuilt
+    :rtype: list[str]
+    """
+    collector_names = (
+        collector_names
+        if collector_names is not None
+        else get_collector_names(raw_data_path)
+    )
+    bbox_cols = bbox_cols if bbox_cols else ["timestamp", "device_idx", "bbox_count"]
+    pop_count_cols = (
+        pop_count_cols if pop_count_cols else ["timestamp", "count", "comment"]
+    )
+    os.makedirs(store_dir, exist_ok=True)
+
+    manifest = read_manifest(store_dir)
+    previous_shared = manifest["shared_inputs"] if manifest else {}
+    shared_inputs = {
+        "bbox": fingerprint_file(bbox_csv_path, previous_shared.get("bbox")),
+        "population": fingerprint_file(
+            pop_count_csv_path, previous_shared.get("population")
+        ),
+    }
+
+    full_rebuild = (
+        manifest is None
+        or manifest["version"] != STORE_VERSION
+        or manifest["shared_inputs"] != shared_inputs
+    )
+    reassemble = full_rebuild or manifest["top_n_aps"] != top_n_aps
+    if full_rebuild:
+        for kind in PARTITION_KINDS:
+            shutil.rmtree(os.path.join(store_dir, kind), ignore_errors=True)
+        manifest = StoreManifest(
+            version=STORE_VERSION,
+            top_n_aps=top_n_aps,
+            shared_inputs=shared_inputs,
+            shared_watermarks={
+                "bbox": get_eof_watermark(bbox_csv_path),
+                "population": get_eof_watermark(pop_count_csv_path),
+            },
+            collectors={},
+        )
+    assert manifest is not None
+
+    # Drop the partitions of collectors whose raw data is gone.
+    removed = [
+        collector
+        for collector in manifest["collectors"]
+        if collector not in collector_names
+        or not os.path.isdir(os.path.join(raw_data_path, collector))
+    ]
+    for collector in removed:
+        entry = manifest["collectors"].pop(collector)
+        _remove_collector_partitions(store_dir, collector, entry["dates"])
+
+    population_count_df = get_population_count_df(pop_count_csv_path, pop_count_cols)
+    bbox_df = None
+    rebuilt = []
+
+    for collector in collector_names:
+        collector_dir = os.path.join(raw_data_path, collector)
+        if not os.path.isdir(collector_dir):
+            continue
+
+        entry = manifest["collectors"].get(collector)
+        inputs = _get_collector_inputs(collector_dir, entry["inputs"] if entry else {})
+        if entry is not None and entry["inputs"] == inputs:
+            continue
+
+        if bbox_df is None:
+            bbox_df = get_bbox_df(bbox_csv_path, bbox_cols)
+        if entry is not None:
+            _remove_collector_partitions(store_dir, collector, entry["dates"])
+
+        dates = _build_collector_partitions(
+            store_dir,
+            collector_dir,
+            collector,
+            collector_names,
+            bbox_df,
+            population_count_df["timestamp"],
+        )
+        manifest["collectors"][collector] = CollectorEntry(
+            inputs=inputs,
+            dates=dates,
+            watermarks={
+                file: get_eof_watermark(os.path.join(collector_dir, file))
+                for file in inputs
+            },
+        )
+        rebuilt.append(collector)
+
+    combined_path = os.path.join(store_dir, COMBINED_FILENAME)
+    if reassemble or rebuilt or removed or not os.path.exists(combined_path):
+        write_table(population_count_df, os.path.join(store_dir, POPULATION_FILENAME))
+        write_table(assemble_combined_table(store_dir, top_n_aps), combined_path)
+
+    manifest["top_n_aps"] = top_n_aps
+    write_manifest(store_dir, manifest)
+    return rebuilt
+
+
+def load_feature_table(store_dir: str | os.PathLike) -> pd.DataFrame:
+    """Loads the combined training table from the store, memory-mapping the file.
+
+    :param store_dir: Feature store directory
+    :type store_dir: str | os.PathLike
+    :return: Combined DataFrame as returned by :func:`dataset.build_dataframe.merge_dfs`
+    :rtype: pd.DataFrame
+    """
+    return pd.read_parquet(os.path.join(store_dir, COMBINED_FILENAME), memory_map=True)
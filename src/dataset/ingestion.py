@@ -0,0 +1,430 @@
+"""Incrementally ingests newly collected raw data into the feature store from
+    :mod:`dataset.feature_store`, so that nightly updates only parse new lines.
+
+Every raw file has a :class:`dataset.feature_store.Watermark` in the store
+manifest. Only the complete lines after the watermark are parsed, aligned and
+appended to the partitions as new part files, after which the combined table is
+refreshed for the affected dates only. Lines of the most recent scan are held
+back until a newer scan is written (or ``flush`` is set), as the scan may still
+be in progress.
+
+Collectors and their device indices are discovered from the collector manifest,
+see :func:`dataset.build_dataframe.get_collector_names`. The following changes
+cannot be applied incrementally and fall back to
+:func:`dataset.feature_store.build_feature_store`:
+
+- A raw file was rewritten or truncated instead of appended to.
+- A new collector or raw file appeared.
+- Population counts were added at a time that may take over stored rows from
+  the counts they were aligned to, see :func:`realigns_stored_rows`.
+"""
+
+import argparse
+import io
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from dataset.build_dataframe import (
+    align_to_reference_timestamps,
+    convert_timestamps_to_datetime,
+    get_collector_names,
+    get_population_count_df,
+    parse_bluetooth_lines,
+)
+from dataset.feature_store import (
+    COMBINED_FILENAME,
+    LINE_TIMESTAMP_PATTERN,
+    PARTITION_KINDS,
+    POPULATION_FILENAME,
+    STORE_VERSION,
+    FileFingerprint,
+    StoreManifest,
+    Watermark,
+    assemble_combined_table,
+    build_feature_store,
+    get_eof_watermark,
+    get_tail_digest,
+    load_feature_table,
+    read_manifest,
+    write_manifest,
+    write_partitions,
+    write_table,
+)
+
+
+def is_append_only(path: str | os.PathLike, watermark: Watermark) -> bool:
+    """Checks that a file has only been appended to since the watermark.
+
+    :param path: Path to the file
+    :type path: str | os.PathLike
+    :param watermark: Watermark previously recorded for the file
+    :type watermark: Watermark
+    :return: Whether the bytes before the watermark are unchanged
+    :rtype: bool
+    """
+    return os.path.getsize(path) >= watermark["offset"] and (
+        get_tail_digest(path, watermark["offset"]) == watermark["tail_sha256"]
+    )
+
+
+def read_new_lines(
+    path: str | os.PathLike, watermark: Watermark, flush: bool = False
+) -> tuple[list[str], Watermark]:
+    """Reads the complete lines appended to a file after its watermark.
+
+    :param path: Path to the file
+    :type path: str | os.PathLike
+    :param watermark: Watermark previously recorded for the file
+    :type watermark: Watermark
+    :param flush: Also reads the lines of the most recent scan, defaults to False
+    :type flush: bool, optional
+    :return: New lines and the updated watermark
+    :rtype: tuple[list[str], Watermark]
+    """
+    with open(path, "rb") as f:
+        f.seek(watermark["offset"])
+        chunk = f.read()
+    lines = chunk[: chunk.rfind(b"\n") + 1].splitlines(keepends=True)
+
+    timestamps = []
+    for line in lines:
+        match = LINE_TIMESTAMP_PATTERN.match(line)
+        timestamps.append(match.group(1).decode() if match else None)
+
+    # Hold back the most recent scan as more of its lines may follow.
+    num_consumed = len(lines)
+    scanned = [timestamp for timestamp in timestamps if timestamp is not None]
+    if not flush and scanned:
+        num_consumed = timestamps.index(scanned[-1])
+
+    previous_timestamp = watermark["last_timestamp"]
+    last_timestamp = previous_timestamp
+    new_lines = []
+    for line, timestamp in zip(lines[:num_consumed], timestamps[:num_consumed]):
+        if timestamp is not None:
+            # Skip lines that were already ingested by a full build.
+            if previous_timestamp is not None and timestamp <= previous_timestamp:
+                continue
+            last_timestamp = (
+                timestamp if last_timestamp is None else max(last_timestamp, timestamp)
+            )
+        new_lines.append(line.decode("utf-8", errors="replace"))
+
+    offset = watermark["offset"] + sum(len(line) for line in lines[:num_consumed])
+    return new_lines, Watermark(
+        offset=offset,
+        last_timestamp=last_timestamp,
+        tail_sha256=get_tail_digest(path, offset),
+    )
+
+
+def get_latest_ingested_timestamp(manifest: StoreManifest) -> Optional[pd.Timestamp]:
+    """Gets the latest raw timestamp of the rows in the store, from the watermarks.
+
+    :param manifest: Store manifest
+    :type manifest: StoreManifest
+    :return: Latest raw timestamp, None if no raw line had a timestamp
+    :rtype: Optional[pd.Timestamp]
+    """
+    watermarks = [manifest["shared_watermarks"]["bbox"]] + [
+        watermark
+        for entry in manifest["collectors"].values()
+        for watermark in entry["watermarks"].values()
+    ]
+    # Raw timestamps have 12 (bounding boxes) or 14 digits.
+    timestamps = [
+        watermark["last_timestamp"].ljust(14, "0")
+        for watermark in watermarks
+        if watermark["last_timestamp"] is not None
+    ]
+    if not timestamps:
+        return None
+    return pd.to_datetime(max(timestamps), format="%Y%m%d%H%M%S")
+
+
+def realigns_stored_rows(
+    stored_timestamps: pd.Series,
+    new_timestamps: pd.Series,
+    latest_ingested: Optional[pd.Timestamp],
+) -> bool:
+    """Checks whether new population count timestamps may change the alignment
+    of the rows in the store.
+
+    Rows are aligned to their nearest population count timestamp, see
+    :func:`dataset.build_dataframe.align_to_reference_timestamps`. A new
+    timestamp takes over the raw timestamps after its midpoint with the
+    previous stored timestamp, so the stored rows are unchanged if that
+    midpoint is after the latest ingested raw timestamp. A new timestamp before
+    all the stored ones may take over any row.
+
+    :param stored_timestamps: Population count timestamps the rows were aligned to
+    :type stored_timestamps: pd.Series
+    :param new_timestamps: Population count timestamps not in the store
+    :type new_timestamps: pd.Series
+    :param latest_ingested: Latest raw timestamp in the store, see
+        :func:`get_latest_ingested_timestamp`
+    :type latest_ingested: Optional[pd.Timestamp]
+    :return: Whether the store has to be rebuilt
+    :rtype: bool
+    """
+    if new_timestamps.empty:
+        return False
+    if latest_ingested is None or stored_timestamps.empty:
+        return True
+
+    stored = np.sort(stored_timestamps.to_numpy())
+    for timestamp in new_timestamps.to_numpy():
+        i = np.searchsorted(stored, timestamp)
+        if i == 0 or stored[i - 1] + (timestamp - stored[i - 1]) / 2 <= latest_ingested:
+            return True
+    return False
+
+
+def _get_unhashed_fingerprint(path: str | os.PathLike) -> FileFingerprint:
+    stat = os.stat(path)
+    return FileFingerprint(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=None)
+
+
+def _parse_wifi_lines(
+    lines: list[str], device_idx: int, columns: Optional[list[str]] = None
+) -> pd.DataFrame:
+    columns = (
+        columns
+        if columns is not None
+        else ["timestamp", "bssid", "ssid", "signal_strength", "device_idx"]
+    )
+    df = pd.read_csv(io.StringIO("".join(lines)), header=None, names=columns)
+    df["device_idx"] = device_idx
+    df = convert_timestamps_to_datetime(df)
+    df["signal_strength"] = df["signal_strength"].apply(int)
+    return df
+
+
+def _has_all_partitions(store_dir: str | os.PathLike, date: str) -> bool:
+    return all(
+        any(Path(store_dir, kind, f"date={date}").glob("collector=*/part*.parquet"))
+        for kind in PARTITION_KINDS
+    )
+
+
+def _refresh_combined_table(
+    store_dir: str | os.PathLike, top_n_aps: int, dates: list[str]
+) -> None:
+    combined_path = os.path.join(store_dir, COMBINED_FILENAME)
+    combined = load_feature_table(store_dir)
+    if not all(_has_all_partitions(store_dir, date) for date in dates):
+        write_table(assemble_combined_table(store_dir, top_n_aps), combined_path)
+        return
+
+    refreshed = assemble_combined_table(store_dir, top_n_aps, dates)
+    if not set(refreshed.columns) <= set(combined.columns):
+        write_table(assemble_combined_table(store_dir, top_n_aps), combined_path)
+        return
+
+    # Devices without data on the refreshed dates are zero-filled by merge_dfs.
+    refreshed = refreshed.reindex(columns=combined.columns, fill_value=0)
+    for col in combined.select_dtypes(include="object").columns:
+        refreshed[col] = refreshed[col].astype(str)
+    unchanged = combined.loc[~combined["timestamp"].dt.strftime("%Y-%m-%d").isin(dates)]
+    combined = pd.concat([unchanged, refreshed], ignore_index=True)
+    write_table(combined.sort_values("timestamp", ignore_index=True), combined_path)
+
+
+def ingest_new_data(
+    raw_data_path: str | os.PathLike,
+    bbox_csv_path: str | os.PathLike,
+    pop_count_csv_path: str | os.PathLike,
+    store_dir: str | os.PathLike,
+    top_n_aps: int = 5,
+    flush: bool = False,
+    bbox_cols: Optional[list[str]] = None,
+    pop_count_cols: Optional[list[str]] = None,
+) -> list[str]:
+    """Appends the raw data collected since the last ingestion to the feature store.
+
+    :param raw_data_path: Path to raw collected data
+    :type raw_data_path: str | os.PathLike
+    :param bbox_csv_path: Path to the bounding box inference results
+    :type bbox_csv_path: str | os.PathLike
+    :param pop_count_csv_path: Population count CSV path
+    :type pop_count_csv_path: str | os.PathLike
+    :param store_dir: Feature store directory
+    :type store_dir: str | os.PathLike
+    :param top_n_aps: Top :math:`N` WiFi APs to keep, defaults to 5
+    :type top_n_aps: int, optional
+    :param flush: Also ingests the most recent scan of each file, defaults to False
+    :type flush: bool, optional
+    :param bbox_cols: Bounding Box DF desired column names, defaults to None
+    :type bbox_cols: Optional[list[str]], optional
+    :param pop_count_cols: Population count DF desired column names, defaults to None
+    :type pop_count_cols: Optional[list[str]], optional
+    :return: Dates (ISO format) whose partitions were appended to or rebuilt
+    :rtype: list[str]
+    """
+    bbox_cols = bbox_cols if bbox_cols else ["timestamp", "device_idx", "bbox_count"]
+    pop_count_cols = (
+        pop_count_cols if pop_count_cols else ["timestamp", "count", "comment"]
+    )
+    store_args = (raw_data_path, bbox_csv_path, pop_count_csv_path, store_dir)
+    manifest = read_manifest(store_dir)
+
+    def rebuild() -> list[str]:
+        build_feature_store(
+            *store_args,
+            top_n_aps=top_n_aps,
+            bbox_cols=bbox_cols,
+            pop_count_cols=pop_count_cols,
+        )
+        rebuilt_manifest = read_manifest(store_dir)
+        assert rebuilt_manifest is not None
+        return sorted(
+            {
+                date
+                for entry in rebuilt_manifest["collectors"].values()
+                for date in entry["dates"]
+            }
+        )
+
+    if (
+        manifest is None
+        or manifest["version"] != STORE_VERSION
+        or manifest["top_n_aps"] != top_n_aps
+    ):
+        return rebuild()
+
+    shared_paths = {"bbox": bbox_csv_path, "population": pop_count_csv_path}
+    if not all(
+        is_append_only(path, manifest["shared_watermarks"][key])
+        for key, path in shared_paths.items()
+    ):
+        return rebuild()
+
+    # New population counts must not change the alignment of stored rows.
+    population_count_df = get_population_count_df(pop_count_csv_path, pop_count_cols)
+    stored_population_df = pd.read_parquet(os.path.join(store_dir, POPULATION_FILENAME))
+    new_timestamps = population_count_df.loc[
+        ~population_count_df["timestamp"].isin(stored_population_df["timestamp"]),
+        "timestamp",
+    ]
+    if realigns_stored_rows(
+        stored_population_df["timestamp"],
+        new_timestamps,
+        get_latest_ingested_timestamp(manifest),
+    ):
+        return rebuild()
+    ref_timestamps = population_count_df["timestamp"]
+
+    bbox_lines, bbox_watermark = read_new_lines(
+        bbox_csv_path, manifest["shared_watermarks"]["bbox"], flush=True
+    )
+    bbox_df = (
+        pd.read_csv(io.StringIO("".join(bbox_lines)), header=None, names=bbox_cols)
+        if bbox_lines
+        else pd.DataFrame(columns=bbox_cols)
+    )
+    bbox_df = convert_timestamps_to_datetime(bbox_df, fmt="%Y%m%d%H%M")
+
+    collector_names = get_collector_names(raw_data_path)
+    needs_rebuild = False
+    touched_dates = set()
+    for device_idx, collector in enumerate(collector_names):
+        collector_dir = os.path.join(raw_data_path, collector)
+        if not os.path.isdir(collector_dir):
+            continue
+
+        entry = manifest["collectors"].get(collector)
+        files = [
+            file
+            for file in sorted(os.listdir(collector_dir))
+            if file.endswith((".csv", ".txt"))
+        ]
+        if entry is None or any(
+            file not in entry["watermarks"]
+            or not is_append_only(
+                os.path.join(collector_dir, file), entry["watermarks"][file]
+            )
+            for file in files
+        ):
+            needs_rebuild = True
+            continue
+
+        frames = {"wifi": [], "bt": []}
+        for file in files:
+            path = os.path.join(collector_dir, file)
+            lines, entry["watermarks"][file] = read_new_lines(
+                path, entry["watermarks"][file], flush
+            )
+            entry["inputs"][file] = _get_unhashed_fingerprint(path)
+            if not lines:
+                continue
+            if file.endswith(".csv"):
+                frames["wifi"].append(_parse_wifi_lines(lines, device_idx))
+            else:
+                bt_df = parse_bluetooth_lines(lines, device_idx)
+                frames["bt"].append(convert_timestamps_to_datetime(bt_df))
+
+        new_dfs = {
+            kind: align_to_reference_timestamps(
+                pd.concat(dfs, ignore_index=True), ref_timestamps
+            )
+            for kind, dfs in frames.items()
+            if dfs
+        }
+        collector_bbox_df = bbox_df.loc[bbox_df["device_idx"] == device_idx].copy()
+        if not collector_bbox_df.empty:
+            new_dfs["bbox"] = align_to_reference_timestamps(
+                collector_bbox_df, ref_timestamps
+            )
+
+        dates = set()
+        for kind, df in new_dfs.items():
+            dates |= write_partitions(store_dir, kind, collector, df, append=True)
+        entry["dates"] = sorted(set(entry["dates"]) | dates)
+        touched_dates |= dates
+
+    manifest["shared_watermarks"]["bbox"] = bbox_watermark
+    manifest["shared_watermarks"]["population"] = get_eof_watermark(pop_count_csv_path)
+    for key, path in shared_paths.items():
+        manifest["shared_inputs"][key] = _get_unhashed_fingerprint(path)
+    write_table(population_count_df, os.path.join(store_dir, POPULATION_FILENAME))
+    write_manifest(store_dir, manifest)
+
+    if needs_rebuild:
+        return sorted(touched_dates | set(rebuild()))
+    if touched_dates:
+        _refresh_combined_table(store_dir, top_n_aps, sorted(touched_dates))
+    return sorted(touched_dates)
+
+
+if __name__ == "__main__":
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+    args = argparse.ArgumentParser(
+        description="Append newly collected raw data to the feature store."
+    )
+    args.add_argument(
+        "--raw_data_path",
+        type=str,
+        default=os.path.join(project_root, "data", "raw_data"),
+    )
+    args.add_argument(
+        "--bbox_csv_path",
+        type=str,
+        default=os.path.join(project_root, "data", "bbox_results.csv"),
+    )
+    args.add_argument(
+        "--pop_count_csv_path",
+        type=str,
+        default=os.path.join(project_root, "data", "manual_counts.csv"),
+    )
+    args.add_argument(
+        "--store_dir",
+        type=str,
+        default=os.path.join(project_root, "data", "feature_store"),
+    )
+    args.add_argument("--top_n_aps", type=int, default=5)
+    args.add_argument("--flush", action="store_true")
+    print(f"Ingested dates: {ingest_new_data(**vars(args.parse_args()))}")
@@ -1,14 +1,54 @@
 """FastAPI server for crowd status API.
+
+The API also serves the dashboard in ``DASHBOARD_DIR`` from memory, compressed
+once at startup, see :mod:`util.static_assets`.
+
+The crowd status is served from an immutable snapshot, with its response body
+already encoded, that updates replace as a whole. The handlers are coroutines,
+so they run on the event loop without a threadpool hop and never see a
+partially updated status. With several workers (``API_WORKERS``), the status
+is shared through a :class:`util.status_store.SharedStatusStore`, and updates
+retry its write lock on the event loop without blocking it.
 """
 
 import datetime
-from typing import TypedDict
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, NamedTuple, Optional, TypedDict
 
-import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, RedirectResponse, Response
+from pydantic import BaseModel, ValidationError
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from deployment.config import UVICORN_HOST
+from deployment.config import (
+    API_PORT,
+    API_SHARED_STATE,
+    API_WORKERS,
+    DASHBOARD_DIR,
+    UVICORN_HOST,
+)
+from util.crowd_filter import CrowdForecast
+from util.metrics import CONTENT_TYPE, REGISTRY, Counter, Histogram
+from util.static_assets import (
+    StaticAsset,
+    choose_encoding,
+    etag_matches,
+    load_assets,
+)
+from util.status_store import SharedStatusStore
+from util.tracing import LatencyRecorder, mark_received, span
+
+
+#: Zone of the crowd status updates that do not name one.
+DEFAULT_ZONE = "default"
 
 
 class CrowdStatus(TypedDict):
@@ -16,13 +56,169 @@ class CrowdStatus(TypedDict):
 
     :param status: The crowd status
     :type status: float
+    :param one_sigma_conf_interval: One standard deviation of the crowd status
+        (if any)
+    :type one_sigma_conf_interval: float | None
     :param timestamp: The timestamp of the crowd status
     :type timestamp: datetime.datetime
+    :param contributing_devices: Number of devices with a recent reading (if
+        reported by the fog)
+    :type contributing_devices: int | None
+    :param stale_devices: IDs of the devices whose features were filled in (if
+        reported by the fog)
+    :type stale_devices: list[int] | None
+    :param smoothed_status: Crowd status smoothed over time by the fog (if any)
+    :type smoothed_status: float | None
+    :param smoothed_err: Standard deviation of the smoothed crowd status (if any)
+    :type smoothed_err: float | None
+    :param forecast: Forecasts of the crowd status by the fog (if any)
+    :type forecast: list[CrowdForecast] | None
     """
 
     status: float
     one_sigma_conf_interval: float | None
     timestamp: datetime.datetime
+    contributing_devices: int | None
+    stale_devices: list[int] | None
+    smoothed_status: float | None
+    smoothed_err: float | None
+    forecast: list[CrowdForecast] | None
+
+
+class CrowdStatusUpdate(BaseModel):
+    """Crowd status posted by the fog, validated on receipt.
+
+    :param status: The crowd status
+    :type status: float
+    :param timestamp: The timestamp of the crowd status, in ISO 8601 format
+    :type timestamp: datetime.datetime
+    :param err: One standard deviation of the crowd status, defaults to None
+    :type err: float | None, optional
+    :param contributing_devices: Number of devices with a recent reading,
+        defaults to None
+    :type contributing_devices: int | None, optional
+    :param stale_devices: IDs of the devices whose features were filled in,
+        defaults to None
+    :type stale_devices: list[int] | None, optional
+    :param smoothed_status: Crowd status smoothed over time, defaults to None
+    :type smoothed_status: float | None, optional
+    :param smoothed_err: Standard deviation of the smoothed crowd status,
+        defaults to None
+    :type smoothed_err: float | None, optional
+    :param forecast: Forecasts of the crowd status, see
+        :class:`util.crowd_filter.CrowdForecast`, defaults to None
+    :type forecast: list[dict[str, float]] | None, optional
+    :param trace: Trace of the reading, see util.tracing, defaults to None
+    :type trace: dict[str, Any] | None, optional
+    :param zone: Zone of the crowd status, defaults to DEFAULT_ZONE
+    :type zone: str, optional
+    """
+
+    status: float
+    timestamp: datetime.datetime
+    err: float | None = None
+    contributing_devices: int | None = None
+    stale_devices: list[int] | None = None
+    smoothed_status: float | None = None
+    smoothed_err: float | None = None
+    forecast: list[dict[str, float]] | None = None
+    trace: dict[str, Any] | None = None
+    zone: str = DEFAULT_ZONE
+
+
+class StatusSnapshot(NamedTuple):
+    """Crowd status of every zone served by the API, replaced as a whole on
+    updates.
+
+    :param version: Version of the statuses, see
+        :meth:`util.status_store.SharedStatusStore.version`
+    :type version: int
+    :param statuses: Crowd status of each zone, never modified
+    :type statuses: dict[str, CrowdStatus]
+    :param bodies: JSON response body of each zone's status
+    :type bodies: dict[str, bytes]
+    """
+
+    version: int
+    statuses: dict[str, CrowdStatus]
+    bodies: dict[str, bytes]
+
+    @property
+    def status(self) -> CrowdStatus:
+        """Crowd status of the default zone.
+
+        :return: The crowd status
+        :rtype: CrowdStatus
+        """
+        return self.statuses[DEFAULT_ZONE]
+
+
+#: Duration of the HTTP requests per route.
+request_duration = Histogram(
+    "crowd_api_request_duration_seconds",
+    "Duration of the HTTP requests in seconds.",
+    ("method", "route"),
+)
+
+#: HTTP requests per route and status code.
+requests_total = Counter(
+    "crowd_api_requests_total",
+    "HTTP requests handled.",
+    ("method", "route", "status"),
+)
+
+#: Media type of the batch updates, one JSON crowd status per line.
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+#: Crowd status updates received from the fog.
+status_updates = Counter(
+    "crowd_api_status_updates_total", "Crowd status updates received."
+)
+
+#: Durations of the stages of the traced readings, see util.tracing.
+stage_duration = Histogram(
+    "crowd_stage_duration_seconds",
+    "Duration of the stages of the traced readings in seconds.",
+    ("stage", "device"),
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the duration and status of each HTTP request.
+
+    Requests are labelled with the route's path template rather than the URL,
+    so that the number of series stays bounded.
+
+    :param app: The wrapped application
+    :type app: ASGIApp
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            request_duration.labels(scope["method"], path).observe(
+                time.perf_counter() - start
+            )
+            requests_total.labels(scope["method"], path, status_code).inc()
 
 
 app = FastAPI(
@@ -40,52 +236,326 @@ app.add_middleware(
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
-crowd_status = CrowdStatus(
+
+def make_snapshot(statuses: dict[str, CrowdStatus], version: int) -> StatusSnapshot:
+    """Encodes the crowd status of each zone for serving.
+
+    :param statuses: Crowd status of each zone, with the default zone
+    :type statuses: dict[str, CrowdStatus]
+    :param version: Version of the statuses
+    :type version: int
+    :return: Snapshot of the statuses, without the fields that are not set in
+        their bodies
+    :rtype: StatusSnapshot
+    """
+    bodies = {}
+    for zone, status in statuses.items():
+        served = {k: v for k, v in status.items() if v is not None}
+        bodies[zone] = json.dumps(
+            jsonable_encoder(served), separators=(",", ":")
+        ).encode()
+    return StatusSnapshot(version=version, statuses=statuses, bodies=bodies)
+
+
+#: Crowd status of a zone before its first update.
+EMPTY_STATUS = CrowdStatus(
     status=0.0,
     one_sigma_conf_interval=None,
     timestamp=datetime.datetime.fromtimestamp(0),
+    contributing_devices=None,
+    stale_devices=None,
+    smoothed_status=None,
+    smoothed_err=None,
+    forecast=None,
 )
 
+#: Latest crowd statuses, replaced by updates and never modified.
+snapshot = make_snapshot({DEFAULT_ZONE: EMPTY_STATUS}, 0)
+
+#: Status shared with the other API workers, None if this is the only one.
+shared_store: Optional[SharedStatusStore] = (
+    SharedStatusStore.attach(API_SHARED_STATE) if API_SHARED_STATE else None
+)
+
+#: Latencies of the traced readings, see util.tracing
+latency_recorder = LatencyRecorder()
+
+#: Files of the dashboard by their path, see util.static_assets.
+dashboard_assets: dict[str, StaticAsset] = load_assets(DASHBOARD_DIR)
+
+
+def get_snapshot() -> StatusSnapshot:
+    """Returns the latest crowd status, reading it from the shared store if
+    another worker updated it.
+
+    :return: Snapshot of the crowd status
+    :rtype: StatusSnapshot
+    """
+    # pylint: disable=global-statement
+    global snapshot
+
+    if shared_store is not None:
+        version = shared_store.version()
+        # Version 0 is an empty store, before the first update.
+        if version not in (0, snapshot.version):
+            try:
+                version, body = shared_store.read()
+            except TimeoutError:
+                # Keep serving the current status rather than block.
+                return snapshot
+            statuses = {}
+            for zone, status in json.loads(body).items():
+                status["timestamp"] = datetime.datetime.fromisoformat(
+                    status["timestamp"]
+                )
+                statuses[zone] = CrowdStatus(**status)
+            snapshot = make_snapshot(statuses, version)
+    return snapshot
+
 
 @app.post("/api/update_crowd_status")
-def update_crowd_status(status: dict) -> None:
+async def update_crowd_status(status: CrowdStatusUpdate) -> None:
     """Updates the crowd status.
 
-    :param status: The crowd status and timestamp
-    :type status: dict
+    :param status: The crowd status and timestamp, and optionally the trace of
+        the reading
+    :type status: CrowdStatusUpdate
     """
+    status_updates.inc()
+    trace = status.trace
+    if trace is None:
+        await _apply_updates([status])
+        return
 
-    crowd_level = float(status["status"])
-    timestamp = status["timestamp"]
-    try:
-        # Use ISO8601 format for timestamp: YYYY-MM-DD[T]HH:MM:SS
-        timestamp = datetime.datetime.fromisoformat(timestamp)
-    except TypeError as exc:
-        print(f"Error: {exc}")
-        timestamp = datetime.datetime.now()
-    except ValueError as exc:
-        print(f"Error: {exc}")
-        timestamp = datetime.datetime.now()
-    finally:
-        crowd_status["status"] = crowd_level
-        crowd_status["timestamp"] = timestamp
-
-    if "err" in status:
-        crowd_status["one_sigma_conf_interval"] = status["err"]
+    mark_received(trace, "fog_to_api")
+    with span(trace, "api_update"):
+        await _apply_updates([status])
+    latency_recorder.record(trace)
+    for trace_span in trace["spans"]:
+        stage_duration.labels(trace_span["stage"], trace.get("device_id", -1)).observe(
+            trace_span["duration"]
+        )
 
 
-@app.get("/api/get_crowd_status")
-def get_crowd_status() -> dict:
-    """Gets the current crowd status.
+@app.post("/api/update_crowd_status/batch")
+async def update_crowd_status_batch(request: Request) -> dict:
+    """Updates the crowd status with several readings at once, e.g. those a
+    fog node kept while the API was unreachable.
+
+    The body is NDJSON: one crowd status per line, as posted to
+    ``/api/update_crowd_status``. The readings are applied in order of their
+    timestamps, with a single update of the served status.
+
+    :param request: The request, with an NDJSON body
+    :type request: Request
+    :raises HTTPException: 422 with the line numbers and errors of the
+        invalid readings, none of which are then applied
+    :return: The number of readings applied
+    :rtype: dict
+    """
+    updates = []
+    errors = []
+    for line_no, line in enumerate((await request.body()).splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            updates.append(CrowdStatusUpdate.model_validate_json(line))
+        except ValidationError as exc:
+            errors.append(
+                {
+                    "line": line_no,
+                    "errors": exc.errors(include_url=False, include_context=False),
+                }
+            )
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+
+    if updates:
+        status_updates.inc(len(updates))
+        await _apply_updates(sorted(updates, key=lambda u: u.timestamp.timestamp()))
+    return {"applied": len(updates)}
+
+
+async def _apply_updates(updates: list[CrowdStatusUpdate]) -> None:
+    # pylint: disable=global-statement
+    global snapshot
+
+    if shared_store is None:
+        statuses = merge_crowd_statuses(snapshot.statuses, updates)
+        snapshot = make_snapshot(statuses, snapshot.version + 2)
+        return
+
+    async with shared_store.async_write_lock():
+        statuses = merge_crowd_statuses(get_snapshot().statuses, updates)
+        body = json.dumps(jsonable_encoder(statuses)).encode()
+        snapshot = make_snapshot(statuses, shared_store.write(body))
+
+
+def merge_crowd_statuses(
+    current: dict[str, CrowdStatus], updates: list[CrowdStatusUpdate]
+) -> dict[str, CrowdStatus]:
+    """Applies updates from the fog to the crowd status of their zones.
+
+    :param current: The current crowd status of each zone, not modified
+    :type current: dict[str, CrowdStatus]
+    :param updates: The updates, applied in order
+    :type updates: list[CrowdStatusUpdate]
+    :return: The new crowd status of each zone
+    :rtype: dict[str, CrowdStatus]
+    """
+    statuses = dict(current)
+    for update in updates:
+        statuses[update.zone] = merge_crowd_status(
+            statuses.get(update.zone, EMPTY_STATUS), update
+        )
+    return statuses
+
+
+def merge_crowd_status(current: CrowdStatus, update: CrowdStatusUpdate) -> CrowdStatus:
+    """Applies an update from the fog to a crowd status.
 
-    :return: The crowd status and timestamp
+    :param current: The current crowd status, not modified
+    :type current: CrowdStatus
+    :param update: The update, the fields it does not include are kept
+    :type update: CrowdStatusUpdate
+    :return: The new crowd status
     :rtype: CrowdStatus
     """
-    if crowd_status["one_sigma_conf_interval"] is not None:
-        return dict(crowd_status)
-    return {k: v for k, v in crowd_status.items() if k != "one_sigma_conf_interval"}
+    new_status = CrowdStatus(**current)
+    new_status["status"] = update.status
+    new_status["timestamp"] = update.timestamp
+
+    fields = update.model_fields_set
+    if "err" in fields:
+        new_status["one_sigma_conf_interval"] = update.err
+    if "contributing_devices" in fields:
+        new_status["contributing_devices"] = update.contributing_devices
+        new_status["stale_devices"] = update.stale_devices
+    if "smoothed_status" in fields:
+        new_status["smoothed_status"] = update.smoothed_status
+        new_status["smoothed_err"] = update.smoothed_err
+        new_status["forecast"] = update.forecast or None
+    return new_status
+
+
+@app.get("/api/get_crowd_status")
+async def get_crowd_status(zone: str = DEFAULT_ZONE) -> Response:
+    """Gets the current crowd status of a zone.
+
+    :param zone: Zone of the crowd status, defaults to DEFAULT_ZONE
+    :type zone: str, optional
+    :raises HTTPException: 404 if no status was posted for the zone
+    :return: The crowd status and timestamp, and the fields reported by the fog
+    :rtype: Response
+    """
+    body = get_snapshot().bodies.get(zone)
+    if body is None:
+        raise HTTPException(status_code=404, detail=f"Unknown zone: {zone}")
+    return Response(body, media_type="application/json")
+
+
+@app.get("/api/metrics/latency")
+async def get_latency_metrics(device_id: int | None = None) -> dict:
+    """Gets the latency percentiles of each stage of the traced readings.
+
+    :param device_id: Only include this device, defaults to None for all
+    :type device_id: int | None, optional
+    :return: Sample count, p50, p95 and p99 in seconds per stage and device
+    :rtype: dict
+    """
+    return latency_recorder.summary(device_id)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    """Gets the API's metrics in the Prometheus text exposition format.
+
+    :return: The metrics
+    :rtype: PlainTextResponse
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/")
+async def get_root() -> RedirectResponse:
+    """Redirects to the dashboard.
+
+    :return: Redirect to the dashboard
+    :rtype: RedirectResponse
+    """
+    return RedirectResponse("/dashboard/")
+
+
+@app.get("/dashboard/{path:path}")
+async def get_dashboard(request: Request, path: str) -> Response:
+    """Gets a file of the dashboard, compressed if the client accepts it.
+
+    :param request: The request, with its Accept-Encoding and If-None-Match
+        headers
+    :type request: Request
+    :param path: Path of the file in the dashboard, index.html if empty
+    :type path: str
+    :raises HTTPException: 404 if the dashboard has no such file
+    :return: The file, or a 304 without a body if the client's copy is current
+    :rtype: Response
+    """
+    asset = dashboard_assets.get(path or "index.html")
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    encoding = choose_encoding(asset, request.headers.get("accept-encoding", ""))
+    headers = {
+        "ETag": asset.etags[encoding],
+        "Cache-Control": asset.cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(asset.etags[encoding], request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(
+        asset.bodies[encoding], headers=headers, media_type=asset.media_type
+    )
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host=UVICORN_HOST, port=8000, log_level="info")
+    # Imported here so that importing the app (e.g. in tests) does not load it.
+    import uvicorn
+
+    if API_WORKERS == 1:
+        uvicorn.run(app, host=UVICORN_HOST, port=API_PORT, log_level="info")
+    else:
+        # The workers are started by the uvicorn command, so that they do not
+        # run this module as their main module, and attach to the store named
+        # in their environment. The listening socket is bound here with
+        # TCP_NODELAY, which its connections inherit, as uvicorn does not set
+        # it on the connections of a socket shared by several workers.
+        store = SharedStatusStore.create()
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.bind((UVICORN_HOST, API_PORT))
+            try:
+                server = subprocess.Popen(
+                    [
+                        sys.executable,
+                        "-m",
+                        "uvicorn",
+                        "deployment.api:app",
+                        "--fd",
+                        str(sock.fileno()),
+                        "--workers",
+                        str(API_WORKERS),
+                    ],
+                    env=dict(os.environ, API_SHARED_STATE=store.name),
+                    pass_fds=[sock.fileno()],
+                )
+                # Stops the workers on termination, so that the store is removed.
+                signal.signal(
+                    signal.SIGTERM, lambda signum, _: server.send_signal(signum)
+                )
+                server.wait()
+            finally:
+                store.close()
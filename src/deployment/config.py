@@ -48,6 +48,156 @@ TOP_N_APS = int(TOP_N_APS) if TOP_N_APS else 5
 UVICORN_HOST = os.getenv("UVICORN_HOST")
 UVICORN_HOST = UVICORN_HOST if UVICORN_HOST else "localhost"
 
+#: Port of the API server.
+API_PORT = os.getenv("API_PORT")
+API_PORT = int(API_PORT) if API_PORT else 8000
+
+#: Number of API server worker processes.
+API_WORKERS = os.getenv("API_WORKERS")
+API_WORKERS = int(API_WORKERS) if API_WORKERS else 1
+
+#: Shared memory block the API workers share the crowd status through, set by
+#: the API server when it starts several workers.
+API_SHARED_STATE = os.getenv("API_SHARED_STATE")
+API_SHARED_STATE = API_SHARED_STATE if API_SHARED_STATE else None
+
+#: Directory of the dashboard served by the API.
+DASHBOARD_DIR = os.getenv("DASHBOARD_DIR")
+DASHBOARD_DIR = (
+    DASHBOARD_DIR
+    if DASHBOARD_DIR
+    else os.path.join(os.path.dirname(os.path.abspath(__file__)), "app")
+)
+
+#: Base URL of the crowd status API that the fog posts to.
+CROWD_API_URL = os.getenv("CROWD_API_URL")
+CROWD_API_URL = CROWD_API_URL if CROWD_API_URL else "http://localhost:8000"
+
+#: Crowd statuses the fog keeps while the API is unreachable, posted in one
+#: batch once it is back (the oldest are dropped beyond this).
+FOG_PENDING_STATUSES = os.getenv("FOG_PENDING_STATUSES")
+FOG_PENDING_STATUSES = int(FOG_PENDING_STATUSES) if FOG_PENDING_STATUSES else 1000
+
+#: People detector backend, "yolo" (ultralytics) or "onnx" (OpenCV DNN).
+DETECTOR_BACKEND = os.getenv("DETECTOR_BACKEND")
+DETECTOR_BACKEND = DETECTOR_BACKEND if DETECTOR_BACKEND else "yolo"
+
+#: People detector weights, defaults to yolov8s.pt or yolov8s.onnx by backend.
+DETECTOR_MODEL = os.getenv("DETECTOR_MODEL")
+DETECTOR_MODEL = (
+    DETECTOR_MODEL
+    if DETECTOR_MODEL
+    else ("yolov8s.onnx" if DETECTOR_BACKEND == "onnx" else "yolov8s.pt")
+)
+
+#: People detector input size (must match the ONNX export).
+DETECTOR_IMGSZ = os.getenv("DETECTOR_IMGSZ")
+DETECTOR_IMGSZ = int(DETECTOR_IMGSZ) if DETECTOR_IMGSZ else 640
+
+#: JSON file of the per-device detection regions of interest (optional).
+DETECTOR_ROI_PATH = os.getenv("DETECTOR_ROI_PATH")
+DETECTOR_ROI_PATH = DETECTOR_ROI_PATH if DETECTOR_ROI_PATH else None
+
+#: Side of the overlapping detection tiles in pixels, 0 to disable tiling.
+DETECTOR_TILE_SIZE = os.getenv("DETECTOR_TILE_SIZE")
+DETECTOR_TILE_SIZE = int(DETECTOR_TILE_SIZE) if DETECTOR_TILE_SIZE else 0
+
+#: Fraction of a detection tile that overlaps its neighbours.
+DETECTOR_TILE_OVERLAP = os.getenv("DETECTOR_TILE_OVERLAP")
+DETECTOR_TILE_OVERLAP = float(DETECTOR_TILE_OVERLAP) if DETECTOR_TILE_OVERLAP else 0.2
+
+#: Edge people counting mode, "full" (detector every cycle) or "tiered".
+EDGE_COUNT_MODE = os.getenv("EDGE_COUNT_MODE")
+EDGE_COUNT_MODE = EDGE_COUNT_MODE if EDGE_COUNT_MODE else "full"
+
+#: Cycles between detector runs in the tiered counting mode.
+TIERED_YOLO_INTERVAL = os.getenv("TIERED_YOLO_INTERVAL")
+TIERED_YOLO_INTERVAL = int(TIERED_YOLO_INTERVAL) if TIERED_YOLO_INTERVAL else 5
+
+#: Relative foreground change that triggers a detector run in the tiered mode.
+TIERED_SHIFT_THRESHOLD = os.getenv("TIERED_SHIFT_THRESHOLD")
+TIERED_SHIFT_THRESHOLD = (
+    float(TIERED_SHIFT_THRESHOLD) if TIERED_SHIFT_THRESHOLD else 0.5
+)
+
+#: Number of detector processes reading frames from shared memory, 0 to
+#: detect in the capturing or receiving process.
+DETECTION_WORKERS = os.getenv("DETECTION_WORKERS")
+DETECTION_WORKERS = int(DETECTION_WORKERS) if DETECTION_WORKERS else 0
+
+#: Maximum size of a frame handed to the detector processes in bytes.
+FRAME_SLOT_BYTES = os.getenv("FRAME_SLOT_BYTES")
+FRAME_SLOT_BYTES = int(FRAME_SLOT_BYTES) if FRAME_SLOT_BYTES else 1920 * 1080 * 3
+
+#: Threads decoding and counting the images returned to the fog, 0 to handle
+#: messages in the MQTT thread.
+FOG_DECODE_THREADS = os.getenv("FOG_DECODE_THREADS")
+FOG_DECODE_THREADS = int(FOG_DECODE_THREADS) if FOG_DECODE_THREADS else 0
+
+#: People counts cached by image hash on the fog, 0 to disable the cache.
+DETECTION_CACHE_SIZE = os.getenv("DETECTION_CACHE_SIZE")
+DETECTION_CACHE_SIZE = int(DETECTION_CACHE_SIZE) if DETECTION_CACHE_SIZE else 256
+
+#: Maximum Hamming distance (of 256 bits) between the hashes of images that
+#: share a cached people count.
+DETECTION_CACHE_DISTANCE = os.getenv("DETECTION_CACHE_DISTANCE")
+DETECTION_CACHE_DISTANCE = (
+    int(DETECTION_CACHE_DISTANCE) if DETECTION_CACHE_DISTANCE else 4
+)
+
+#: Seconds without a reading after which the fog treats a device as stale.
+DEVICE_TTL = os.getenv("DEVICE_TTL")
+DEVICE_TTL = float(DEVICE_TTL) if DEVICE_TTL else 3.0 * PUBLISHER_INTERVAL
+
+#: How the fog fills in the features of stale devices: "decay" (the last
+#: reading, halving its distance to the training mean every DEVICE_TTL),
+#: "mean" (the training mean) or "exclude" (zeros, like missing readings in
+#: training). Devices that never reported get the training mean, or zeros
+#: with "exclude". None if unset, for "decay" with zeros for the devices that
+#: never reported.
+STALE_DEVICE_POLICY = os.getenv("STALE_DEVICE_POLICY")
+STALE_DEVICE_POLICY = STALE_DEVICE_POLICY if STALE_DEVICE_POLICY else None
+
+#: Variance the smoothed crowd level drifts by per second, in people^2/s.
+SMOOTHING_LEVEL_NOISE = os.getenv("SMOOTHING_LEVEL_NOISE")
+SMOOTHING_LEVEL_NOISE = float(SMOOTHING_LEVEL_NOISE) if SMOOTHING_LEVEL_NOISE else 1.0
+
+#: Variance the smoothed crowd trend drifts by per second, in (people/s)^2/s.
+SMOOTHING_TREND_NOISE = os.getenv("SMOOTHING_TREND_NOISE")
+SMOOTHING_TREND_NOISE = float(SMOOTHING_TREND_NOISE) if SMOOTHING_TREND_NOISE else 1e-4
+
+#: Minutes ahead to forecast the crowd status, "0" to disable forecasts.
+FORECAST_HORIZONS = os.getenv("FORECAST_HORIZONS")
+FORECAST_HORIZONS = (
+    tuple(int(m) for m in FORECAST_HORIZONS.split(",") if int(m) > 0)
+    if FORECAST_HORIZONS
+    else (15, 30)
+)
+
+#: Number of partitions the devices are split into between fog workers, each
+#: worker handling the readings of the devices with ``device_id % FOG_PARTITIONS``
+#: equal to its FOG_PARTITION.
+FOG_PARTITIONS = os.getenv("FOG_PARTITIONS")
+FOG_PARTITIONS = int(FOG_PARTITIONS) if FOG_PARTITIONS else 1
+
+#: Partition of the devices handled by this fog worker.
+FOG_PARTITION = os.getenv("FOG_PARTITION")
+FOG_PARTITION = int(FOG_PARTITION) if FOG_PARTITION else 0
+
+#: Group of the replicas of each fog partition (optional): one replica of a
+#: partition handles its readings and the others take over when it fails.
+FOG_SHARE_GROUP = os.getenv("FOG_SHARE_GROUP")
+FOG_SHARE_GROUP = FOG_SHARE_GROUP if FOG_SHARE_GROUP else None
+
+#: Seconds a standby fog replica waits before taking over a partition.
+FOG_FAILOVER_DELAY = os.getenv("FOG_FAILOVER_DELAY")
+FOG_FAILOVER_DELAY = float(FOG_FAILOVER_DELAY) if FOG_FAILOVER_DELAY else 2.0
+
+#: Port of the fog's Prometheus metrics endpoint (plus the worker's
+#: FOG_PARTITION), 0 to disable it.
+FOG_METRICS_PORT = os.getenv("FOG_METRICS_PORT")
+FOG_METRICS_PORT = int(FOG_METRICS_PORT) if FOG_METRICS_PORT else 8001
+
 if __name__ == "__main__":
     print(
         f"DEVICE_IDX: {DEVICE_IDX}, {type(DEVICE_IDX)}",
@@ -1,24 +1,57 @@
 """Edge publisher module for the edge device.
 """
 
+import functools
+import itertools
 import json
 import os
 import time
+import uuid
+from collections import defaultdict
 
 import paho.mqtt.client as mqtt
 
 from deployment.config import (
     BROKER_IP,
     DEVICE_IDX,
+    EDGE_COUNT_MODE,
     PUBLISHER_INTERVAL,
+    TIERED_SHIFT_THRESHOLD,
+    TIERED_YOLO_INTERVAL,
     TOPIC,
     USE_DEMO_DATA,
 )
 from util.capture_image import encode_image, take_picture
-from util.people_detection import detect
+from util.frame_ring import capture_frame_people, count_frame_people
+from util.tiered_counting import TieredPeopleCounter
+from util.tracing import mark_sent, new_trace, span
 from util.wifi_bt_processing import get_and_parse_data
 
 
+#: Session id of this publisher, so that the fog can tell a restart from a
+#: redelivery, see util.dedup.
+SESSION = uuid.uuid4().hex
+
+#: Sequence numbers of the messages of each device in this session.
+sequence_numbers: defaultdict[int, itertools.count] = defaultdict(itertools.count)
+
+
+@functools.lru_cache(maxsize=None)
+def get_tiered_counter(device_id: int) -> TieredPeopleCounter:
+    """Returns the tiered people counter of a device, kept across cycles.
+
+    :param device_id: Device ID
+    :type device_id: int
+    :return: Tiered people counter
+    :rtype: TieredPeopleCounter
+    """
+    return TieredPeopleCounter(
+        functools.partial(count_frame_people, device_id=device_id),
+        yolo_interval=TIERED_YOLO_INTERVAL,
+        shift_threshold=TIERED_SHIFT_THRESHOLD,
+    )
+
+
 def retrieve_data(device_id: int = DEVICE_IDX, return_image: bool = False) -> str:
     """Retrieves data from the camera, wifi and bluetooth devices.
 
@@ -26,48 +59,71 @@ def retrieve_data(device_id: int = DEVICE_IDX, return_image: bool = False) -> st
     :type device_id: int, optional
     :param return_image: Whether to return the image or not, defaults to False
     :type return_image: bool, optional
-    :return: JSON string containing the image, timestamp, wifi signal strength, bluetooth output and device ID
+    :return: JSON string containing the image, timestamp, wifi signal strength, bluetooth output, device ID and sequence number
     :rtype: str
     """
 
-    # Get the wifi signal strength
-    wifi_strength, bt_output = get_and_parse_data(
-        USE_DEMO_DATA,
-        device_id,
-        koufu_csv_path=os.path.join(
-            os.path.dirname(os.path.abspath(__file__)), "demo/koufu.csv"
-        ),
-        total_devices=4,
-        top_n=5,
+    seq = next(sequence_numbers[device_id])
+    trace = new_trace(device_id)
+
+    # Camera frames that are only counted are captured straight into the
+    # detector processes' ring buffer, see util.frame_ring.
+    capture_into_ring = (
+        not USE_DEMO_DATA and not return_image and EDGE_COUNT_MODE != "tiered"
     )
 
-    if USE_DEMO_DATA:
-        image = take_picture(
-            None,
+    # Get the wifi signal strength
+    with span(trace, "acquisition"):
+        wifi_strength, bt_output = get_and_parse_data(
             USE_DEMO_DATA,
-            filename=os.path.join(
-                os.path.dirname(os.path.abspath(__file__)),
-                f"demo/image_{device_id}.jpg",
+            device_id,
+            koufu_csv_path=os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "demo/koufu.csv"
             ),
+            total_devices=4,
+            top_n=5,
         )
-    else:
-        # Capture an image from the camera
-        image = take_picture()
 
-    if return_image:
-        image_inference = encode_image(image)
+        if USE_DEMO_DATA:
+            image = take_picture(
+                None,
+                USE_DEMO_DATA,
+                filename=os.path.join(
+                    os.path.dirname(os.path.abspath(__file__)),
+                    f"demo/image_{device_id}.jpg",
+                ),
+            )
+        elif not capture_into_ring:
+            # Capture an image from the camera
+            image = take_picture()
+
+    if capture_into_ring:
+        # The capture is part of the detection span.
+        with span(trace, "detection"):
+            _, image_inference = capture_frame_people(
+                lambda out: take_picture(out=out), device_id=device_id
+            )
+    elif return_image:
+        with span(trace, "encoding"):
+            image_inference = encode_image(image)
     else:
-        preds = detect(image)
-        image_inference = len(preds)
+        with span(trace, "detection"):
+            if EDGE_COUNT_MODE == "tiered":
+                image_inference = get_tiered_counter(device_id).count(image)
+            else:
+                image_inference = count_frame_people(image, device_id=device_id)
 
     return json.dumps(
         {
             "image": image_inference,
-            "timestamp": time.time(),
+            "timestamp": trace["created_at"],
             "wifi_strength": wifi_strength,
             "bt_output": bt_output,
             "device_id": device_id,
+            "session": SESSION,
+            "seq": seq,
             "return_image": return_image,
+            "trace": mark_sent(trace),
         }
     )
 
@@ -76,12 +132,14 @@ def main():
     """Main function for publishing data to the MQTT broker."""
     device_id = DEVICE_IDX
 
-    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "Publisher")  # type: ignore
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, f"edge-{device_id}")  # type: ignore
     client.connect(BROKER_IP, 1883)
 
+    # Each device publishes to its own subtopic so that the fog workers can
+    # partition the devices between them, see deployment.fog_subscriber.
     while True:
         data = retrieve_data(device_id)
-        client.publish(TOPIC, data)
+        client.publish(f"{TOPIC}/{device_id}", data)
         time.sleep(PUBLISHER_INTERVAL)
 
 
@@ -1,26 +1,72 @@
-import base64
+import argparse
+import binascii
 import datetime
+import functools
 import json
 import os
 import pickle
 import math
-from collections import OrderedDict
+import multiprocessing
+import socket
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, TypedDict
+from typing import TYPE_CHECKING, Any, Optional, TypedDict
 
-import cv2
 import numpy as np
 import paho.mqtt.client as mqtt
 import requests
 
-from deployment.config import BROKER_IP, TOP_N_APS, TOPIC, TOTAL_DEVICES
-from util.people_detection import detect
+from deployment.config import (
+    BROKER_IP,
+    CROWD_API_URL,
+    DETECTION_CACHE_DISTANCE,
+    DETECTION_CACHE_SIZE,
+    DETECTOR_IMGSZ,
+    DETECTOR_TILE_SIZE,
+    FOG_DECODE_THREADS,
+    FOG_FAILOVER_DELAY,
+    FOG_METRICS_PORT,
+    FOG_PARTITION,
+    FOG_PARTITIONS,
+    FOG_PENDING_STATUSES,
+    FOG_SHARE_GROUP,
+    DEVICE_TTL,
+    FORECAST_HORIZONS,
+    SMOOTHING_LEVEL_NOISE,
+    SMOOTHING_TREND_NOISE,
+    STALE_DEVICE_POLICY,
+    TOP_N_APS,
+    TOPIC,
+    TOTAL_DEVICES,
+)
+from util.crowd_filter import CrowdFilter
+from util.dedup import SequenceWindow
+from util.detection_cache import DetectionCache, perceptual_hash
+from util.frame_ring import count_frame_people
+from util.gpr_predictor import PREDICTOR_FILENAME, load_gpr_predictor
+from util.metrics import Counter, Gauge, Histogram, start_metrics_server
+from util.model_artifact import (
+    MANIFEST_FILENAME,
+    check_artifact_version,
+    check_feature_layout,
+    load_model_artifact,
+    read_artifact_manifest,
+)
+from util.partition_lease import PartitionLease
+from util.tracing import Span, mark_received, mark_sent, new_trace, span
 from util.wifi_bt_processing import (
     get_bbox_counts_column_index,
     get_bt_column_index,
     get_wifi_column_indices,
 )
 
+if TYPE_CHECKING:
+    import cv2
+
 
 class DataFromEdge(TypedDict):
     """Data received from the edge devices.
@@ -35,13 +81,17 @@ class DataFromEdge(TypedDict):
     :type wifi_data: list[int]
     :param bt_data: Bluetooth output data
     :type bt_data: int
+    :param last_seen: Monotonic time the data was received, None if it never
+        goes stale
+    :type last_seen: float | None
     """
 
     device_id: int
     return_image: bool
-    image: cv2.typing.MatLike | int
+    image: "cv2.typing.MatLike | int"
     wifi_data: list[int]
     bt_data: int
+    last_seen: float | None
 
 
 class CrowdStatus(TypedDict):
@@ -75,93 +125,494 @@ stored_data = CrowdStatus(
     numpy_data=base_numpy_data,
 )
 
+#: Ways to fill in the features of stale devices, see STALE_DEVICE_POLICY.
+STALE_DEVICE_POLICIES = ("decay", "mean", "exclude")
+
+#: Client id of this fog worker, unique across processes and machines.
+WORKER_ID = f"fog-{socket.gethostname()}-{os.getpid()}"
+
+#: Topic the fog workers share the latest reading of each device on.
+STATE_TOPIC = f"{TOPIC}/state"
+
+#: Client publishing the device state to the other fog workers, None if this
+#: is the only worker.
+state_client: Optional[mqtt.Client] = None
+
+#: Lease deciding which replica of this worker's partition handles its
+#: readings, None without a FOG_SHARE_GROUP.
+partition_lease: Optional[PartitionLease] = None
+
+#: Guards stored_data when messages are handled concurrently.
+stored_data_lock = threading.Lock()
+
+#: Smooths and forecasts the crowd status, guarded by stored_data_lock.
+crowd_filter = CrowdFilter(SMOOTHING_LEVEL_NOISE, SMOOTHING_TREND_NOISE)
+
+#: Crowd statuses not yet posted as the API was unreachable, oldest first.
+pending_statuses: deque[dict[str, Any]] = deque(maxlen=FOG_PENDING_STATUSES)
+
+#: Guards pending_statuses.
+pending_statuses_lock = threading.Lock()
+
+#: Sequence numbers of the messages processed per device.
+sequence_window = SequenceWindow()
+
+#: People counts of recently returned images, None if disabled.
+detection_cache = (
+    DetectionCache(DETECTION_CACHE_SIZE, DETECTION_CACHE_DISTANCE)
+    if DETECTION_CACHE_SIZE > 0
+    else None
+)
+
+#: Thread pool handling messages, None to handle them in the MQTT thread.
+message_executor = (
+    ThreadPoolExecutor(FOG_DECODE_THREADS, thread_name_prefix="fog-message")
+    if FOG_DECODE_THREADS > 0
+    else None
+)
+
+#: Messages received per device.
+messages_received = Counter(
+    "fog_messages_received_total", "Messages received from the edge.", ("device",)
+)
+
+#: Messages dropped as redelivered or older than the device's last message.
+messages_dropped = Counter(
+    "fog_messages_dropped_total",
+    "Redelivered or outdated messages dropped before processing.",
+    ("device",),
+)
+
+#: Messages waiting for or being handled by the thread pool.
+queue_depth = Gauge("fog_queue_depth", "Messages waiting or being handled.")
+
+#: Duration of decoding and counting the people in a returned image.
+detection_duration = Histogram(
+    "fog_detection_duration_seconds",
+    "Duration of decoding and detection of returned images in seconds.",
+    ("device",),
+)
+
+#: Detection cache lookups per device and result ("hit" or "miss").
+detection_cache_lookups = Counter(
+    "fog_detection_cache_lookups_total",
+    "People count cache lookups of returned images.",
+    ("device", "result"),
+)
+
+#: Fraction of the detection cache lookups that were hits.
+detection_cache_hit_rate = Gauge(
+    "fog_detection_cache_hit_ratio", "Fraction of the people count cache hits."
+)
+detection_cache_hit_rate.set_function(
+    lambda: detection_cache.hit_rate if detection_cache is not None else 0.0
+)
+
+#: Duration of the crowd model inference, including loading the model.
+inference_duration = Histogram(
+    "fog_inference_duration_seconds", "Duration of the model inference in seconds."
+)
+
+#: Times a crowd model was loaded from disk.
+model_loads = Counter("fog_model_loads_total", "Crowd models loaded from disk.")
+
+#: Devices without a reading within DEVICE_TTL at the last inference.
+stale_devices_gauge = Gauge(
+    "fog_stale_devices", "Devices without a recent reading at the last inference."
+)
+
+
+def get_decode_min_side() -> Optional[int]:
+    """Returns the smallest long side images can be decoded to without
+    detection losing resolution.
+
+    :return: The detector input size, None to decode at full resolution when
+        tiling (which detects at the image's own resolution)
+    :rtype: Optional[int]
+    """
+    return None if DETECTOR_TILE_SIZE > 0 else DETECTOR_IMGSZ
+
 
-def decode_img(payload: str) -> cv2.typing.MatLike:
+def decode_img(
+    payload: str, min_long_side: Optional[int] = None
+) -> "cv2.typing.MatLike":
     """Decodes an image from a base64 string.
 
+    JPEG images are decoded straight to a reduced scale (by 2, 4 or 8) if their
+    long side stays at least ``min_long_side``, which is faster and smaller than
+    decoding at full resolution and then resizing.
+
     :param payload: Base64 encoded image
     :type payload: str
+    :param min_long_side: Minimum long side of the decoded image, defaults to
+        None for full resolution
+    :type min_long_side: Optional[int], optional
     :return: Decoded image
     :rtype: cv2.typing.MatLike
     """
+    # Imported here so that the fog starts without OpenCV unless images are
+    # returned to it.
+    # pylint: disable=import-outside-toplevel
+    import cv2
 
-    binary_data = base64.b64decode(payload)
+    from util.capture_image import get_decode_flag
+
+    # Decodes the string as is, without an ASCII copy as base64.b64decode makes.
+    binary_data = binascii.a2b_base64(payload)
     np_data = np.frombuffer(binary_data, np.uint8)
-    decoded_img = cv2.imdecode(np_data, cv2.IMREAD_COLOR)
+    decoded_img = cv2.imdecode(np_data, get_decode_flag(binary_data, min_long_side))
 
     return decoded_img
 
 
-def on_message(client: mqtt.Client, userdata: Any, message: mqtt.MQTTMessage):
-    """Handles the message received from the edge devices.
+def count_people_cached(image: "cv2.typing.MatLike", device_id: int) -> int:
+    """Counts the people in an image, reusing the count of a nearly identical
+    image from the same device if cached, see :mod:`util.detection_cache`.
 
-    :param client: Client instance for this callback, unused.
-    :type client: mqtt.Client
-    :param userdata: User data of any type, unused.
-    :type userdata: Any
-    :param message: The message received from the edge devices.
-    :type message: mqtt.MQTTMessage
+    :param image: Decoded image
+    :type image: cv2.typing.MatLike
+    :param device_id: Device that captured the image
+    :type device_id: int
+    :return: Number of people
+    :rtype: int
+    """
+    if detection_cache is None:
+        return count_frame_people(image, device_id=device_id)
+
+    image_hash = perceptual_hash(image)
+    count = detection_cache.get(device_id, image_hash)
+    if count is not None:
+        detection_cache_lookups.labels(device_id, "hit").inc()
+        return count
+
+    detection_cache_lookups.labels(device_id, "miss").inc()
+    count = count_frame_people(image, device_id=device_id)
+    detection_cache.put(device_id, image_hash, count)
+    return count
+
+
+def handle_message(payload: bytes, received_at: Optional[float] = None) -> None:
+    """Counts the people in a message's image (if any), updates the stored data
+    and posts the new crowd status.
+
+    Messages already processed or older than the last processed message of
+    their device are dropped first, and their reading is not stored if a newer
+    message of the device finished first, see :mod:`util.dedup`.
+
+    :param payload: Message payload from an edge device
+    :type payload: bytes
+    :param received_at: Wall clock time the message was received, defaults to
+        None for now
+    :type received_at: Optional[float], optional
     """
-    received_data = json.loads(message.payload)
+    received_data = json.loads(payload)
     device_id = received_data["device_id"]
+    messages_received.labels(device_id).inc()
+    if not sequence_window.accept(
+        device_id, received_data.get("session"), received_data.get("seq")
+    ):
+        messages_dropped.labels(device_id).inc()
+        print(f"Dropped outdated data from device: {device_id}")
+        return
 
     print(f"Received data from device: {device_id}")
 
+    # Continue the edge's trace, see util.tracing
+    trace = received_data.get("trace") or new_trace(device_id)
+    mark_received(trace, "transport", received_at)
+    if received_at is not None:
+        trace["spans"].append(
+            Span(
+                stage="fog_queue",
+                start=received_at,
+                duration=max(0.0, time.time() - received_at),
+            )
+        )
+
     client_data_typed = DataFromEdge(
         device_id=device_id,
         return_image=received_data["return_image"],
         image=received_data["image"],
         wifi_data=received_data["wifi_strength"],
         bt_data=received_data["bt_output"],
+        last_seen=time.monotonic(),
     )
 
-    # Perform inference on the image if it is returned.
+    # Perform inference on the image if it is returned. This runs concurrently
+    # for messages from different devices, as OpenCV releases the GIL.
     if client_data_typed["return_image"] and isinstance(
         client_data_typed["image"], str
     ):
-        image = decode_img(client_data_typed["image"])
-        bbox_counts = len(detect(image))
+        with span(trace, "fog_detection"), detection_duration.labels(device_id).time():
+            image = decode_img(client_data_typed["image"], get_decode_min_side())
+            bbox_counts = count_people_cached(image, device_id)
         client_data_typed["image"] = bbox_counts
 
-    stored_data["data"][device_id] = client_data_typed
-
-    current_crowd_status = model_inference()
-    if isinstance(current_crowd_status, tuple):
-        current_crowd_status, err = current_crowd_status
-        stored_data["err"] = err
-
-    stored_data["status"] = current_crowd_status
-
-    requests.post(
-        "http://localhost:8000/api/update_crowd_status",
-        json={
+    with stored_data_lock, span(trace, "inference"), inference_duration.time():
+        # A newer message of the device may have finished first.
+        if not sequence_window.commit(
+            device_id, received_data.get("session"), received_data.get("seq")
+        ):
+            messages_dropped.labels(device_id).inc()
+            print(f"Dropped outdated data from device: {device_id}")
+            return
+        stored_data["data"][device_id] = client_data_typed
+
+        current_crowd_status = model_inference()
+        if isinstance(current_crowd_status, tuple):
+            current_crowd_status, err = current_crowd_status
+            stored_data["err"] = err
+
+        stored_data["status"] = current_crowd_status
+        predicted_at = time.time()
+        smoothed_status, smoothed_err = crowd_filter.update(
+            current_crowd_status, stored_data["err"], predicted_at
+        )
+        stale_devices = get_stale_devices()
+        stale_devices_gauge.set(len(stale_devices))
+        status = {
             "status": stored_data["status"],
             "err": stored_data["err"],
             "timestamp": datetime.datetime.now(datetime.UTC).isoformat(),
-        },
-        timeout=5.0,
-    )
+            "contributing_devices": TOTAL_DEVICES - len(stale_devices),
+            "stale_devices": stale_devices,
+            "smoothed_status": smoothed_status,
+            "smoothed_err": smoothed_err,
+            "forecast": crowd_filter.forecasts(FORECAST_HORIZONS),
+        }
+
+    if state_client is not None:
+        publish_device_state(state_client, client_data_typed, status, predicted_at)
+
+    status["trace"] = mark_sent(trace)
+    post_status(status)
+
+
+def post_status(status: dict[str, Any]) -> None:
+    """Posts a crowd status to the API. Statuses that could not be posted
+    because the API was unreachable are kept, and posted with the next one in
+    a single batch request.
+
+    :param status: The crowd status, with the trace of its reading
+    :type status: dict[str, Any]
+    """
+    # Statuses are kept without their trace, as the delay would skew the
+    # latencies.
+    untraced = {k: v for k, v in status.items() if k != "trace"}
+    with pending_statuses_lock:
+        batch = list(pending_statuses)
+        pending_statuses.clear()
+
+    try:
+        if not batch:
+            requests.post(
+                f"{CROWD_API_URL}/api/update_crowd_status", json=status, timeout=5.0
+            )
+        else:
+            batch.append(untraced)
+            requests.post(
+                f"{CROWD_API_URL}/api/update_crowd_status/batch",
+                data="\n".join(json.dumps(s) for s in batch),
+                headers={"Content-Type": "application/x-ndjson"},
+                timeout=5.0,
+            )
+    except (requests.ConnectionError, requests.Timeout) as exc:
+        print(f"Error: {exc}")
+        # The API sorts a batch by timestamp, so the order does not matter.
+        with pending_statuses_lock:
+            pending_statuses.extend(batch or [untraced])
+        return
     print("data sent")
 
 
+def publish_device_state(
+    client: mqtt.Client,
+    data: DataFromEdge,
+    status: dict[str, Any],
+    predicted_at: float,
+) -> None:
+    """Shares a device's latest reading and the resulting prediction with the
+    other fog workers, retained for workers that start later.
+
+    :param client: Client of this worker
+    :type client: mqtt.Client
+    :param data: Reading of the device, with its people count
+    :type data: DataFromEdge
+    :param status: Crowd status posted for the reading
+    :type status: dict[str, Any]
+    :param predicted_at: Wall clock time of the prediction
+    :type predicted_at: float
+    """
+    age = 0.0 if data["last_seen"] is None else time.monotonic() - data["last_seen"]
+    client.publish(
+        f"{STATE_TOPIC}/{data['device_id']}",
+        json.dumps(
+            {
+                "worker": WORKER_ID,
+                "device_id": data["device_id"],
+                "image": data["image"],
+                "wifi_data": data["wifi_data"],
+                "bt_data": data["bt_data"],
+                "seen_at": time.time() - age,
+                "status": status["status"],
+                "err": status["err"],
+                "predicted_at": predicted_at,
+            }
+        ),
+        qos=1,
+        retain=True,
+    )
+
+
+def handle_device_state(payload: bytes) -> None:
+    """Stores a device's reading shared by another fog worker and adds its
+    prediction to the crowd filter, without inference.
+
+    :param payload: Message payload from :func:`publish_device_state`
+    :type payload: bytes
+    """
+    state = json.loads(payload)
+    if state["worker"] == WORKER_ID:
+        return
+
+    device_id = state["device_id"]
+    data = DataFromEdge(
+        device_id=device_id,
+        return_image=False,
+        image=state["image"],
+        wifi_data=state["wifi_data"],
+        bt_data=state["bt_data"],
+        last_seen=time.monotonic() - max(0.0, time.time() - state["seen_at"]),
+    )
+    with stored_data_lock:
+        current = stored_data["data"].get(device_id)
+        if current is None or (current.get("last_seen") or 0.0) <= data["last_seen"]:
+            stored_data["data"][device_id] = data
+        crowd_filter.update(state["status"], state["err"], state["predicted_at"])
+
+
+def _report_error(future: Future) -> None:
+    queue_depth.dec()
+    if future.exception() is not None:
+        traceback.print_exception(future.exception())
+
+
+def on_message(client: mqtt.Client, userdata: Any, message: mqtt.MQTTMessage):
+    """Handles the message received from the edge devices.
+
+    With FOG_DECODE_THREADS set, messages are handled in a thread pool so that
+    images returned by several devices at once are decoded concurrently.
+
+    :param client: Client instance for this callback, unused.
+    :type client: mqtt.Client
+    :param userdata: User data of any type, unused.
+    :type userdata: Any
+    :param message: The message received from the edge devices.
+    :type message: mqtt.MQTTMessage
+    """
+    received_at = time.time()
+    if message.topic.startswith(f"{STATE_TOPIC}/"):
+        handle_device_state(message.payload)
+        return
+    if partition_lease is not None and message.topic == partition_lease.topic:
+        partition_lease.on_lease(message.payload)
+        return
+
+    if message_executor is None:
+        handle_message(message.payload, received_at)
+    else:
+        queue_depth.inc()
+        message_executor.submit(
+            handle_message, message.payload, received_at
+        ).add_done_callback(_report_error)
+
+
+@functools.lru_cache(maxsize=4)
+def _load_artifact(
+    artifact_dir: str, mtimes_ns: tuple[int, int]
+) -> tuple[Any, Optional[np.ndarray]]:
+    # The file mtimes are part of the cache key, so a newly saved artifact is
+    # picked up without restarting the fog. The exported NumPy predictor is
+    # preferred over the pickled model, see util.gpr_predictor.
+    model_loads.inc()
+    manifest = read_artifact_manifest(artifact_dir)
+    predictor_path = os.path.join(artifact_dir, PREDICTOR_FILENAME)
+    if os.path.exists(predictor_path):
+        check_artifact_version(manifest)
+        model = load_gpr_predictor(predictor_path)
+    else:
+        model, manifest = load_model_artifact(artifact_dir)
+    check_feature_layout(
+        manifest,
+        top_n_aps=TOP_N_APS,
+        total_devices=TOTAL_DEVICES,
+        n_features=base_numpy_data.shape[1],
+    )
+    feature_means = manifest.get("feature_means")
+    return model, None if feature_means is None else np.asarray(feature_means)
+
+
+def _load_model_and_means(
+    models_dir: str | Path, model_name: str
+) -> tuple[Any, Optional[np.ndarray]]:
+    model_path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), models_dir, model_name
+    )
+    manifest_path = os.path.join(model_path, MANIFEST_FILENAME)
+    if os.path.exists(manifest_path):
+        predictor_path = os.path.join(model_path, PREDICTOR_FILENAME)
+        mtimes_ns = (
+            os.stat(manifest_path).st_mtime_ns,
+            (
+                os.stat(predictor_path).st_mtime_ns
+                if os.path.exists(predictor_path)
+                else 0
+            ),
+        )
+        return _load_artifact(model_path, mtimes_ns)
+
+    model = _load_pickle(f"{model_path}.pkl", os.stat(f"{model_path}.pkl").st_mtime_ns)
+    return model, None
+
+
+def load_model(models_dir: str | Path = "models", model_name: str = "gpr") -> Any:
+    """Loads a crowd model, see :mod:`util.model_artifact`.
+
+    Falls back to a legacy ``<model_name>.pkl`` pickle if there is no artifact.
+
+    :param models_dir: Models directory, relative to this file, defaults to "models"
+    :type models_dir: str | Path, optional
+    :param model_name: Model name, defaults to "gpr"
+    :type model_name: str, optional
+    :raises ValueError: If the model feature layout does not match the fog's
+    :return: The model
+    :rtype: Any
+    """
+    return _load_model_and_means(models_dir, model_name)[0]
+
+
+@functools.lru_cache(maxsize=4)
+def _load_pickle(path: str, mtime_ns: int) -> Any:
+    model_loads.inc()
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
 def model_inference(
     crowd_status: CrowdStatus = stored_data,
     models_dir: str | Path = "models",
     model_name: str = "gpr",
 ) -> int | tuple[int, float]:
-    # Get the numpy data from the stored data
-    prod_data = parse_data_into_numpy(crowd_status)
+    # Load the model and the training feature means, which stale devices are
+    # filled in with (legacy models without them fall back to zeros)
+    model, feature_means = _load_model_and_means(models_dir, model_name)
 
-    # Load the model
-    with open(
-        os.path.join(
-            os.path.dirname(os.path.abspath(__file__)), models_dir, f"{model_name}.pkl"
-        ),
-        "rb",
-    ) as f:
-        model = pickle.load(f)
+    # Get the numpy data from the stored data
+    prod_data = parse_data_into_numpy(crowd_status, feature_means)
 
-    # Perform inference
+    # Perform inference, every backend from train_and_score.make_crowd_model
+    # is saved as gpr and supports return_std.
+    std = None
     if model_name == "gpr":
         pred, std = model.predict(prod_data, return_std=True)
         std = std[0]
@@ -173,37 +624,325 @@ def model_inference(
     return pred if std is None else (pred, std)
 
 
-def parse_data_into_numpy(crowd_status: CrowdStatus = stored_data) -> np.ndarray:
-    data = OrderedDict(crowd_status["data"])
-    for device_id, data_from_device in data.items():
-        wifi_col_idx = get_wifi_column_indices(
-            device_id, top_n=TOP_N_APS, column_offset=0
-        )
-        bt_col_idx = get_bt_column_index(
-            device_id, total_devices=TOTAL_DEVICES, top_n=TOP_N_APS, column_offset=0
-        )
-        bbox_col_idx = get_bbox_counts_column_index(
-            device_id, total_devices=TOTAL_DEVICES, top_n=TOP_N_APS, column_offset=0
+@functools.lru_cache(maxsize=None)
+def get_device_columns(device_id: int) -> np.ndarray:
+    """Returns the feature columns of a device: its WiFi APs, Bluetooth count
+    and bounding box count, in that order.
+
+    :param device_id: Device ID
+    :type device_id: int
+    :return: Column indices
+    :rtype: np.ndarray
+    """
+    return np.array(
+        [
+            *get_wifi_column_indices(device_id, top_n=TOP_N_APS, column_offset=0),
+            get_bt_column_index(
+                device_id, total_devices=TOTAL_DEVICES, top_n=TOP_N_APS, column_offset=0
+            ),
+            get_bbox_counts_column_index(
+                device_id, total_devices=TOTAL_DEVICES, top_n=TOP_N_APS, column_offset=0
+            ),
+        ]
+    )
+
+
+def get_device_age(
+    crowd_status: CrowdStatus, device_id: int, now: Optional[float] = None
+) -> float:
+    """Returns the seconds since the last reading of a device.
+
+    :param crowd_status: Crowd status with the data of each device
+    :type crowd_status: CrowdStatus
+    :param device_id: Device ID
+    :type device_id: int
+    :param now: Monotonic time, defaults to None for now
+    :type now: Optional[float], optional
+    :return: Age of the last reading, 0 if it never goes stale and infinity if
+        the device never reported
+    :rtype: float
+    """
+    data = crowd_status["data"].get(device_id)
+    if data is None:
+        return math.inf
+    last_seen = data.get("last_seen")
+    if last_seen is None:
+        return 0.0
+    return (time.monotonic() if now is None else now) - last_seen
+
+
+def get_stale_devices(
+    crowd_status: CrowdStatus = stored_data, now: Optional[float] = None
+) -> list[int]:
+    """Returns the devices without a reading within DEVICE_TTL.
+
+    :param crowd_status: Crowd status, defaults to stored_data
+    :type crowd_status: CrowdStatus, optional
+    :param now: Monotonic time, defaults to None for now
+    :type now: Optional[float], optional
+    :return: IDs of the stale devices, including those that never reported
+    :rtype: list[int]
+    """
+    now = time.monotonic() if now is None else now
+    return [
+        device_id
+        for device_id in range(TOTAL_DEVICES)
+        if get_device_age(crowd_status, device_id, now) > DEVICE_TTL
+    ]
+
+
+def parse_data_into_numpy(
+    crowd_status: CrowdStatus = stored_data,
+    feature_means: Optional[np.ndarray] = None,
+    now: Optional[float] = None,
+    policy: Optional[str] = STALE_DEVICE_POLICY,
+) -> np.ndarray:
+    """Fills in the model features with the latest data of each device.
+
+    The features of devices without a reading within DEVICE_TTL are filled in
+    according to the policy: "decay" moves the last reading towards the
+    training mean, halving the distance every DEVICE_TTL, "mean" uses the
+    training mean and "exclude" uses zeros, like missing readings in training.
+    Devices that never reported get the mean (zeros for "exclude"). Without a
+    policy, stale devices decay and devices that never reported get zeros.
+
+    :param crowd_status: Crowd status, defaults to stored_data
+    :type crowd_status: CrowdStatus, optional
+    :param feature_means: Training mean of each feature, defaults to None for
+        zeros
+    :type feature_means: Optional[np.ndarray], optional
+    :param now: Monotonic time, defaults to None for now
+    :type now: Optional[float], optional
+    :param policy: Policy for stale devices, or None for the default, defaults
+        to STALE_DEVICE_POLICY
+    :type policy: Optional[str], optional
+    :raises ValueError: If the policy is not one of STALE_DEVICE_POLICIES
+    :return: The features, crowd_status["numpy_data"] updated in place
+    :rtype: np.ndarray
+    """
+    if policy is not None and policy not in STALE_DEVICE_POLICIES:
+        raise ValueError(
+            f"Unknown stale device policy {policy!r}, "
+            f"expected one of {STALE_DEVICE_POLICIES}."
         )
-        stored_data["numpy_data"][0, wifi_col_idx] = data_from_device["wifi_data"]
-        stored_data["numpy_data"][0, bt_col_idx] = data_from_device["bt_data"]
-        stored_data["numpy_data"][0, bbox_col_idx] = data_from_device["image"]
+    now = time.monotonic() if now is None else now
+    numpy_data = crowd_status["numpy_data"]
+    if feature_means is None:
+        feature_means = np.zeros(numpy_data.shape[1])
+
+    for device_id in range(TOTAL_DEVICES):
+        columns = get_device_columns(device_id)
+        data = crowd_status["data"].get(device_id)
+        if data is not None:
+            numpy_data[0, columns] = [
+                *data["wifi_data"],
+                data["bt_data"],
+                data["image"],
+            ]
+
+        age = get_device_age(crowd_status, device_id, now)
+        if age <= DEVICE_TTL:
+            continue
+        means = feature_means[columns]
+        if policy == "exclude" or (policy is None and math.isinf(age)):
+            numpy_data[0, columns] = 0
+        elif policy == "mean" or math.isinf(age):
+            numpy_data[0, columns] = means
+        else:
+            weight = 0.5 ** ((age - DEVICE_TTL) / DEVICE_TTL)
+            numpy_data[0, columns] = means + weight * (numpy_data[0, columns] - means)
+
+    return numpy_data
+
+
+def get_subscriptions(
+    partition: int = FOG_PARTITION,
+    partitions: int = FOG_PARTITIONS,
+    share_group: Optional[str] = FOG_SHARE_GROUP,
+) -> list[str]:
+    """Returns the topic filters of a fog worker.
+
+    A single partition subscribes to the readings of every device, also on
+    TOPIC itself for edge publishers that do not publish to their own subtopic.
+    Otherwise each worker subscribes to the subtopics of its devices, so that
+    a device's readings are always handled by the same partition. Workers that
+    do not see every reading, or that stand by for a partition, also subscribe
+    to the device state shared by the others, see :func:`publish_device_state`.
+
+    With a share group, only one replica of a partition subscribes to its
+    readings at a time, see :mod:`util.partition_lease`. MQTT v5 shared
+    subscriptions are not used, as they would spread a device's readings over
+    the replicas and split its per-device state.
+
+    :param partition: Partition of this worker, defaults to FOG_PARTITION
+    :type partition: int, optional
+    :param partitions: Number of partitions, defaults to FOG_PARTITIONS
+    :type partitions: int, optional
+    :param share_group: Group of the replicas of each partition, defaults to
+        FOG_SHARE_GROUP
+    :type share_group: Optional[str], optional
+    :raises ValueError: If the partition is not below the number of partitions
+    :return: Topic filters
+    :rtype: list[str]
+    """
+    if not 0 <= partition < partitions:
+        raise ValueError(f"Partition {partition} is not in [0, {partitions}).")
+
+    if partitions == 1:
+        topics = [TOPIC, f"{TOPIC}/+"]
+    else:
+        topics = [
+            f"{TOPIC}/{device_id}"
+            for device_id in range(TOTAL_DEVICES)
+            if device_id % partitions == partition
+        ]
+    if partitions == 1 and share_group is None:
+        return topics
+    return topics + [f"{STATE_TOPIC}/+"]
+
+
+def get_lease_topic(partition: int, share_group: str) -> str:
+    """Returns the lease topic of a partition, see :mod:`util.partition_lease`.
+
+    :param partition: Partition
+    :type partition: int
+    :param share_group: Group of the replicas of the partition
+    :type share_group: str
+    :return: Lease topic
+    :rtype: str
+    """
+    return f"{TOPIC}/lease/{share_group}/{partition}"
 
-    return stored_data["numpy_data"]
 
+def on_connect(
+    client: mqtt.Client,
+    userdata: list[str],
+    flags: Any,
+    reason_code: Any,
+    properties: Any,
+) -> None:
+    """Subscribes to the worker's topics on every (re)connection.
 
-def main():
+    :param client: Client instance for this callback
+    :type client: mqtt.Client
+    :param userdata: Topic filters from :func:`get_subscriptions`, of which
+        the readings only while holding the partition lease (if any)
+    :type userdata: list[str]
+    :param flags: Connection flags, unused.
+    :type flags: Any
+    :param reason_code: Connection result, unused.
+    :type reason_code: Any
+    :param properties: MQTT v5 properties, unused.
+    :type properties: Any
+    """
+    topics = userdata
+    if partition_lease is not None:
+        # The readings are subscribed to while holding the lease.
+        topics = [t for t in userdata if t not in partition_lease.device_topics]
+        topics.append(partition_lease.topic)
+    client.subscribe(
+        [
+            (
+                topic,
+                mqtt.SubscribeOptions(qos=1, noLocal=topic.startswith(STATE_TOPIC)),
+            )
+            for topic in topics
+        ]
+    )
+    if partition_lease is not None:
+        partition_lease.reset()
+
+
+def main(
+    partition: int = FOG_PARTITION,
+    partitions: int = FOG_PARTITIONS,
+    share_group: Optional[str] = FOG_SHARE_GROUP,
+    workers: int = 1,
+):
     """
     The fog device will keep a copy of the data received from each
     edge device
+
+    :param partition: Partition of the devices handled by this worker,
+        defaults to FOG_PARTITION
+    :type partition: int, optional
+    :param partitions: Number of partitions, defaults to FOG_PARTITIONS
+    :type partitions: int, optional
+    :param share_group: Group of the replicas of each partition, defaults to
+        FOG_SHARE_GROUP
+    :type share_group: Optional[str], optional
+    :param workers: Number of worker processes started on this machine, one
+        per partition, defaults to 1 for this process only
+    :type workers: int, optional
     """
-    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "Subscriber")  # type: ignore
+    # pylint: disable=global-statement
+    global state_client, partition_lease
+
+    if workers > 1:
+        context = multiprocessing.get_context("spawn")
+        processes = [
+            context.Process(target=main, args=(i, workers, share_group))
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return
+
+    if STALE_DEVICE_POLICY not in (None, *STALE_DEVICE_POLICIES):
+        raise ValueError(
+            f"STALE_DEVICE_POLICY must be one of {STALE_DEVICE_POLICIES}, "
+            f"got {STALE_DEVICE_POLICY!r}."
+        )
+    subscriptions = get_subscriptions(partition, partitions, share_group)
+    if FOG_METRICS_PORT > 0:
+        start_metrics_server(FOG_METRICS_PORT + partition)
+
+    client = mqtt.Client(
+        mqtt.CallbackAPIVersion.VERSION2,  # type: ignore
+        WORKER_ID,
+        protocol=mqtt.MQTTv5,
+    )
+    client.on_connect = on_connect
     client.on_message = on_message
-    client.user_data_set(stored_data)
+    client.user_data_set(subscriptions)
+    if partitions > 1 or share_group is not None:
+        state_client = client
+    if share_group is not None:
+        lease_topic = get_lease_topic(partition, share_group)
+        partition_lease = PartitionLease(
+            client,
+            lease_topic,
+            [t for t in subscriptions if not t.startswith(STATE_TOPIC)],
+            WORKER_ID,
+            FOG_FAILOVER_DELAY,
+        )
+        # Clears the lease if this worker disconnects without notice.
+        client.will_set(lease_topic, b"", qos=1, retain=True)
     client.connect(BROKER_IP, 1883)
-    client.subscribe(TOPIC)
-    client.loop_forever()
+    try:
+        client.loop_forever()
+    finally:
+        if partition_lease is not None:
+            # Hands the partition over to a standby replica at once.
+            client.loop_start()
+            released = partition_lease.release()
+            if released is not None:
+                released.wait_for_publish(5.0)
+            client.disconnect()
+            client.loop_stop()
 
 
 if __name__ == "__main__":
-    main()
+    args = argparse.ArgumentParser(description="Run a fog worker.")
+    args.add_argument("--partition", type=int, default=FOG_PARTITION)
+    args.add_argument("--partitions", type=int, default=FOG_PARTITIONS)
+    args.add_argument("--share_group", type=str, default=FOG_SHARE_GROUP)
+    args.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Start this many worker processes, one per partition",
+    )
+    main(**vars(args.parse_args()))
@@ -0,0 +1,354 @@
+"""Searches over crowd models, top :math:`N` WiFi APs and feature subsets, and
+    ranks the trials by score, fit time and inference latency.
+"""
+
+import argparse
+import itertools
+import os
+import time
+from pathlib import Path
+from typing import Optional, TypedDict
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import RegressorMixin, clone
+from sklearn.gaussian_process.kernels import (
+    RBF,
+    DotProduct,
+    Matern,
+    RationalQuadratic,
+    WhiteKernel,
+)
+from sklearn.model_selection import KFold
+
+from dataset.build_dataframe import get_top_N_wifi_aps_only, merge_dfs, pivot_tables
+from train_and_score import load_data, make_crowd_model
+
+#: Candidate models, keyed by name.
+MODELS: dict[str, RegressorMixin] = {
+    "gpr": make_crowd_model("gpr"),
+    "gpr-rbf": make_crowd_model("gpr", kernel=RBF() + WhiteKernel()),
+    "gpr-dot": make_crowd_model("gpr", kernel=DotProduct() + WhiteKernel()),
+    "gpr-matern": make_crowd_model(
+        "gpr", kernel=DotProduct() + Matern(nu=1.5) + WhiteKernel()
+    ),
+    "gpr-rq": make_crowd_model(
+        "gpr", kernel=DotProduct() + RationalQuadratic() + WhiteKernel()
+    ),
+    "nystroem": make_crowd_model("nystroem"),
+    "rff": make_crowd_model("rff"),
+}
+
+#: Column name prefix of the WiFi features, the only ones that depend on the
+#: top :math:`N` APs.
+WIFI_PREFIX = "('signal_strength'"
+
+#: Column name prefixes of each feature subset, from :func:`pivot_tables`.
+FEATURE_SUBSETS: dict[str, tuple[str, ...]] = {
+    "wifi": (WIFI_PREFIX,),
+    "bt": ("('bt_device_count'",),
+    "bbox": ("('bbox_count'",),
+    "combined": (WIFI_PREFIX, "('bt_device_count'", "('bbox_count'"),
+}
+
+
+class Trial(TypedDict):
+    """A point in the search space and its results so far.
+
+    :param model: Key in :data:`MODELS`
+    :type model: str
+    :param top_n_aps: Top :math:`N` WiFi APs, None for feature subsets without
+        WiFi
+    :type top_n_aps: int | None
+    :param features: Key in :data:`FEATURE_SUBSETS`
+    :type features: str
+    :param scores: Test score of each evaluated fold
+    :type scores: list[float]
+    :param fit_times: Fit wall time of each evaluated fold in seconds
+    :type fit_times: list[float]
+    :param latencies: Median single-row predict latency of each evaluated fold
+        in seconds
+    :type latencies: list[float]
+    :param pruned: Whether the trial was stopped early
+    :type pruned: bool
+    """
+
+    model: str
+    top_n_aps: int | None
+    features: str
+    scores: list[float]
+    fit_times: list[float]
+    latencies: list[float]
+    pruned: bool
+
+
+def get_combined_tabulars(
+    wifi_df: pd.DataFrame,
+    bt_df: pd.DataFrame,
+    bbox_df: pd.DataFrame,
+    population_count_df: pd.DataFrame,
+    top_n_aps_values: list[int],
+) -> dict[int, pd.DataFrame]:
+    """Builds the combined table for every top :math:`N` value.
+
+    The top :math:`N` APs are only computed once for the largest :math:`N`, as
+    the smaller values are its rows with ``rank <= N``.
+
+    :param wifi_df: Aligned WiFi DataFrame
+    :type wifi_df: pd.DataFrame
+    :param bt_df: Aligned Bluetooth DataFrame
+    :type bt_df: pd.DataFrame
+    :param bbox_df: Aligned bounding box DataFrame
+    :type bbox_df: pd.DataFrame
+    :param population_count_df: Population count DataFrame
+    :type population_count_df: pd.DataFrame
+    :param top_n_aps_values: Top :math:`N` values
+    :type top_n_aps_values: list[int]
+    :return: Combined DataFrames keyed by top :math:`N`
+    :rtype: dict[int, pd.DataFrame]
+    """
+    top_wifi_df = get_top_N_wifi_aps_only(wifi_df, max(top_n_aps_values))
+    combined_tabulars = {}
+    for top_n_aps in top_n_aps_values:
+        wifi_tabular, bt_tabular, bbox_tabular = pivot_tables(
+            top_wifi_df.loc[top_wifi_df["rank"] <= top_n_aps], bt_df, bbox_df
+        )
+        combined_tabulars[top_n_aps] = merge_dfs(
+            wifi_tabular, bt_tabular, bbox_tabular, population_count_df
+        )
+    return combined_tabulars
+
+
+def select_features(combined_tabular: pd.DataFrame, features: str) -> np.ndarray:
+    """Selects the columns of a feature subset from the combined table.
+
+    :param combined_tabular: Combined DataFrame from :func:`merge_dfs`
+    :type combined_tabular: pd.DataFrame
+    :param features: Key in :data:`FEATURE_SUBSETS`
+    :type features: str
+    :return: Feature matrix
+    :rtype: np.ndarray
+    """
+    columns = [
+        col
+        for col in combined_tabular.columns
+        if col.startswith(FEATURE_SUBSETS[features])
+    ]
+    return combined_tabular[columns].to_numpy(dtype=float)
+
+
+def _evaluate_fold(
+    model: RegressorMixin,
+    X: np.ndarray,
+    y: np.ndarray,
+    train_index: np.ndarray,
+    test_index: np.ndarray,
+    latency_repeats: int,
+) -> tuple[float, float, float]:
+    model = clone(model)
+    start = time.perf_counter()
+    model.fit(X[train_index], y[train_index])  # type: ignore
+    fit_time = time.perf_counter() - start
+    score = model.score(X[test_index], y[test_index])  # type: ignore
+
+    # Single-row latency, as the fog predicts one reading at a time.
+    latencies = []
+    for i in range(latency_repeats):
+        row = X[test_index[i % len(test_index)]].reshape(1, -1)
+        start = time.perf_counter()
+        model.predict(row, return_std=True)  # type: ignore
+        latencies.append(time.perf_counter() - start)
+    return score, fit_time, float(np.median(latencies))
+
+
+def run_search(
+    combined_tabulars: dict[int, pd.DataFrame],
+    models: Optional[list[str]] = None,
+    feature_subsets: Optional[list[str]] = None,
+    n_splits: int = 3,
+    prune_margin: float = 0.5,
+    n_jobs: int = 1,
+    latency_repeats: int = 20,
+) -> pd.DataFrame:
+    """Evaluates every trial fold by fold and returns the leaderboard.
+
+    All surviving trials are evaluated on the same fold in parallel. After each
+    fold, trials whose mean score is more than ``prune_margin`` below the best
+    mean score are pruned and not evaluated on the remaining folds. Feature
+    subsets without WiFi are evaluated once per model, not once per top
+    :math:`N`, and have no top :math:`N` in the leaderboard.
+
+    :param combined_tabulars: Combined DataFrames keyed by top :math:`N`, from
+        :func:`get_combined_tabulars`
+    :type combined_tabulars: dict[int, pd.DataFrame]
+    :param models: Keys in :data:`MODELS`, defaults to None for all models
+    :type models: Optional[list[str]], optional
+    :param feature_subsets: Keys in :data:`FEATURE_SUBSETS`, defaults to None
+        for all subsets
+    :type feature_subsets: Optional[list[str]], optional
+    :param n_splits: Number of cross-validation folds, defaults to 3
+    :type n_splits: int, optional
+    :param prune_margin: Score margin below the best trial at which a trial is
+        pruned, defaults to 0.5
+    :type prune_margin: float, optional
+    :param n_jobs: Number of worker processes, -1 for all CPUs, defaults to 1
+    :type n_jobs: int, optional
+    :param latency_repeats: Single-row predictions timed per fold, defaults to 20
+    :type latency_repeats: int, optional
+    :return: Leaderboard sorted by mean score, then latency
+    :rtype: pd.DataFrame
+    """
+    models = models if models is not None else list(MODELS)
+    feature_subsets = (
+        feature_subsets if feature_subsets is not None else list(FEATURE_SUBSETS)
+    )
+    # Only the WiFi columns differ between the combined tables.
+    top_n_aps_values: dict[str, list[int | None]] = {
+        features: (
+            list(combined_tabulars)
+            if WIFI_PREFIX in FEATURE_SUBSETS[features]
+            else [None]
+        )
+        for features in feature_subsets
+    }
+    trials = [
+        Trial(
+            model=model,
+            top_n_aps=top_n_aps,
+            features=features,
+            scores=[],
+            fit_times=[],
+            latencies=[],
+            pruned=False,
+        )
+        for model, features in itertools.product(models, feature_subsets)
+        for top_n_aps in top_n_aps_values[features]
+    ]
+
+    # Every trial shares the folds of the (equal length) combined tables.
+    any_tabular = next(iter(combined_tabulars.values()))
+    folds = list(
+        KFold(n_splits, shuffle=True, random_state=42).split(range(len(any_tabular)))
+    )
+    data = {}
+    for features, values in top_n_aps_values.items():
+        for top_n_aps in values:
+            combined_tabular = (
+                combined_tabulars[top_n_aps] if top_n_aps is not None else any_tabular
+            )
+            data[(top_n_aps, features)] = (
+                select_features(combined_tabular, features),
+                combined_tabular["count"].to_numpy(dtype=float),
+            )
+
+    with joblib.Parallel(n_jobs=n_jobs) as parallel:
+        for train_index, test_index in folds:
+            alive = [trial for trial in trials if not trial["pruned"]]
+            results = parallel(
+                joblib.delayed(_evaluate_fold)(
+                    MODELS[trial["model"]],
+                    *data[(trial["top_n_aps"], trial["features"])],
+                    train_index,
+                    test_index,
+                    latency_repeats,
+                )
+                for trial in alive
+            )
+            for trial, (score, fit_time, latency) in zip(alive, results):  # type: ignore
+                trial["scores"].append(score)
+                trial["fit_times"].append(fit_time)
+                trial["latencies"].append(latency)
+
+            # Scores are undefined (NaN) for single-sample test folds.
+            means = np.array([np.mean(trial["scores"]) for trial in alive])
+            if np.isnan(means).all():
+                continue
+            best = np.nanmax(means)
+            for trial, mean in zip(alive, means):
+                trial["pruned"] = bool(mean < best - prune_margin)
+
+    leaderboard = pd.DataFrame(
+        [
+            {
+                "model": trial["model"],
+                "top_n_aps": trial["top_n_aps"],
+                "features": trial["features"],
+                "score": np.mean(trial["scores"]),
+                "folds": len(trial["scores"]),
+                "fit_time_s": np.mean(trial["fit_times"]),
+                "latency_ms": 1000 * np.mean(trial["latencies"]),
+                "pruned": trial["pruned"] and len(trial["scores"]) < n_splits,
+            }
+            for trial in trials
+        ]
+    )
+    leaderboard["top_n_aps"] = leaderboard["top_n_aps"].astype("Int64")
+    return leaderboard.sort_values(
+        ["score", "latency_ms"], ascending=[False, True], ignore_index=True
+    )
+
+
+def main(
+    top_n_aps: Optional[list[int]] = None,
+    models: Optional[list[str]] = None,
+    features: Optional[list[str]] = None,
+    n_splits: int = 3,
+    prune_margin: float = 0.5,
+    n_jobs: int = 1,
+    out_csv: Optional[str | os.PathLike | Path] = None,
+):
+    """Runs the search on the collected data and prints the leaderboard.
+
+    :param top_n_aps: Top :math:`N` values to search, defaults to None for 3, 5 and 8
+    :type top_n_aps: Optional[list[int]], optional
+    :param models: Keys in :data:`MODELS`, defaults to None for all models
+    :type models: Optional[list[str]], optional
+    :param features: Keys in :data:`FEATURE_SUBSETS`, defaults to None for all
+    :type features: Optional[list[str]], optional
+    :param n_splits: Number of cross-validation folds, defaults to 3
+    :type n_splits: int, optional
+    :param prune_margin: Score margin for pruning, defaults to 0.5
+    :type prune_margin: float, optional
+    :param n_jobs: Number of worker processes, defaults to 1
+    :type n_jobs: int, optional
+    :param out_csv: Path to save the leaderboard to, defaults to None
+    :type out_csv: Optional[str | os.PathLike | Path], optional
+    """
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    raw_data_path = os.path.join(project_root, "data", "raw_data")
+    bbox_csv_path = os.path.join(project_root, "data", "bbox_results.csv")
+    pop_count_csv_path = os.path.join(project_root, "data", "manual_counts.csv")
+
+    # Parsing and alignment do not depend on the trial, so they are done once.
+    combined_tabulars = get_combined_tabulars(
+        *load_data(raw_data_path, bbox_csv_path, pop_count_csv_path),
+        top_n_aps if top_n_aps else [3, 5, 8],
+    )
+    leaderboard = run_search(
+        combined_tabulars,
+        models=models,
+        feature_subsets=features,
+        n_splits=n_splits,
+        prune_margin=prune_margin,
+        n_jobs=n_jobs,
+    )
+    print(leaderboard.to_string())
+    if out_csv is not None:
+        leaderboard.to_csv(out_csv, index=False)
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(
+        description="Search over crowd models, top N WiFi APs and feature subsets."
+    )
+    args.add_argument("--top_n_aps", type=int, nargs="+", default=None)
+    args.add_argument("--models", type=str, nargs="+", default=None, choices=MODELS)
+    args.add_argument(
+        "--features", type=str, nargs="+", default=None, choices=FEATURE_SUBSETS
+    )
+    args.add_argument("--n_splits", type=int, default=3)
+    args.add_argument("--prune_margin", type=float, default=0.5)
+    args.add_argument("--n_jobs", type=int, default=1)
+    args.add_argument("--out_csv", type=str, default=None)
+    main(**vars(args.parse_args()))
@@ -0,0 +1,163 @@
+"""Runs tests for the batch crowd status updates of deployment/api.py and the
+    statuses kept by deployment/fog_subscriber.py while the API is unreachable.
+"""
+
+import json
+import unittest
+from typing import Any
+from unittest import mock
+
+import requests
+from fastapi.testclient import TestClient
+
+from deployment import api, fog_subscriber
+
+
+class TestApiBatchMethods(unittest.TestCase):
+    """Test case for API batch methods."""
+
+    def test_batch_update(self) -> None:
+        """Tests that a batch is applied in order of the timestamps."""
+        client = TestClient(api.app)
+        version = api.get_snapshot().version
+        lines = [
+            {"status": 31, "err": 2.0, "timestamp": "2024-04-05T12:02:00"},
+            {"status": 29, "err": 1.0, "timestamp": "2024-04-05T12:00:00"},
+            {"status": 30, "timestamp": "2024-04-05T12:01:00"},
+        ]
+        response = client.post(
+            "/api/update_crowd_status/batch",
+            content="\n".join(json.dumps(line) for line in lines) + "\n",
+            headers={"Content-Type": api.NDJSON_MEDIA_TYPE},
+        )
+        self.assertEqual(response.json(), {"applied": 3})
+        # The readings are applied with a single update of the snapshot.
+        self.assertEqual(api.get_snapshot().version, version + 2)
+
+        status = client.get("/api/get_crowd_status").json()
+        self.assertEqual(status["status"], 31.0)
+        self.assertEqual(status["one_sigma_conf_interval"], 2.0)
+        self.assertEqual(status["timestamp"], "2024-04-05T12:02:00")
+
+    def test_zones(self) -> None:
+        """Tests that the latest status is kept per zone, and that updates
+        without a zone go to the default zone.
+        """
+        client = TestClient(api.app)
+        lines = [
+            {"status": 12, "timestamp": "2024-04-05T12:05:00", "zone": "canteen"},
+            {"status": 3, "timestamp": "2024-04-05T12:05:00", "zone": "library"},
+            {"status": 13, "timestamp": "2024-04-05T12:06:00", "zone": "canteen"},
+            {"status": 32, "timestamp": "2024-04-05T12:06:00"},
+        ]
+        response = client.post(
+            "/api/update_crowd_status/batch",
+            content="\n".join(json.dumps(line) for line in lines),
+            headers={"Content-Type": api.NDJSON_MEDIA_TYPE},
+        )
+        self.assertEqual(response.json(), {"applied": 4})
+        client.post(
+            "/api/update_crowd_status",
+            json={"status": 4, "timestamp": "2024-04-05T12:07:00", "zone": "library"},
+        )
+
+        get = client.get
+        self.assertEqual(get("/api/get_crowd_status").json()["status"], 32.0)
+        self.assertEqual(
+            get("/api/get_crowd_status", params={"zone": api.DEFAULT_ZONE}).json(),
+            get("/api/get_crowd_status").json(),
+        )
+        canteen = get("/api/get_crowd_status", params={"zone": "canteen"}).json()
+        self.assertEqual(canteen["status"], 13.0)
+        self.assertEqual(canteen["timestamp"], "2024-04-05T12:06:00")
+        library = get("/api/get_crowd_status", params={"zone": "library"}).json()
+        self.assertEqual(library["status"], 4.0)
+
+        response = get("/api/get_crowd_status", params={"zone": "gym"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_batch(self) -> None:
+        """Tests that a batch with an invalid reading is rejected as a whole."""
+        client = TestClient(api.app)
+        before = api.get_snapshot()
+        body = "\n".join(
+            [
+                json.dumps({"status": 50, "timestamp": "2024-04-05T13:00:00"}),
+                json.dumps({"status": "many", "timestamp": "2024-04-05T13:01:00"}),
+                json.dumps({"status": 52, "timestamp": "soon"}),
+            ]
+        )
+        response = client.post(
+            "/api/update_crowd_status/batch",
+            content=body,
+            headers={"Content-Type": api.NDJSON_MEDIA_TYPE},
+        )
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual([error["line"] for error in response.json()["detail"]], [2, 3])
+        self.assertIs(api.get_snapshot(), before)
+
+        # Single updates are validated too.
+        response = client.post(
+            "/api/update_crowd_status", json={"status": 1, "timestamp": "soon"}
+        )
+        self.assertEqual(response.status_code, 422)
+
+    def test_fog_catches_up(self) -> None:
+        """Tests that the fog posts the statuses kept during an outage in one
+        batch once the API is back.
+        """
+        client = TestClient(api.app)
+        posts = []
+        api_up = False
+
+        def post(url: str, **kwargs: Any) -> Any:
+            if not api_up:
+                raise requests.ConnectionError("API down")
+            posts.append(url)
+            path = url.removeprefix(fog_subscriber.CROWD_API_URL)
+            return client.post(
+                path,
+                json=kwargs.get("json"),
+                content=kwargs.get("data"),
+                headers=kwargs.get("headers"),
+            )
+
+        fog_subscriber.pending_statuses.clear()
+        with mock.patch.object(fog_subscriber.requests, "post", post):
+            for minute in range(3):
+                fog_subscriber.post_status(
+                    {"status": 40 + minute, "timestamp": f"2024-04-05T14:0{minute}:00"}
+                )
+            self.assertEqual(len(fog_subscriber.pending_statuses), 3)
+
+            api_up = True
+            fog_subscriber.post_status(
+                {"status": 43, "timestamp": "2024-04-05T14:03:00"}
+            )
+            fog_subscriber.post_status(
+                {"status": 44, "timestamp": "2024-04-05T14:04:00"}
+            )
+
+        self.assertEqual(len(fog_subscriber.pending_statuses), 0)
+        self.assertEqual(
+            [url.rsplit("/", 1)[1] for url in posts], ["batch", "update_crowd_status"]
+        )
+        self.assertEqual(api.get_snapshot().status["status"], 44.0)
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for API batch methods.
+
+    :return: Test suite for API batch methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestApiBatchMethods("test_batch_update"))
+    s.addTest(TestApiBatchMethods("test_zones"))
+    s.addTest(TestApiBatchMethods("test_invalid_batch"))
+    s.addTest(TestApiBatchMethods("test_fog_catches_up"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+"""Runs tests for the crowd status snapshots of deployment/api.py and the
+    shared-memory store in util/status_store.py.
+"""
+
+import json
+import multiprocessing
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+
+from deployment import api
+from util.status_store import SharedStatusStore
+
+
+def _write_statuses(name: str, count: int) -> None:
+    store = SharedStatusStore.attach(name)
+    try:
+        for i in range(count):
+            body = json.dumps({"status": i, "padding": "x" * (i % 512), "check": i})
+            with store.write_lock():
+                store.write(body.encode())
+    finally:
+        store.close()
+
+
+class TestApiStateMethods(unittest.TestCase):
+    """Test case for API state methods."""
+
+    def test_snapshots(self) -> None:
+        """Tests that updates replace the snapshot instead of modifying it."""
+        client = TestClient(api.app)
+        before = api.get_snapshot()
+        before_status = dict(before.status)
+        client.post(
+            "/api/update_crowd_status",
+            json={"status": 12, "err": 1.0, "timestamp": "2024-04-05T12:00:00"},
+        )
+        after = api.get_snapshot()
+        self.assertIsNot(before, after)
+        self.assertGreater(after.version, before.version)
+        self.assertEqual(dict(before.status), before_status)
+
+        response = client.get("/api/get_crowd_status")
+        self.assertEqual(response.headers["content-type"], "application/json")
+        self.assertEqual(response.json()["status"], 12.0)
+        self.assertEqual(response.json()["timestamp"], "2024-04-05T12:00:00")
+
+    def test_shared_workers(self) -> None:
+        """Tests that workers serve the status updated by another worker."""
+        store = SharedStatusStore.create()
+        other = SharedStatusStore.attach(store.name)
+        shared_store, api.shared_store = api.shared_store, store
+        try:
+            client = TestClient(api.app)
+            client.post(
+                "/api/update_crowd_status",
+                json={"status": 5, "err": 2.0, "timestamp": "2024-04-05T12:00:00"},
+            )
+            statuses = json.loads(other.read()[1])
+            self.assertEqual(statuses[api.DEFAULT_ZONE]["status"], 5.0)
+
+            # Another worker updates the status through the store.
+            with other.write_lock():
+                statuses = json.loads(other.read()[1])
+                statuses[api.DEFAULT_ZONE]["status"] = 6.0
+                other.write(json.dumps(statuses).encode())
+            response = client.get("/api/get_crowd_status").json()
+            self.assertEqual(response["status"], 6.0)
+            self.assertEqual(response["one_sigma_conf_interval"], 2.0)
+        finally:
+            api.shared_store = shared_store
+            other.close()
+            store.close()
+
+    def test_update_waits_without_blocking(self) -> None:
+        """Tests that an update waiting for another worker's write does not
+        block the event loop.
+        """
+        store = SharedStatusStore.create()
+        other = SharedStatusStore.attach(store.name)
+        shared_store, api.shared_store = api.shared_store, store
+        try:
+            with TestClient(api.app) as client, ThreadPoolExecutor(2) as executor:
+                with other.write_lock():
+                    update = executor.submit(
+                        client.post,
+                        "/api/update_crowd_status",
+                        json={"status": 7, "timestamp": "2024-04-05T12:00:00"},
+                    )
+                    time.sleep(0.2)
+                    self.assertFalse(update.done())
+                    # Served by the same event loop while the update waits.
+                    read = executor.submit(client.get, "/api/get_crowd_status")
+                    self.assertEqual(read.result(timeout=5).status_code, 200)
+                self.assertEqual(update.result(timeout=5).status_code, 200)
+            statuses = json.loads(other.read()[1])
+            self.assertEqual(statuses[api.DEFAULT_ZONE]["status"], 7.0)
+        finally:
+            api.shared_store = shared_store
+            other.close()
+            store.close()
+
+    def test_interrupted_write(self) -> None:
+        """Tests that a write interrupted by the death of its writer does not
+        block the readers, and is recovered by the next write.
+        """
+        store = SharedStatusStore.create()
+        shared_store, api.shared_store = api.shared_store, store
+        try:
+            status = {"status": 1.0, "timestamp": "2024-04-05T12:00:00"}
+            store.write(json.dumps({api.DEFAULT_ZONE: status}).encode())
+            before = api.get_snapshot()
+            store.header[0] += 1
+            with self.assertRaises(TimeoutError):
+                store.read(timeout=0.01)
+            self.assertIs(api.get_snapshot(), before)
+
+            status = {"status": 2.0, "timestamp": "2024-04-05T12:01:00"}
+            version = store.write(json.dumps({api.DEFAULT_ZONE: status}).encode())
+            self.assertEqual(version % 2, 0)
+            self.assertEqual(api.get_snapshot().status["status"], 2.0)
+        finally:
+            api.shared_store = shared_store
+            store.close()
+
+    def test_no_torn_reads(self) -> None:
+        """Tests that readers never see a partially written status."""
+        store = SharedStatusStore.create()
+        process = multiprocessing.get_context("spawn").Process(
+            target=_write_statuses, args=(store.name, 20000)
+        )
+        process.start()
+        try:
+            reads = 0
+            while process.is_alive() or reads == 0:
+                version, body = store.read()
+                if version:
+                    status = json.loads(body)
+                    self.assertEqual(status["status"], status["check"])
+                    reads += 1
+            self.assertGreater(reads, 0)
+        finally:
+            process.join()
+            store.close()
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for API state methods.
+
+    :return: Test suite for API state methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestApiStateMethods("test_snapshots"))
+    s.addTest(TestApiStateMethods("test_shared_workers"))
+    s.addTest(TestApiStateMethods("test_update_waits_without_blocking"))
+    s.addTest(TestApiStateMethods("test_interrupted_write"))
+    s.addTest(TestApiStateMethods("test_no_torn_reads"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Runs tests for the crowd status smoothing in util/crowd_filter.py.
+"""
+
+import unittest
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from deployment import api
+from util.crowd_filter import CrowdFilter
+
+
+class TestCrowdFilterMethods(unittest.TestCase):
+    """Test case for crowd filter methods."""
+
+    def test_smoothing(self) -> None:
+        """Tests that noisy predictions are smoothed, less so when confident."""
+        rng = np.random.default_rng(0)
+        noise = rng.normal(0, 20, 200)
+        crowd_filter = CrowdFilter()
+        smoothed = [
+            crowd_filter.update(100 + n, 20.0, 10.0 * i)[0] for i, n in enumerate(noise)
+        ]
+        self.assertLess(np.std(smoothed[50:]), np.std(noise[50:]) / 2)
+        self.assertAlmostEqual(np.mean(smoothed[50:]), 100, delta=5)
+
+        confident = CrowdFilter()
+        uncertain = CrowdFilter()
+        for crowd_filter in (confident, uncertain):
+            crowd_filter.update(100, 5.0, 0.0)
+        self.assertGreater(
+            confident.update(200, 5.0, 10.0)[0], uncertain.update(200, 50.0, 10.0)[0]
+        )
+
+    def test_forecast(self) -> None:
+        """Tests that forecasts extrapolate the trend with growing uncertainty."""
+        crowd_filter = CrowdFilter()
+        with self.assertRaises(ValueError):
+            crowd_filter.forecast(60.0)
+        self.assertEqual(crowd_filter.forecasts([15]), [])
+
+        # A crowd growing by 6 people per minute.
+        for i in range(120):
+            crowd_filter.update(50 + 0.1 * 30 * i, 5.0, 30.0 * i)
+        level = 50 + 0.1 * 30 * 119
+        short, long = crowd_filter.forecasts([15, 30])
+        self.assertEqual(short["horizon_minutes"], 15)
+        self.assertAlmostEqual(short["status"], level + 90, delta=10)
+        self.assertAlmostEqual(long["status"], level + 180, delta=20)
+        self.assertGreater(long["err"], short["err"])
+
+        # Forecasts of a shrinking crowd stop at zero.
+        for i in range(120, 240):
+            crowd_filter.update(max(0, level - 0.1 * 30 * (i - 119)), 5.0, 30.0 * i)
+        self.assertEqual(crowd_filter.forecast(3600.0)[0], 0.0)
+
+    def test_api_serves_smoothed_status(self) -> None:
+        """Tests that the API serves the smoothed status and forecast."""
+        forecast = [{"horizon_minutes": 15, "status": 45.0, "err": 4.0}]
+        client = TestClient(api.app)
+        client.post(
+            "/api/update_crowd_status",
+            json={
+                "status": 44,
+                "err": 3.0,
+                "timestamp": "2024-04-05T12:00:00",
+                "smoothed_status": 42.5,
+                "smoothed_err": 2.0,
+                "forecast": forecast,
+            },
+        )
+        status = client.get("/api/get_crowd_status").json()
+        self.assertEqual(status["smoothed_status"], 42.5)
+        self.assertEqual(status["forecast"], forecast)
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for crowd filter methods.
+
+    :return: Test suite for crowd filter methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestCrowdFilterMethods("test_smoothing"))
+    s.addTest(TestCrowdFilterMethods("test_forecast"))
+    s.addTest(TestCrowdFilterMethods("test_api_serves_smoothed_status"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
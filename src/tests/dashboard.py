@@ -0,0 +1,108 @@
+"""Runs tests for serving the dashboard from deployment/api.py with the static
+    files of util/static_assets.py.
+"""
+
+import gzip
+import os
+import tempfile
+import unittest
+
+from fastapi.testclient import TestClient
+
+from deployment import api
+from util.static_assets import (
+    IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+    choose_encoding,
+    etag_matches,
+    load_assets,
+)
+
+INDEX_HTML = b"<!DOCTYPE html><html><body>" + b"<p>Crowd</p>" * 100 + b"</body></html>"
+
+
+class TestDashboardMethods(unittest.TestCase):
+    """Test case for dashboard methods."""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.directory.name, "js"))
+        for path, body in (
+            ("index.html", INDEX_HTML),
+            ("js/app.3f2a9c1d.js", b"console.log('crowd');" * 50),
+            (".hidden", b"secret"),
+            ("tiny.txt", b"a"),
+        ):
+            with open(os.path.join(self.directory.name, path), "wb") as f:
+                f.write(body)
+        self.dashboard_assets = api.dashboard_assets
+        api.dashboard_assets = load_assets(self.directory.name)
+
+    def tearDown(self) -> None:
+        api.dashboard_assets = self.dashboard_assets
+        self.directory.cleanup()
+
+    def test_load_assets(self) -> None:
+        """Tests that the files are compressed once, with an ETag each."""
+        assets = api.dashboard_assets
+        self.assertEqual(set(assets), {"index.html", "js/app.3f2a9c1d.js", "tiny.txt"})
+
+        index = assets["index.html"]
+        self.assertEqual(index.media_type, "text/html")
+        self.assertEqual(index.cache_control, REVALIDATE_CACHE_CONTROL)
+        self.assertEqual(gzip.decompress(index.bodies["gzip"]), INDEX_HTML)
+        self.assertEqual(len(set(index.etags.values())), len(index.bodies))
+        self.assertEqual(
+            assets["js/app.3f2a9c1d.js"].cache_control, IMMUTABLE_CACHE_CONTROL
+        )
+        # Compression that does not make a file smaller is not kept.
+        self.assertEqual(set(assets["tiny.txt"].bodies), {"identity"})
+
+        self.assertEqual(choose_encoding(index, "gzip, deflate"), "gzip")
+        self.assertEqual(choose_encoding(index, "gzip;q=0, deflate"), "identity")
+        self.assertEqual(choose_encoding(index, ""), "identity")
+        self.assertTrue(etag_matches('"abc"', 'W/"abc", "def"'))
+        self.assertFalse(etag_matches('"abc"', '"abc-gzip"'))
+
+    def test_serve_dashboard(self) -> None:
+        """Tests that the API serves the compressed dashboard and revalidates
+        it with the ETag.
+        """
+        client = TestClient(api.app)
+        response = client.get("/", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.url.path, "/dashboard/")
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+        self.assertEqual(response.content, INDEX_HTML)
+
+        etag = response.headers["etag"]
+        response = client.get(
+            "/dashboard/index.html",
+            headers={"Accept-Encoding": "gzip", "If-None-Match": etag},
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        response = client.get(
+            "/dashboard/js/app.3f2a9c1d.js", headers={"Accept-Encoding": "identity"}
+        )
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(response.headers["cache-control"], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(client.get("/dashboard/.hidden").status_code, 404)
+        self.assertEqual(client.get("/dashboard/../api.py").status_code, 404)
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for dashboard methods.
+
+    :return: Test suite for dashboard methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestDashboardMethods("test_load_assets"))
+    s.addTest(TestDashboardMethods("test_serve_dashboard"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Runs tests for the data preparation benchmarks in benchmarks/data_prep.py.
+"""
+
+import tempfile
+import unittest
+
+from benchmarks.data_prep import (
+    StageBenchmark,
+    benchmark_data_prep,
+    compare_to_baseline,
+    write_synthetic_raw_data,
+)
+from train_and_score import load_data
+
+
+class TestDataPrepBenchmarkMethods(unittest.TestCase):
+    """Test case for data preparation benchmark methods."""
+
+    def test_synthetic_raw_data(self) -> None:
+        """Tests that the synthetic data loads with the expected sizes."""
+        with tempfile.TemporaryDirectory() as data_dir:
+            paths = write_synthetic_raw_data(
+                data_dir, days=2, collectors=3, aps=4, bt_density=2, scans_per_day=6
+            )
+            wifi_df, bt_df, bbox_df, pop_df = load_data(*paths)
+            self.assertEqual(len(wifi_df), 2 * 3 * 4 * 6)
+            self.assertEqual(sorted(wifi_df["device_idx"].unique()), [0, 1, 2])
+            self.assertEqual(len(bbox_df), 2 * 3 * 6)
+            self.assertEqual(len(pop_df), 2 * 19)
+            self.assertTrue(set(bt_df["timestamp"]) <= set(pop_df["timestamp"]))
+
+            results = benchmark_data_prep(paths, top_n_aps=2, repeats=1)
+            self.assertEqual(results[0]["stage"], "get_wifi_dataframe")
+            self.assertTrue(all(result["seconds"] > 0 for result in results))
+
+    def test_compare_to_baseline(self) -> None:
+        """Tests that only increases beyond the threshold are regressions."""
+        baseline = {
+            "merge_dfs": StageBenchmark(stage="merge_dfs", seconds=1.0, peak_mib=10.0)
+        }
+        results = [
+            StageBenchmark(stage="merge_dfs", seconds=1.1, peak_mib=13.0),
+            StageBenchmark(stage="pivot_tables", seconds=5.0, peak_mib=50.0),
+        ]
+        regressions = compare_to_baseline(results, baseline, threshold=0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("merge_dfs: peak_mib"))
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for data preparation benchmark methods.
+
+    :return: Test suite for data preparation benchmark methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestDataPrepBenchmarkMethods("test_synthetic_raw_data"))
+    s.addTest(TestDataPrepBenchmarkMethods("test_compare_to_baseline"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
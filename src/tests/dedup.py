@@ -0,0 +1,133 @@
+"""Runs tests for the message deduplication in util/dedup.py.
+"""
+
+import json
+import threading
+import unittest
+from unittest import mock
+
+from deployment import edge_publisher, fog_subscriber
+from util.dedup import SequenceWindow
+
+
+class TestDedupMethods(unittest.TestCase):
+    """Test case for deduplication methods."""
+
+    def test_sequence_window(self) -> None:
+        """Tests dropping redelivered, outdated and old session messages."""
+        window = SequenceWindow()
+        self.assertTrue(window.accept(0, "a", 0))
+        self.assertTrue(window.accept(0, "a", 2))
+        self.assertFalse(window.accept(0, "a", 2))  # Redelivered
+        self.assertFalse(window.accept(0, "a", 1))  # Overtaken
+        self.assertTrue(window.accept(1, "a", 0))  # Other device
+
+        # The publisher restarted, its old session's messages are dropped.
+        self.assertTrue(window.accept(0, "b", 0))
+        self.assertFalse(window.accept(0, "a", 3))
+        self.assertTrue(window.accept(0, "b", 1))
+
+        # Publishers without sequence numbers are not deduplicated.
+        self.assertTrue(window.accept(0, None, None))
+        self.assertTrue(window.accept(0, None, None))
+
+    def test_commit_out_of_order(self) -> None:
+        """Tests that the reading of an older message that finishes last is not
+        stored.
+        """
+        window = SequenceWindow()
+        self.assertTrue(window.accept(0, "a", 1))
+        self.assertTrue(window.accept(0, "a", 2))
+        self.assertTrue(window.commit(0, "a", 2))
+        self.assertFalse(window.commit(0, "a", 1))
+        self.assertTrue(window.commit(0, "b", 0))  # Restarted publisher
+
+    def test_fog_stores_newest_reading(self) -> None:
+        """Tests that the fog keeps the newer of two readings of a device when
+        the older one finishes detection last.
+        """
+        fog_subscriber.sequence_window = SequenceWindow()
+        newer_stored = threading.Event()
+
+        def count_people(image: str, device_id: int) -> int:
+            # The older reading waits until the newer one is stored.
+            if image == "older":
+                newer_stored.wait(5)
+            return len(image)
+
+        def payload(image: str, seq: int) -> bytes:
+            return json.dumps(
+                {
+                    "image": image,
+                    "wifi_strength": [0] * 5,
+                    "bt_output": 0,
+                    "device_id": 0,
+                    "session": "a",
+                    "seq": seq,
+                    "return_image": True,
+                }
+            ).encode()
+
+        def post_status(status: dict) -> None:
+            newer_stored.set()
+
+        with mock.patch.multiple(
+            fog_subscriber,
+            decode_img=lambda image, min_side: image,
+            count_people_cached=count_people,
+            model_inference=lambda: 0,
+            post_status=post_status,
+        ):
+            older = threading.Thread(
+                target=fog_subscriber.handle_message, args=(payload("older", 1),)
+            )
+            older.start()
+            fog_subscriber.handle_message(payload("newest", 2))
+            older.join()
+
+        self.assertEqual(fog_subscriber.stored_data["data"][0]["image"], len("newest"))
+
+    def test_fog_drops_before_detection(self) -> None:
+        """Tests that the fog drops duplicates before decoding their image."""
+        fog_subscriber.sequence_window = SequenceWindow()
+        fog_subscriber.sequence_window.accept(0, "a", 3)
+        payload = json.dumps(
+            {
+                "image": "not an image",
+                "wifi_strength": [0] * 5,
+                "bt_output": 0,
+                "device_id": 0,
+                "session": "a",
+                "seq": 3,
+                "return_image": True,
+            }
+        ).encode()
+        dropped = fog_subscriber.messages_dropped.labels(0)
+        before = dropped.value
+        fog_subscriber.handle_message(payload)
+        self.assertEqual(dropped.value, before + 1)
+
+    def test_edge_sequence_numbers(self) -> None:
+        """Tests that the edge numbers its messages per device."""
+        first = next(edge_publisher.sequence_numbers[7])
+        self.assertEqual(next(edge_publisher.sequence_numbers[7]), first + 1)
+        self.assertEqual(len(edge_publisher.SESSION), 32)
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for deduplication methods.
+
+    :return: Test suite for deduplication methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestDedupMethods("test_sequence_window"))
+    s.addTest(TestDedupMethods("test_commit_out_of_order"))
+    s.addTest(TestDedupMethods("test_fog_stores_newest_reading"))
+    s.addTest(TestDedupMethods("test_fog_drops_before_detection"))
+    s.addTest(TestDedupMethods("test_edge_sequence_numbers"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""Runs tests for the fog's people count cache in util/detection_cache.py.
+"""
+
+import unittest
+
+import numpy as np
+
+from deployment import fog_subscriber
+from util.detection_cache import HASH_SIZE, DetectionCache, perceptual_hash
+
+
+class TestDetectionCacheMethods(unittest.TestCase):
+    """Test case for detection cache methods."""
+
+    def test_perceptual_hash(self) -> None:
+        """Tests that noise flips few bits and a changed scene many."""
+        rng = np.random.default_rng(0)
+        scene = np.repeat(
+            rng.integers(0, 256, (48, 64, 1), dtype=np.uint8).repeat(20, 0), 20, 1
+        )
+        scene = np.repeat(scene, 3, axis=2)
+        noisy = np.clip(
+            scene.astype(int) + rng.integers(-3, 4, scene.shape), 0, 255
+        ).astype(np.uint8)
+        other = scene[::-1].copy()
+
+        scene_hash = perceptual_hash(scene)
+        self.assertLess(scene_hash.bit_length(), HASH_SIZE**2 + 1)
+        self.assertLessEqual((scene_hash ^ perceptual_hash(noisy)).bit_count(), 4)
+        self.assertGreater((scene_hash ^ perceptual_hash(other)).bit_count(), 32)
+
+    def test_lookup(self) -> None:
+        """Tests matching within the Hamming distance, per device."""
+        cache = DetectionCache(max_size=8, max_distance=2)
+        cache.put(0, 0b1111, 5)
+        self.assertEqual(cache.get(0, 0b1111), 5)
+        self.assertEqual(cache.get(0, 0b1100), 5)
+        self.assertIsNone(cache.get(0, 0b1000))
+        self.assertIsNone(cache.get(1, 0b1111))
+        self.assertAlmostEqual(cache.hit_rate, 0.5)
+
+        exact = DetectionCache(max_size=8)
+        exact.put(0, 0b1111, 5)
+        self.assertIsNone(exact.get(0, 0b1110))
+
+    def test_eviction(self) -> None:
+        """Tests that the least recently used counts are evicted."""
+        cache = DetectionCache(max_size=2)
+        cache.put(0, 1, 1)
+        cache.put(0, 2, 2)
+        cache.get(0, 1)
+        cache.put(0, 3, 3)
+        self.assertEqual(cache.get(0, 1), 1)
+        self.assertIsNone(cache.get(0, 2))
+        self.assertEqual(len(cache.entries), 2)
+
+    def test_fog_cache_hit(self) -> None:
+        """Tests that the fog returns a cached count without detection."""
+        image = np.zeros((480, 640, 3), dtype=np.uint8)
+        image[:, 320:] = 200
+        fog_subscriber.detection_cache = DetectionCache(max_size=4)
+        fog_subscriber.detection_cache.put(2, perceptual_hash(image), 7)
+        hits = fog_subscriber.detection_cache_lookups.labels(2, "hit")
+        before = hits.value
+
+        self.assertEqual(fog_subscriber.count_people_cached(image, 2), 7)
+        self.assertEqual(hits.value, before + 1)
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for detection cache methods.
+
+    :return: Test suite for detection cache methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestDetectionCacheMethods("test_perceptual_hash"))
+    s.addTest(TestDetectionCacheMethods("test_lookup"))
+    s.addTest(TestDetectionCacheMethods("test_eviction"))
+    s.addTest(TestDetectionCacheMethods("test_fog_cache_hit"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
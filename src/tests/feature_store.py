@@ -0,0 +1,140 @@
+"""Runs tests for the Parquet feature store in dataset/feature_store.py.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from dataset.build_dataframe import get_top_N_wifi_aps_only, merge_dfs, pivot_tables
+from dataset.feature_store import (
+    build_feature_store,
+    load_feature_table,
+    read_manifest,
+)
+from train_and_score import load_data
+
+COLLECTORS = ["bryan", "chris"]
+TIMESTAMPS = ["20240228113000", "20240228120000", "20240307123000"]
+
+
+def write_raw_data(data_dir: str) -> tuple[str, str, str]:
+    """Writes a small raw data tree for two collectors over two days.
+
+    :param data_dir: Directory to write the data to
+    :type data_dir: str
+    :return: Raw data, bounding box CSV and population count CSV paths
+    :rtype: tuple[str, str, str]
+    """
+    raw_data_path = os.path.join(data_dir, "raw_data")
+    for device_idx, collector in enumerate(COLLECTORS):
+        collector_dir = os.path.join(raw_data_path, collector)
+        os.makedirs(collector_dir)
+        with open(
+            os.path.join(collector_dir, "wifi_signal_strength.csv"),
+            "w",
+            encoding="utf-8",
+        ) as f:
+            for i, timestamp in enumerate(TIMESTAMPS):
+                for ap in range(3):
+                    f.write(f"{timestamp},AA:{ap},SIT-POLY,{90 - 10 * ap - i}\n")
+        with open(
+            os.path.join(collector_dir, "btoutput.txt"), "w", encoding="utf-8"
+        ) as f:
+            for i, timestamp in enumerate(TIMESTAMPS):
+                for dev in range(i + device_idx + 1):
+                    f.write(f"{timestamp} - [NEW] Device BB:{dev} name\n")
+
+    bbox_csv_path = os.path.join(data_dir, "bbox_results.csv")
+    with open(bbox_csv_path, "w", encoding="utf-8") as f:
+        f.write("Timestamp,Device_ID,Bbox Count\n")
+        for device_idx, _ in enumerate(COLLECTORS):
+            for i, timestamp in enumerate(TIMESTAMPS):
+                f.write(f"{timestamp[:12]},{device_idx},{i + 3}\n")
+
+    pop_count_csv_path = os.path.join(data_dir, "manual_counts.csv")
+    with open(pop_count_csv_path, "w", encoding="utf-8") as f:
+        f.write("Timestamp,Count,Comment\nTimestamp,Count,Comment\n")
+        f.write("28/02/2024 11:30:00,50,\n")
+        f.write("28/02/2024 12:00:00,80,lunch\n")
+        f.write("07/03/2024 12:30:00,65,\n")
+
+    return raw_data_path, bbox_csv_path, pop_count_csv_path
+
+
+class TestFeatureStoreMethods(unittest.TestCase):
+    """Test case for feature store methods."""
+
+    def test_matches_in_memory(self) -> None:
+        """Tests that the stored table matches the in-memory pipeline."""
+        with tempfile.TemporaryDirectory() as data_dir:
+            paths = write_raw_data(data_dir)
+            store_dir = os.path.join(data_dir, "store")
+            build_feature_store(*paths, store_dir, top_n_aps=2)
+            stored = load_feature_table(store_dir)
+
+            wifi_df, bt_df, bbox_df, pop_df = load_data(*paths)
+            wifi_tabular, bt_tabular, bbox_tabular = pivot_tables(
+                get_top_N_wifi_aps_only(wifi_df, 2), bt_df, bbox_df
+            )
+            expected = merge_dfs(wifi_tabular, bt_tabular, bbox_tabular, pop_df)
+
+            self.assertEqual(list(stored.columns), list(expected.columns))
+            np.testing.assert_allclose(
+                stored.drop(columns=["timestamp", "comment"]).to_numpy(float),
+                expected.drop(columns=["timestamp", "comment"]).to_numpy(float),
+            )
+
+    def test_rebuilds_changed_collectors_only(self) -> None:
+        """Tests that only collectors with changed raw files are rebuilt."""
+        with tempfile.TemporaryDirectory() as data_dir:
+            paths = write_raw_data(data_dir)
+            store_dir = os.path.join(data_dir, "store")
+            self.assertEqual(build_feature_store(*paths, store_dir), COLLECTORS)
+            self.assertEqual(build_feature_store(*paths, store_dir), [])
+
+            wifi_path = os.path.join(paths[0], "chris", "wifi_signal_strength.csv")
+            with open(wifi_path, "a", encoding="utf-8") as f:
+                f.write("20240307123500,AA:9,SIT-POLY,99\n")
+            self.assertEqual(build_feature_store(*paths, store_dir), ["chris"])
+
+    def test_removes_deleted_collectors(self) -> None:
+        """Tests that the partitions of a collector whose raw data was deleted
+        are removed and no longer in the combined table.
+        """
+        with tempfile.TemporaryDirectory() as data_dir:
+            paths = write_raw_data(data_dir)
+            store_dir = os.path.join(data_dir, "store")
+            build_feature_store(*paths, store_dir)
+            self.assertIn("('bt_device_count', 1)", load_feature_table(store_dir))
+
+            shutil.rmtree(os.path.join(paths[0], "chris"))
+            self.assertEqual(build_feature_store(*paths, store_dir), [])
+            manifest = read_manifest(store_dir)
+            assert manifest is not None
+            self.assertEqual(list(manifest["collectors"]), ["bryan"])
+            self.assertEqual(list(Path(store_dir).glob("*/*/collector=chris")), [])
+            combined = load_feature_table(store_dir)
+            self.assertNotIn("('bt_device_count', 1)", combined)
+            self.assertNotIn("('signal_strength', 1, 1)", combined)
+            self.assertIn("('bt_device_count', 0)", combined)
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for feature store methods.
+
+    :return: Test suite for feature store methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestFeatureStoreMethods("test_matches_in_memory"))
+    s.addTest(TestFeatureStoreMethods("test_rebuilds_changed_collectors_only"))
+    s.addTest(TestFeatureStoreMethods("test_removes_deleted_collectors"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,12 +2,35 @@
 """
 
 import datetime
+import json
 import os
+import shutil
+import tempfile
 import unittest
 
+import numpy as np
 import pandas as pd
 
-from deployment.fog_subscriber import CrowdStatus, DataFromEdge, model_inference
+from deployment.config import DEVICE_TTL, TOTAL_DEVICES
+from deployment.fog_subscriber import (
+    CrowdStatus,
+    DataFromEdge,
+    base_numpy_data,
+    decode_img,
+    get_device_columns,
+    get_stale_devices,
+    load_model,
+    model_inference,
+    parse_data_into_numpy,
+)
+from util.capture_image import encode_image
+from util.gpr_predictor import PREDICTOR_FILENAME
+from util.model_artifact import (
+    ARTIFACT_VERSION,
+    MANIFEST_FILENAME,
+    load_model_artifact,
+    save_model_artifact,
+)
 from util.wifi_bt_processing import get_bbox_counts_column_index, get_demo_data
 
 
@@ -37,6 +60,7 @@ class TestFogSubscriberMethods(unittest.TestCase):
                 image=image_data,
                 wifi_data=wifi_data,
                 bt_data=bt_data,
+                last_seen=None,
             )
             crowd_status["data"][device_idx] = data_from_edge
 
@@ -47,6 +71,109 @@ class TestFogSubscriberMethods(unittest.TestCase):
 
         self.assertEqual(preds[0], 281)  # Known value from the training predictions.
 
+    def test_stale_devices(self) -> None:
+        """Tests filling in the features of devices that stopped reporting."""
+        feature_means = np.full(base_numpy_data.shape[1], 10.0)
+        columns = get_device_columns(0)
+        crowd_status = CrowdStatus(
+            status=0,
+            err=None,
+            timestamp=datetime.datetime.fromtimestamp(0.0),
+            data={
+                0: DataFromEdge(
+                    device_id=0,
+                    return_image=False,
+                    image=30,
+                    wifi_data=[30] * (len(columns) - 2),
+                    bt_data=30,
+                    last_seen=100.0,
+                )
+            },
+            numpy_data=np.zeros_like(base_numpy_data),
+        )
+
+        # Fresh readings are used as they are, devices that never reported
+        # get zeros without a policy and the training mean with one.
+        now = 100.0 + DEVICE_TTL
+        features = parse_data_into_numpy(crowd_status, feature_means, now, None)
+        np.testing.assert_allclose(features[0, columns], 30.0)
+        self.assertEqual(
+            get_stale_devices(crowd_status, now), list(range(1, TOTAL_DEVICES))
+        )
+        other = get_device_columns(1)
+        np.testing.assert_allclose(features[0, other], 0.0)
+        features = parse_data_into_numpy(crowd_status, feature_means, now, "decay")
+        np.testing.assert_allclose(features[0, columns], 30.0)
+        np.testing.assert_allclose(features[0, other], 10.0)
+
+        # A stale reading halves its distance to the mean every DEVICE_TTL.
+        now = 100.0 + 2 * DEVICE_TTL
+        self.assertIn(0, get_stale_devices(crowd_status, now))
+        features = parse_data_into_numpy(crowd_status, feature_means, now, None)
+        np.testing.assert_allclose(features[0, columns], 20.0)
+        np.testing.assert_allclose(features[0, other], 0.0)
+        features = parse_data_into_numpy(crowd_status, feature_means, now, "decay")
+        np.testing.assert_allclose(features[0, columns], 20.0)
+        features = parse_data_into_numpy(crowd_status, feature_means, now, "mean")
+        np.testing.assert_allclose(features[0, columns], 10.0)
+        features = parse_data_into_numpy(crowd_status, feature_means, now, "exclude")
+        np.testing.assert_allclose(features[0, columns], 0.0)
+        np.testing.assert_allclose(features[0, other], 0.0)
+
+        with self.assertRaises(ValueError):
+            parse_data_into_numpy(crowd_status, feature_means, now, "zero")
+
+    def test_refuses_incompatible_layout(self) -> None:
+        """Tests that a model with a different feature layout is not loaded."""
+        deployment_dir = os.path.join(
+            os.path.dirname(__file__), "..", "deployment", "models"
+        )
+        model, manifest = load_model_artifact(os.path.join(deployment_dir, "gpr"))
+        layout = manifest["feature_layout"]
+        layout["top_n_aps"] += 1
+        with tempfile.TemporaryDirectory() as models_dir:
+            save_model_artifact(
+                model,
+                os.path.join(models_dir, "gpr"),
+                layout,
+                model.X_train_,
+                model.y_train_,
+            )
+            with self.assertRaises(ValueError):
+                load_model(models_dir, "gpr")
+
+    def test_refuses_incompatible_version(self) -> None:
+        """Tests that an exported predictor of another artifact version is not
+        loaded.
+        """
+        artifact_dir = os.path.join(
+            os.path.dirname(__file__), "..", "deployment", "models", "gpr"
+        )
+        with tempfile.TemporaryDirectory() as models_dir:
+            copy_dir = os.path.join(models_dir, "gpr")
+            shutil.copytree(artifact_dir, copy_dir)
+            manifest_path = os.path.join(copy_dir, MANIFEST_FILENAME)
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            manifest["version"] = ARTIFACT_VERSION + 1
+            with open(manifest_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            self.assertTrue(os.path.exists(os.path.join(copy_dir, PREDICTOR_FILENAME)))
+            with self.assertRaises(ValueError):
+                load_model(models_dir, "gpr")
+
+    def test_decode_img_reduced(self) -> None:
+        """Tests that large JPEG images are decoded straight to a smaller scale."""
+        image = np.zeros((1080, 1920, 3), dtype=np.uint8)
+        image[:, 960:] = 255
+        payload = encode_image(image)
+
+        self.assertEqual(decode_img(payload).shape, (1080, 1920, 3))
+        reduced = decode_img(payload, min_long_side=640)
+        self.assertEqual(reduced.shape, (540, 960, 3))
+        self.assertLess(np.abs(reduced[:, 500].astype(int) - 255).max(), 8)
+        self.assertEqual(decode_img(payload, min_long_side=1920).shape[1], 1920)
+
 
 def suite() -> unittest.TestSuite:
     """Returns a test suite for fog subscriber methods.
@@ -56,6 +183,10 @@ def suite() -> unittest.TestSuite:
     """
     s = unittest.TestSuite()
     s.addTest(TestFogSubscriberMethods("test_inference"))
+    s.addTest(TestFogSubscriberMethods("test_stale_devices"))
+    s.addTest(TestFogSubscriberMethods("test_refuses_incompatible_layout"))
+    s.addTest(TestFogSubscriberMethods("test_refuses_incompatible_version"))
+    s.addTest(TestFogSubscriberMethods("test_decode_img_reduced"))
     return s
 
 
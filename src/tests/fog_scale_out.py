@@ -0,0 +1,271 @@
+"""Runs tests for partitioning the devices between fog workers in
+    deployment/fog_subscriber.py, against a local stand-in for the broker.
+"""
+
+import json
+import queue
+import time
+import unittest
+from typing import Any, Callable, Optional
+
+import paho.mqtt.client as mqtt
+
+from deployment import fog_subscriber
+from deployment.config import TOPIC, TOTAL_DEVICES
+from util.partition_lease import PartitionLease
+
+
+class LocalBroker:
+    """Routes messages like an MQTT broker, with retained messages and wills.
+    Messages are queued and delivered by :meth:`flush`, as they would be
+    delivered asynchronously.
+    """
+
+    def __init__(self):
+        self.subscriptions: list[tuple[str, Any]] = []
+        self.retained: dict[str, bytes] = {}
+        self.messages: queue.Queue = queue.Queue()
+
+    def subscribe(self, client: Any, topic: str) -> None:
+        """Subscribes a client to a topic filter, sending the retained messages.
+
+        :param client: Subscriber
+        :type client: Any
+        :param topic: Topic filter
+        :type topic: str
+        """
+        self.subscriptions.append((topic, client))
+        for retained_topic, payload in self.retained.items():
+            if mqtt.topic_matches_sub(topic, retained_topic):
+                self.messages.put((client, retained_topic, payload))
+
+    def unsubscribe(self, client: Any, topic: str) -> None:
+        """Unsubscribes a client from a topic filter.
+
+        :param client: Subscriber
+        :type client: Any
+        :param topic: Topic filter
+        :type topic: str
+        """
+        self.subscriptions.remove((topic, client))
+
+    def publish(self, topic: str, payload: bytes = b"", retain: bool = False) -> None:
+        """Publishes a message, retaining it (or clearing the retained one if
+        empty) if asked.
+
+        :param topic: Topic
+        :type topic: str
+        :param payload: Payload, defaults to b""
+        :type payload: bytes, optional
+        :param retain: Whether to retain the message, defaults to False
+        :type retain: bool, optional
+        """
+        if retain and payload:
+            self.retained[topic] = payload
+        elif retain:
+            self.retained.pop(topic, None)
+        for topic_filter, client in list(self.subscriptions):
+            if mqtt.topic_matches_sub(topic_filter, topic):
+                self.messages.put((client, topic, payload))
+
+    def disconnect(self, client: Any) -> None:
+        """Disconnects a client without notice, publishing its will.
+
+        :param client: Client
+        :type client: Any
+        """
+        self.subscriptions = [s for s in self.subscriptions if s[1] is not client]
+        if client.will is not None:
+            self.publish(*client.will, retain=True)
+
+    def flush(self, until: Callable[[], bool], timeout: float = 5.0) -> None:
+        """Delivers the messages, including those published meanwhile by
+        timers, until a condition holds.
+
+        :param until: Condition
+        :type until: Callable[[], bool]
+        :param timeout: Seconds to wait for the condition, defaults to 5.0
+        :type timeout: float, optional
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                client, topic, payload = self.messages.get(timeout=0.01)
+                client.deliver(topic, payload)
+            except queue.Empty:
+                if until():
+                    return
+        raise AssertionError("The condition did not hold in time.")
+
+
+class LocalClient:
+    """Fog worker client connected to a :class:`LocalBroker`.
+
+    :param broker: The broker
+    :type broker: LocalBroker
+    """
+
+    def __init__(self, broker: LocalBroker):
+        self.broker = broker
+        self.lease: Optional[PartitionLease] = None
+        self.will: Optional[tuple[str, bytes]] = None
+        self.received: list[str] = []
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False):
+        """Publishes a message, see :meth:`LocalBroker.publish`."""
+        self.broker.publish(topic, payload, retain)
+
+    def subscribe(self, topics: list[tuple[str, int]]) -> None:
+        """Subscribes to topic filters."""
+        for topic, _ in topics:
+            self.broker.subscribe(self, topic)
+
+    def unsubscribe(self, topics: list[str]) -> None:
+        """Unsubscribes from topic filters."""
+        for topic in topics:
+            self.broker.unsubscribe(self, topic)
+
+    def deliver(self, topic: str, payload: bytes) -> None:
+        """Receives a message, handling the lease messages."""
+        if self.lease is not None and topic == self.lease.topic:
+            self.lease.on_lease(payload)
+        else:
+            self.received.append(topic)
+
+
+class TestFogScaleOutMethods(unittest.TestCase):
+    """Test case for fog scale-out methods."""
+
+    def test_device_affinity(self) -> None:
+        """Tests that each reading reaches the one worker of its device's
+        partition."""
+        broker = LocalBroker()
+        clients = [LocalClient(broker) for _ in range(2)]
+        for partition, client in enumerate(clients):
+            client.subscribe(
+                [(t, 1) for t in fog_subscriber.get_subscriptions(partition, 2)]
+            )
+        self.assertTrue(
+            all(not t.startswith("$share/") for t, _ in broker.subscriptions)
+        )
+
+        for n in range(100):
+            broker.publish(f"{TOPIC}/{n % TOTAL_DEVICES}")
+        broker.flush(until=broker.messages.empty)
+        for partition, client in enumerate(clients):
+            devices = [int(t.rsplit("/", 1)[1]) for t in client.received]
+            self.assertEqual(len(devices), 50)
+            self.assertTrue(all(d % 2 == partition for d in devices))
+
+        # Every worker receives the shared state of every device.
+        broker.publish(f"{fog_subscriber.STATE_TOPIC}/0")
+        self.assertEqual(broker.messages.qsize(), 2)
+        with self.assertRaises(ValueError):
+            fog_subscriber.get_subscriptions(2, 2, "fog")
+
+    def test_partition_failover(self) -> None:
+        """Tests that one replica of a partition handles all of its readings,
+        and that a standby takes over when it disconnects."""
+        broker = LocalBroker()
+        lease_topic = fog_subscriber.get_lease_topic(0, "fog")
+        device_topics = [
+            t
+            for t in fog_subscriber.get_subscriptions(0, 2, "fog")
+            if not t.startswith(fog_subscriber.STATE_TOPIC)
+        ]
+        replicas = []
+        for replica in range(2):
+            client = LocalClient(broker)
+            client.will = (lease_topic, b"")
+            client.lease = PartitionLease(
+                client, lease_topic, device_topics, f"fog-{replica}", 0.05
+            )
+            client.subscribe([(lease_topic, 1)])
+            client.lease.reset()
+            replicas.append(client)
+
+        def holders() -> list[LocalClient]:
+            return [c for c in replicas if c.lease is not None and c.lease.active]
+
+        broker.flush(until=lambda: len(holders()) == 1)
+        holder = holders()[0]
+        standby = next(c for c in replicas if c is not holder)
+        for n in range(10):
+            broker.publish(f"{TOPIC}/{device_topics[0].rsplit('/', 1)[1]}")
+        broker.flush(until=broker.messages.empty)
+        self.assertEqual((len(holder.received), len(standby.received)), (10, 0))
+
+        # The holder fails, so its will clears the lease.
+        broker.disconnect(holder)
+        replicas.remove(holder)
+        broker.flush(until=lambda: holders() == [standby])
+        broker.publish(device_topics[0])
+        broker.flush(until=broker.messages.empty)
+        self.assertEqual(len(standby.received), 1)
+        assert standby.lease is not None
+        standby.lease.release()
+        self.assertNotIn(lease_topic, broker.retained)
+
+    def test_single_worker(self) -> None:
+        """Tests that a single worker receives every reading without state."""
+        broker = LocalBroker()
+        client = LocalClient(broker)
+        client.subscribe([(t, 1) for t in fog_subscriber.get_subscriptions(0, 1)])
+        for topic in (TOPIC, f"{TOPIC}/3", f"{fog_subscriber.STATE_TOPIC}/3"):
+            broker.publish(topic)
+        broker.flush(until=broker.messages.empty)
+        self.assertEqual(client.received, [TOPIC, f"{TOPIC}/3"])
+
+    def test_device_state(self) -> None:
+        """Tests storing the readings shared by other workers."""
+        device_id = TOTAL_DEVICES - 1
+        state = {
+            "worker": "fog-other",
+            "device_id": device_id,
+            "image": 3,
+            "wifi_data": [-60] * 5,
+            "bt_data": 12,
+            "seen_at": time.time() - 5.0,
+            "status": 40,
+            "err": 2.0,
+            "predicted_at": time.time() - 5.0,
+        }
+        message = mqtt.MQTTMessage(
+            topic=f"{fog_subscriber.STATE_TOPIC}/{device_id}".encode()
+        )
+        message.payload = json.dumps(state).encode()
+        try:
+            fog_subscriber.on_message(None, None, message)  # type: ignore
+            data = fog_subscriber.stored_data["data"][device_id]
+            self.assertEqual(data["bt_data"], 12)
+            self.assertAlmostEqual(time.monotonic() - data["last_seen"], 5.0, delta=1)
+            self.assertIsNotNone(fog_subscriber.crowd_filter.last_time)
+
+            # The worker's own state is ignored.
+            message.payload = json.dumps(
+                {**state, "worker": fog_subscriber.WORKER_ID, "bt_data": 0}
+            ).encode()
+            fog_subscriber.on_message(None, None, message)  # type: ignore
+            self.assertEqual(
+                fog_subscriber.stored_data["data"][device_id]["bt_data"], 12
+            )
+        finally:
+            fog_subscriber.stored_data["data"].pop(device_id, None)
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for fog scale-out methods.
+
+    :return: Test suite for fog scale-out methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestFogScaleOutMethods("test_device_affinity"))
+    s.addTest(TestFogScaleOutMethods("test_partition_failover"))
+    s.addTest(TestFogScaleOutMethods("test_single_worker"))
+    s.addTest(TestFogScaleOutMethods("test_device_state"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""Runs tests for the shared-memory frame ring buffer in util/frame_ring.py.
+"""
+
+import multiprocessing
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from unittest import mock
+
+import numpy as np
+
+from util import frame_ring
+from util.frame_ring import FrameDetectionPool, FrameRingBuffer
+
+FRAME_SHAPE = (48, 64, 3)
+
+
+def sum_frame(name: str, seq: int) -> Optional[int]:
+    """Sums a frame of a ring buffer in another process.
+
+    :param name: Name of the ring buffer
+    :type name: str
+    :param seq: Sequence number of the frame
+    :type seq: int
+    :return: Sum of the frame, None if it was overwritten
+    :rtype: Optional[int]
+    """
+    ring = FrameRingBuffer.attach(name)
+    try:
+        frame = ring.read(seq)
+        return None if frame is None else int(frame.sum(dtype=np.int64))
+    finally:
+        del frame
+        ring.close()
+
+
+class TestFrameRingMethods(unittest.TestCase):
+    """Test case for frame ring buffer methods."""
+
+    def setUp(self) -> None:
+        self.ring = FrameRingBuffer.create(2, int(np.prod(FRAME_SHAPE)))
+        self.rng = np.random.default_rng(0)
+
+    def tearDown(self) -> None:
+        self.ring.close()
+
+    def test_zero_copy_read(self) -> None:
+        """Tests that frames are read as views of the shared memory."""
+        frame = self.rng.integers(0, 255, FRAME_SHAPE, dtype=np.uint8)
+        seq = self.ring.write(frame)
+        view = self.ring.read(seq)
+        assert view is not None
+        np.testing.assert_array_equal(view, frame)
+        self.assertFalse(view.flags.writeable)
+        self.assertFalse(view.flags.owndata)
+        del view
+
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            total = pool.apply(sum_frame, (self.ring.name, seq))
+        self.assertEqual(total, int(frame.sum(dtype=np.int64)))
+
+    def test_overwritten_frames(self) -> None:
+        """Tests that overwritten frames are detected by their sequence number."""
+        seqs = [
+            self.ring.write(np.full(FRAME_SHAPE[:2], i, dtype=np.uint8))
+            for i in range(3)
+        ]
+        self.assertIsNone(self.ring.read(seqs[0]))
+        self.assertFalse(self.ring.is_current(seqs[0]))
+
+        view = self.ring.read(seqs[2])
+        assert view is not None
+        self.assertEqual(view.shape, FRAME_SHAPE[:2])
+        self.assertTrue((view == 2).all())
+        del view
+
+        with self.assertRaises(ValueError):
+            self.ring.write(np.zeros((100, 100, 3), dtype=np.uint8))
+
+    def test_capture_into_slot(self) -> None:
+        """Tests that frames are captured straight into a slot once the frame
+        shape is known.
+        """
+        pool = FrameDetectionPool(1, int(np.prod(FRAME_SHAPE)))
+        # Detect in a thread of this process, reading the same ring buffer.
+        pool.executor.shutdown()
+        pool.executor = ThreadPoolExecutor(1)
+        outs = []
+
+        def capture(out: Optional[np.ndarray]) -> np.ndarray:
+            outs.append(out)
+            if out is None:
+                return np.full(FRAME_SHAPE, 1, dtype=np.uint8)
+            out[:] = 2
+            return out
+
+        def count_people(frame: np.ndarray, device_id: Optional[int] = None) -> int:
+            return int(frame.sum(dtype=np.int64))
+
+        try:
+            with mock.patch.object(frame_ring, "_worker_ring", pool.ring), mock.patch(
+                "util.people_detection.count_people", count_people
+            ):
+                _, first = pool.capture_and_count(capture)
+                frame, second = pool.capture_and_count(capture)
+            self.assertIsNone(outs[0])
+            self.assertIsNotNone(outs[1])
+            self.assertTrue(np.shares_memory(frame, outs[1]))
+            self.assertEqual(first, int(np.prod(FRAME_SHAPE)))
+            self.assertEqual(second, 2 * int(np.prod(FRAME_SHAPE)))
+            del frame, outs
+        finally:
+            pool.close()
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for frame ring buffer methods.
+
+    :return: Test suite for frame ring buffer methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestFrameRingMethods("test_zero_copy_read"))
+    s.addTest(TestFrameRingMethods("test_overwritten_frames"))
+    s.addTest(TestFrameRingMethods("test_capture_into_slot"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
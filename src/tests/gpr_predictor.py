@@ -0,0 +1,87 @@
+"""Runs tests for the NumPy-only GPR predictor in util/gpr_predictor.py.
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import (
+    RBF,
+    ConstantKernel,
+    DotProduct,
+    Matern,
+    RationalQuadratic,
+    WhiteKernel,
+)
+
+from util.gpr_predictor import export_gpr_predictor, load_gpr_predictor
+from util.model_artifact import load_model_artifact
+
+
+class TestGPRPredictorMethods(unittest.TestCase):
+    """Test case for GPR predictor methods."""
+
+    def assert_matches(self, model: GaussianProcessRegressor, X: np.ndarray) -> None:
+        """Asserts that the exported predictor matches the sklearn model.
+
+        :param model: Fitted model
+        :type model: GaussianProcessRegressor
+        :param X: Inputs to predict
+        :type X: np.ndarray
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "predictor.npz")
+            export_gpr_predictor(model, path)
+            predictor = load_gpr_predictor(path)
+
+        expected_mean, expected_std = model.predict(X, return_std=True)
+        mean, std = predictor.predict(X, return_std=True)
+        np.testing.assert_allclose(mean, expected_mean, rtol=1e-6, atol=1e-6)
+        np.testing.assert_allclose(std, expected_std, rtol=1e-6, atol=1e-6)
+
+    def test_matches_deployed_model(self) -> None:
+        """Tests the predictor of the deployed model on the koufu data."""
+        model, _ = load_model_artifact(
+            os.path.join(os.path.dirname(__file__), "..", "deployment", "models", "gpr")
+        )
+        koufu_file_path = os.path.join(os.path.dirname(__file__), "test_data/koufu.csv")
+        X = pd.read_csv(koufu_file_path).drop(columns=["timestamp", "count"])
+        self.assert_matches(model, X.to_numpy(float))
+
+    def test_matches_kernels(self) -> None:
+        """Tests the predictor with the kernels of model_search.MODELS."""
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(40, 3))
+        y = X[:, 0] * 5 + np.sin(X[:, 1]) + rng.normal(scale=0.1, size=40)
+        kernels = [
+            DotProduct() + RBF(length_scale=[1.0, 2.0, 3.0]) + WhiteKernel(),
+            ConstantKernel() * Matern(nu=0.5) + WhiteKernel(),
+            Matern(nu=1.5) + WhiteKernel(),
+            Matern(nu=2.5) * DotProduct(),
+            RationalQuadratic() + WhiteKernel(),
+        ]
+        for kernel in kernels:
+            with self.subTest(kernel=kernel):
+                model = GaussianProcessRegressor(
+                    kernel, normalize_y=True, random_state=0
+                ).fit(X, y)
+                self.assert_matches(model, rng.normal(size=(10, 3)))
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for GPR predictor methods.
+
+    :return: Test suite for GPR predictor methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestGPRPredictorMethods("test_matches_deployed_model"))
+    s.addTest(TestGPRPredictorMethods("test_matches_kernels"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Runs tests for the import time report in benchmarks/import_time.py.
+"""
+
+import unittest
+
+from benchmarks.import_time import measure_import_time, parse_importtime
+
+SAMPLE_IMPORTTIME = """import time: self [us] | cumulative | imported package
+import time:       300 |        300 |   encodings.aliases
+import time:       200 |        500 | encodings
+import time:      1000 |       1000 |     numpy.core
+import time:      2000 |       3000 |   numpy
+import time:       500 |       3500 | util.tracing
+"""
+
+
+class TestImportTimeMethods(unittest.TestCase):
+    """Test case for import time methods."""
+
+    def test_parse_importtime(self) -> None:
+        """Tests that only the module's own imports are parsed."""
+        modules = parse_importtime(SAMPLE_IMPORTTIME, "util.tracing")
+        self.assertEqual(
+            modules, {"numpy.core": 1.0, "numpy": 3.0, "util.tracing": 3.5}
+        )
+        with self.assertRaises(ValueError):
+            parse_importtime(SAMPLE_IMPORTTIME, "deployment.api")
+
+    def test_entry_points_are_lazy(self) -> None:
+        """Tests that the entry points do not import heavy dependencies."""
+        heavy = {"pandas", "sklearn", "torch", "ultralytics"}
+        expected_absent = {
+            "deployment.edge_publisher": heavy,
+            "deployment.fog_subscriber": heavy | {"cv2"},
+            "deployment.api": heavy | {"numpy", "uvicorn"},
+        }
+        for module, absent in expected_absent.items():
+            packages = measure_import_time(module, repeats=1)["packages"]
+            self.assertFalse(absent & set(packages), module)
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for import time methods.
+
+    :return: Test suite for import time methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestImportTimeMethods("test_parse_importtime"))
+    s.addTest(TestImportTimeMethods("test_entry_points_are_lazy"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
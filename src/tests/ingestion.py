@@ -0,0 +1,162 @@
+"""Runs tests for the incremental ingestion in dataset/ingestion.py.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from dataset.build_dataframe import COLLECTOR_MANIFEST_FILENAME, get_collector_names
+from dataset.feature_store import build_feature_store, load_feature_table
+from dataset.ingestion import ingest_new_data
+from tests.feature_store import COLLECTORS, write_raw_data
+
+NEW_TIMESTAMPS = ["20240402093000", "20240402100000"]
+
+
+def append_population_counts(pop_count_csv_path: str) -> None:
+    """Appends the population counts of the new collection day.
+
+    :param pop_count_csv_path: Population count CSV path
+    :type pop_count_csv_path: str
+    """
+    with open(pop_count_csv_path, "a", encoding="utf-8") as f:
+        f.write("02/04/2024 09:30:00,23,\n")
+        f.write("02/04/2024 10:00:00,40,\n")
+
+
+def append_raw_data(
+    raw_data_path: str,
+    bbox_csv_path: str,
+    pop_count_csv_path: str,
+    population_counts: bool = True,
+) -> None:
+    """Appends a new collection day to the raw data from :func:`write_raw_data`.
+
+    :param raw_data_path: Raw data path
+    :type raw_data_path: str
+    :param bbox_csv_path: Bounding box CSV path
+    :type bbox_csv_path: str
+    :param pop_count_csv_path: Population count CSV path
+    :type pop_count_csv_path: str
+    :param population_counts: Also appends the population counts of the day,
+        defaults to True
+    :type population_counts: bool, optional
+    """
+    for device_idx, collector in enumerate(COLLECTORS):
+        collector_dir = os.path.join(raw_data_path, collector)
+        with open(
+            os.path.join(collector_dir, "wifi_signal_strength.csv"),
+            "a",
+            encoding="utf-8",
+        ) as f:
+            for i, timestamp in enumerate(NEW_TIMESTAMPS):
+                for ap in range(3):
+                    f.write(f"{timestamp},AA:{ap},SIT-POLY,{70 - 5 * ap + i}\n")
+        with open(
+            os.path.join(collector_dir, "btoutput.txt"), "a", encoding="utf-8"
+        ) as f:
+            for i, timestamp in enumerate(NEW_TIMESTAMPS):
+                for dev in range(2 * i + device_idx + 1):
+                    f.write(f"{timestamp} - [NEW] Device CC:{dev} name\n")
+
+    with open(bbox_csv_path, "a", encoding="utf-8") as f:
+        for device_idx, _ in enumerate(COLLECTORS):
+            for i, timestamp in enumerate(NEW_TIMESTAMPS):
+                f.write(f"{timestamp[:12]},{device_idx},{i + 7}\n")
+
+    if population_counts:
+        append_population_counts(pop_count_csv_path)
+
+
+class TestIngestionMethods(unittest.TestCase):
+    """Test case for incremental ingestion methods."""
+
+    def test_collector_manifest(self) -> None:
+        """Tests that collectors are discovered from the collector manifest."""
+        with tempfile.TemporaryDirectory() as raw_data_path:
+            self.assertEqual(
+                get_collector_names(raw_data_path),
+                ["bryan", "chris", "jiayu", "jurgen"],
+            )
+            with open(
+                os.path.join(raw_data_path, COLLECTOR_MANIFEST_FILENAME),
+                "w",
+                encoding="utf-8",
+            ) as f:
+                json.dump({"chris": 1, "bryan": 0}, f)
+            self.assertEqual(get_collector_names(raw_data_path), ["bryan", "chris"])
+
+    def test_matches_full_build(self) -> None:
+        """Tests that ingesting appended data matches a full build."""
+        with tempfile.TemporaryDirectory() as data_dir:
+            paths = write_raw_data(data_dir)
+            store_dir = os.path.join(data_dir, "store")
+            build_feature_store(*paths, store_dir, top_n_aps=2)
+            append_raw_data(*paths)
+
+            # The latest scan is held back until it is flushed.
+            self.assertEqual(
+                ingest_new_data(*paths, store_dir, top_n_aps=2), ["2024-04-02"]
+            )
+            self.assertEqual(len(load_feature_table(store_dir)), 4)
+            ingest_new_data(*paths, store_dir, top_n_aps=2, flush=True)
+            self.assertEqual(ingest_new_data(*paths, store_dir, top_n_aps=2), [])
+            ingested = load_feature_table(store_dir)
+
+            full_store_dir = os.path.join(data_dir, "full_store")
+            build_feature_store(*paths, full_store_dir, top_n_aps=2)
+            expected = load_feature_table(full_store_dir)
+
+            self.assertEqual(list(ingested.columns), list(expected.columns))
+            np.testing.assert_allclose(
+                ingested.drop(columns=["timestamp", "comment"]).to_numpy(float),
+                expected.drop(columns=["timestamp", "comment"]).to_numpy(float),
+            )
+
+    def test_late_population_counts(self) -> None:
+        """Tests that readings ingested before their day's population counts are
+        realigned to the counts once they arrive.
+        """
+        with tempfile.TemporaryDirectory() as data_dir:
+            paths = write_raw_data(data_dir)
+            store_dir = os.path.join(data_dir, "store")
+            build_feature_store(*paths, store_dir, top_n_aps=2)
+            append_raw_data(*paths, population_counts=False)
+            ingest_new_data(*paths, store_dir, top_n_aps=2, flush=True)
+            # Without counts, the new readings are aligned to the last count.
+            self.assertEqual(len(load_feature_table(store_dir)), 3)
+
+            append_population_counts(paths[2])
+            ingest_new_data(*paths, store_dir, top_n_aps=2, flush=True)
+            ingested = load_feature_table(store_dir)
+
+            full_store_dir = os.path.join(data_dir, "full_store")
+            build_feature_store(*paths, full_store_dir, top_n_aps=2)
+            expected = load_feature_table(full_store_dir)
+
+            self.assertEqual(len(ingested), 5)
+            self.assertEqual(list(ingested.columns), list(expected.columns))
+            np.testing.assert_allclose(
+                ingested.drop(columns=["timestamp", "comment"]).to_numpy(float),
+                expected.drop(columns=["timestamp", "comment"]).to_numpy(float),
+            )
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for incremental ingestion methods.
+
+    :return: Test suite for incremental ingestion methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestIngestionMethods("test_collector_manifest"))
+    s.addTest(TestIngestionMethods("test_matches_full_build"))
+    s.addTest(TestIngestionMethods("test_late_population_counts"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
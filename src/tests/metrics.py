@@ -0,0 +1,128 @@
+"""Runs tests for the Prometheus metrics in util/metrics.py.
+"""
+
+import unittest
+import urllib.request
+
+from fastapi.testclient import TestClient
+
+from deployment import api
+from util.metrics import (
+    CONTENT_TYPE,
+    Counter,
+    Gauge,
+    Histogram,
+    Metric,
+    Registry,
+    start_metrics_server,
+)
+
+
+class TestMetricsMethods(unittest.TestCase):
+    """Test case for metrics methods."""
+
+    def test_exposition_format(self) -> None:
+        """Tests the rendering of each metric type."""
+        registry = Registry()
+        counter = Counter("messages_total", "Messages.", ("device",), registry)
+        gauge = Gauge("queue_depth", "Queue depth.", registry=registry)
+        histogram = Histogram(
+            "latency_seconds", "Latency.", buckets=(0.1, 1.0), registry=registry
+        )
+        counter.labels(device='a"b').inc()
+        counter.labels(device=1).inc(2)
+        gauge.inc(3)
+        gauge.dec()
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        lines = registry.render().splitlines()
+        self.assertIn("# TYPE messages_total counter", lines)
+        self.assertIn('messages_total{device="1"} 2.0', lines)
+        self.assertIn('messages_total{device="a\\"b"} 1.0', lines)
+        self.assertIn("queue_depth 2.0", lines)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 2.0', lines)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 3.0', lines)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 4.0', lines)
+        self.assertIn("latency_seconds_sum 2.65", lines)
+        self.assertIn("latency_seconds_count 4.0", lines)
+        with self.assertRaises(ValueError):
+            Counter("messages_total", "Duplicate.", registry=registry)
+
+    def test_incomplete_metric(self) -> None:
+        """Tests that a metric type without its series and samples cannot be
+        created, nor registered.
+        """
+        registry = Registry()
+
+        class Summary(Metric):
+            """Metric type without its series and samples."""
+
+            metric_type = "summary"
+
+        with self.assertRaises(TypeError):
+            Summary("rpc_seconds", "RPC duration.", registry=registry)
+        with self.assertRaises(TypeError):
+            Metric("rpc_seconds", "RPC duration.", registry=registry)  # type: ignore
+        self.assertEqual(registry.render(), "")
+
+    def test_metrics_server(self) -> None:
+        """Tests serving a registry from a process without a web server."""
+        registry = Registry()
+        Counter("up_total", "Up.", registry=registry).inc()
+        server = start_metrics_server(0, host="127.0.0.1", registry=registry)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                self.assertEqual(response.headers["Content-Type"], CONTENT_TYPE)
+                self.assertIn("up_total 1.0", response.read().decode())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_api_metrics(self) -> None:
+        """Tests the request metrics per route template of the API."""
+        client = TestClient(api.app)
+        client.post(
+            "/api/update_crowd_status",
+            json={"status": 1, "timestamp": "2024-04-05T12:00:00"},
+        )
+        client.get("/api/get_crowd_status")
+        client.get("/api/unknown")
+
+        response = client.get("/metrics")
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        text = response.text
+        self.assertIn(
+            'crowd_api_requests_total{method="POST",'
+            'route="/api/update_crowd_status",status="200"}',
+            text,
+        )
+        self.assertIn(
+            'crowd_api_requests_total{method="GET",route="unmatched",status="404"}',
+            text,
+        )
+        self.assertIn(
+            'crowd_api_request_duration_seconds_count{method="GET",'
+            'route="/api/get_crowd_status"}',
+            text,
+        )
+        self.assertRegex(text, r"crowd_api_status_updates_total [1-9]")
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for metrics methods.
+
+    :return: Test suite for metrics methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestMetricsMethods("test_exposition_format"))
+    s.addTest(TestMetricsMethods("test_incomplete_metric"))
+    s.addTest(TestMetricsMethods("test_metrics_server"))
+    s.addTest(TestMetricsMethods("test_api_metrics"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""Runs tests for the model search in model_search.py.
+"""
+
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from sklearn.dummy import DummyRegressor
+from sklearn.linear_model import BayesianRidge
+
+import model_search
+
+
+def make_combined_tabular(top_n_aps: int, num_rows: int = 30) -> pd.DataFrame:
+    """Makes a combined table where the count only depends on the Bluetooth and
+    bounding box features, and the WiFi features are noise.
+
+    :param top_n_aps: Number of WiFi AP columns
+    :type top_n_aps: int
+    :param num_rows: Number of rows, defaults to 30
+    :type num_rows: int, optional
+    :return: Combined DataFrame as returned by :func:`merge_dfs`
+    :rtype: pd.DataFrame
+    """
+    rng = np.random.default_rng(0)
+    bt = rng.integers(0, 50, num_rows)
+    bbox = rng.integers(0, 20, num_rows)
+    combined_tabular = pd.DataFrame(
+        {
+            "timestamp": pd.date_range("2024-03-01", periods=num_rows, freq="min"),
+            **{
+                f"('signal_strength', 0, {ap})": rng.normal(size=num_rows)
+                for ap in range(1, top_n_aps + 1)
+            },
+            "('bt_device_count', 0)": bt,
+            "('bbox_count', 0)": bbox,
+            "count": 2 * bt + 3 * bbox,
+            "comment": "",
+        }
+    )
+    return combined_tabular
+
+
+class TestModelSearchMethods(unittest.TestCase):
+    """Test case for model search methods."""
+
+    def test_run_search(self) -> None:
+        """Tests that losing trials are pruned after the first fold, that the
+        subsets without WiFi are evaluated once per model and that the
+        leaderboard is sorted by score, then latency.
+        """
+        combined_tabulars = {n: make_combined_tabular(n) for n in (2, 3)}
+        models = {"linear": BayesianRidge(), "mean": DummyRegressor()}
+        evaluate_fold = mock.Mock(wraps=model_search._evaluate_fold)
+        with mock.patch.dict(model_search.MODELS, models, clear=True), mock.patch(
+            "model_search._evaluate_fold", evaluate_fold
+        ):
+            leaderboard = model_search.run_search(
+                combined_tabulars, n_splits=3, latency_repeats=2
+            )
+
+        # Two models with the WiFi subsets for each top N and the others once.
+        self.assertEqual(len(leaderboard), 2 * (2 * 2 + 2))
+        self.assertTrue(
+            leaderboard.loc[leaderboard["features"] == "bt", "top_n_aps"].isna().all()
+        )
+        self.assertEqual(
+            sorted(leaderboard.loc[leaderboard["features"] == "wifi", "top_n_aps"]),
+            [2, 2, 3, 3],
+        )
+
+        # Only the linear model on the Bluetooth features is within the margin
+        # of the linear model on all features after the first fold.
+        pruned = leaderboard[leaderboard["pruned"]]
+        self.assertEqual(
+            set(zip(pruned["model"], pruned["features"])),
+            {
+                ("mean", "wifi"),
+                ("mean", "bt"),
+                ("mean", "bbox"),
+                ("mean", "combined"),
+                ("linear", "wifi"),
+                ("linear", "bbox"),
+            },
+        )
+        self.assertTrue((pruned["folds"] == 1).all())
+        self.assertTrue((leaderboard.loc[~leaderboard["pruned"], "folds"] == 3).all())
+        self.assertEqual(evaluate_fold.call_count, leaderboard["folds"].sum())
+        best = leaderboard.iloc[0]
+        self.assertEqual((best["model"], best["features"]), ("linear", "combined"))
+
+        ranks = list(zip(-leaderboard["score"], leaderboard["latency_ms"]))
+        self.assertEqual(ranks, sorted(ranks))
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for model search methods.
+
+    :return: Test suite for model search methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestModelSearchMethods("test_run_search"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+"""Runs tests for the ONNX people detector helpers in util/people_detection.py.
+"""
+
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from util.people_detection import (
+    OnnxPersonDetector,
+    detect_people_boxes,
+    get_tiles,
+    letterbox,
+    make_roi_mask,
+    merge_tile_boxes,
+    postprocess_person_output,
+)
+
+
+class TestPeopleDetectionMethods(unittest.TestCase):
+    """Test case for people detection methods."""
+
+    def test_letterbox(self) -> None:
+        """Tests that the letterboxed image keeps its aspect ratio."""
+        image = np.zeros((480, 640, 3), dtype=np.uint8)
+        blob, scale, pad = letterbox(image, 320)
+        self.assertEqual(blob.shape, (1, 3, 320, 320))
+        self.assertEqual(scale, 0.5)
+        self.assertEqual(pad, (0, 40))
+
+    def test_postprocess_person_output(self) -> None:
+        """Tests that only confident, non-overlapping person boxes are kept."""
+        # Columns: two overlapping people, a separate person, a low confidence
+        # person and a confident non-person.
+        output = np.array(
+            [
+                [
+                    [100, 102, 200, 250, 250],  # cx
+                    [100, 100, 140, 100, 100],  # cy
+                    [40, 40, 40, 40, 40],  # w
+                    [80, 80, 80, 80, 80],  # h
+                    [0.9, 0.8, 0.7, 0.1, 0.0],  # person
+                    [0.0, 0.0, 0.0, 0.0, 0.9],  # another class
+                ]
+            ],
+            dtype=np.float32,
+        )
+        boxes = postprocess_person_output(output, scale=0.5, pad=(0, 40))
+        self.assertEqual(len(boxes), 2)
+        np.testing.assert_allclose(boxes[0], [160, 40, 240, 200, 0.9], rtol=1e-6)
+
+    def test_postprocess_empty_output(self) -> None:
+        """Tests that an image without people has no boxes."""
+        output = np.zeros((1, 84, 10), dtype=np.float32)
+        boxes = postprocess_person_output(output, scale=1.0, pad=(0, 0))
+        self.assertEqual(boxes.shape, (0, 5))
+
+    def test_get_tiles(self) -> None:
+        """Tests that the tiles cover the image and skip masked-out regions."""
+        tiles = get_tiles((480, 640, 3), 320, overlap=0.2)
+        covered = np.zeros((480, 640), dtype=bool)
+        for x1, y1, x2, y2 in tiles:
+            self.assertEqual((x2 - x1, y2 - y1), (320, 320))
+            covered[y1:y2, x1:x2] = True
+        self.assertTrue(covered.all())
+
+        # Only the bottom half of the image is in the ROI.
+        mask = make_roi_mask(
+            (480, 640), [np.array([[0, 0.7], [1, 0.7], [1, 1], [0, 1]])]
+        )
+        masked_tiles = get_tiles((480, 640, 3), 200, overlap=0.2, mask=mask)
+        self.assertLess(len(masked_tiles), len(get_tiles((480, 640, 3), 200)))
+        self.assertTrue(all(y2 > 0.7 * 480 for _, _, _, y2 in masked_tiles))
+
+    def test_merge_tile_boxes(self) -> None:
+        """Tests that a person cut by a tile border is only counted once."""
+        boxes = np.array(
+            [
+                [100, 100, 140, 200, 0.9],  # Full box from one tile.
+                [100, 100, 140, 150, 0.6],  # Top half from the other tile.
+                [300, 100, 340, 200, 0.8],
+            ]
+        )
+        merged = merge_tile_boxes(boxes)
+        np.testing.assert_array_equal(merged, boxes[[0, 2]])
+
+    def test_detect_people_boxes_roi(self) -> None:
+        """Tests that people standing outside the ROI are not counted."""
+        image = np.zeros((480, 640, 3), dtype=np.uint8)
+        mask = make_roi_mask(
+            (480, 640), [np.array([[0.5, 0], [1, 0], [1, 1], [0.5, 1]])]
+        )
+
+        def fake_detect_batch(crops, *_):
+            # One person on the left and one on the right of the full image.
+            self.assertEqual(crops[0].shape, (480, 320, 3))
+            return [np.array([[-300, 100, -260, 200, 0.9], [20, 100, 60, 200, 0.9]])]
+
+        with mock.patch("util.people_detection._detect_batch", fake_detect_batch):
+            boxes = detect_people_boxes(image, "onnx", "", 640, roi_mask=mask)
+        np.testing.assert_array_equal(boxes, [[340, 100, 380, 200, 0.9]])
+
+    def test_detect_batch_fixed_size(self) -> None:
+        """Tests that tiles are detected one at a time by a model exported with
+        a fixed batch size, and in one forward pass by a dynamic one.
+        """
+
+        class FakeNet:
+            """OpenCV network with one person in the centre of each image."""
+
+            # pylint: disable=invalid-name
+
+            def __init__(self, batch_size: int):
+                self.batch_size = batch_size
+                self.inputs: list[tuple[int, ...]] = []
+                self.blob = np.zeros(0)
+
+            def setPreferableBackend(self, _) -> None:
+                """Does nothing."""
+
+            def setPreferableTarget(self, _) -> None:
+                """Does nothing."""
+
+            def setInput(self, blob: np.ndarray) -> None:
+                """Keeps the input."""
+                self.blob = blob
+                self.inputs.append(blob.shape)
+
+            def forward(self) -> np.ndarray:
+                """Outputs a person per image, fails on a larger batch."""
+                if self.batch_size and len(self.blob) != self.batch_size:
+                    raise cv2.error("Inconsistent shape for the reshape layer")
+                output = np.zeros((len(self.blob), 84, 1), dtype=np.float32)
+                output[:, :5, 0] = [160, 160, 40, 80, 0.9]
+                return output
+
+        tiles = [np.zeros((320, 320, 3), dtype=np.uint8)] * 3
+        expected = [np.array([[140, 120, 180, 200, 0.9]])] * 3
+        for batch_size, inputs in (
+            (1, [(3, 3, 320, 320)] + [(1, 3, 320, 320)] * 6),
+            (0, [(3, 3, 320, 320)] * 2),
+        ):
+            net = FakeNet(batch_size)
+            with mock.patch.object(cv2.dnn, "readNetFromONNX", return_value=net):
+                detector = OnnxPersonDetector("model.onnx", imgsz=320)
+            for _ in range(2):
+                boxes = detector.detect_batch(tiles)
+                for image_boxes, expected_boxes in zip(boxes, expected):
+                    np.testing.assert_allclose(image_boxes, expected_boxes, rtol=1e-6)
+            # The fixed batch size is only tried once.
+            self.assertEqual(net.inputs, inputs)
+            self.assertEqual(detector.dynamic_batch, not batch_size)
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for people detection methods.
+
+    :return: Test suite for people detection methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestPeopleDetectionMethods("test_letterbox"))
+    s.addTest(TestPeopleDetectionMethods("test_postprocess_person_output"))
+    s.addTest(TestPeopleDetectionMethods("test_postprocess_empty_output"))
+    s.addTest(TestPeopleDetectionMethods("test_get_tiles"))
+    s.addTest(TestPeopleDetectionMethods("test_merge_tile_boxes"))
+    s.addTest(TestPeopleDetectionMethods("test_detect_people_boxes_roi"))
+    s.addTest(TestPeopleDetectionMethods("test_detect_batch_fixed_size"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""Runs tests for the synthetic edge fleet in benchmarks/pipeline.py.
+"""
+
+import json
+import unittest
+
+from benchmarks.pipeline import make_fleet_payloads, run_fleet
+from deployment.config import TOP_N_APS, TOTAL_DEVICES
+
+
+class TestPipelineBenchmarkMethods(unittest.TestCase):
+    """Test case for pipeline benchmark methods."""
+
+    def test_fleet_payloads(self) -> None:
+        """Tests that virtual devices wrap around the model's device slots."""
+        fleet = make_fleet_payloads(TOTAL_DEVICES + 2)
+        self.assertEqual(len(fleet), TOTAL_DEVICES + 2)
+        self.assertEqual(fleet[TOTAL_DEVICES + 1][0]["device_id"], 1)
+        for payload in fleet[0]:
+            self.assertEqual(len(payload["wifi_strength"]), TOP_N_APS)
+            self.assertIsInstance(payload["image"], int)
+            self.assertFalse(payload["return_image"])
+
+    def test_run_fleet(self) -> None:
+        """Tests the send rate and the traces of the messages."""
+        messages = []
+        sent = run_fleet(make_fleet_payloads(2), 20, 0.5, messages.append)
+        self.assertEqual(sent, 20)
+        self.assertEqual(len(messages), sent)
+
+        decoded = [json.loads(message) for message in messages]
+        self.assertEqual([m["trace"]["device_id"] for m in decoded[:4]], [0, 1] * 2)
+        self.assertEqual(len({m["trace"]["trace_id"] for m in decoded}), sent)
+        self.assertTrue(all(m["trace"]["sent_at"] is not None for m in decoded))
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for pipeline benchmark methods.
+
+    :return: Test suite for pipeline benchmark methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestPipelineBenchmarkMethods("test_fleet_payloads"))
+    s.addTest(TestPipelineBenchmarkMethods("test_run_fleet"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
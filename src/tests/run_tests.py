@@ -2,16 +2,79 @@
 
 import unittest
 
-from tests import data_collection, fog_inference
+from tests import (
+    api_batch,
+    api_state,
+    crowd_filter,
+    dashboard,
+    data_collection,
+    data_prep_benchmark,
+    dedup,
+    detection_cache,
+    feature_store,
+    fog_inference,
+    fog_scale_out,
+    frame_ring,
+    gpr_predictor,
+    import_time,
+    ingestion,
+    metrics,
+    model_search,
+    people_detection,
+    pipeline_benchmark,
+    tiered_counting,
+    tracing,
+    train_and_score,
+)
 
 
 def main():
     """Main function to run all tests in the tests directory."""
+    api_batch_suite = api_batch.suite()
+    api_state_suite = api_state.suite()
+    crowd_filter_suite = crowd_filter.suite()
+    dashboard_suite = dashboard.suite()
     data_collection_suite = data_collection.suite()
+    data_prep_benchmark_suite = data_prep_benchmark.suite()
+    dedup_suite = dedup.suite()
+    detection_cache_suite = detection_cache.suite()
+    feature_store_suite = feature_store.suite()
     fog_inference_suite = fog_inference.suite()
+    fog_scale_out_suite = fog_scale_out.suite()
+    frame_ring_suite = frame_ring.suite()
+    gpr_predictor_suite = gpr_predictor.suite()
+    import_time_suite = import_time.suite()
+    ingestion_suite = ingestion.suite()
+    metrics_suite = metrics.suite()
+    model_search_suite = model_search.suite()
+    people_detection_suite = people_detection.suite()
+    pipeline_benchmark_suite = pipeline_benchmark.suite()
+    tiered_counting_suite = tiered_counting.suite()
+    tracing_suite = tracing.suite()
+    train_and_score_suite = train_and_score.suite()
     runner = unittest.TextTestRunner()
+    runner.run(api_batch_suite)
+    runner.run(api_state_suite)
+    runner.run(crowd_filter_suite)
+    runner.run(dashboard_suite)
     runner.run(data_collection_suite)
+    runner.run(data_prep_benchmark_suite)
+    runner.run(dedup_suite)
+    runner.run(detection_cache_suite)
+    runner.run(feature_store_suite)
     runner.run(fog_inference_suite)
+    runner.run(fog_scale_out_suite)
+    runner.run(frame_ring_suite)
+    runner.run(gpr_predictor_suite)
+    runner.run(import_time_suite)
+    runner.run(ingestion_suite)
+    runner.run(metrics_suite)
+    runner.run(model_search_suite)
+    runner.run(people_detection_suite)
+    runner.run(pipeline_benchmark_suite)
+    runner.run(tiered_counting_suite)
+    runner.run(tracing_suite)
+    runner.run(train_and_score_suite)
 
 
 if __name__ == "__main__":
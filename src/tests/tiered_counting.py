@@ -0,0 +1,95 @@
+"""Runs tests for the tiered people counter in util/tiered_counting.py.
+"""
+
+import unittest
+
+import numpy as np
+
+from util.tiered_counting import TieredPeopleCounter
+
+PERSON_SIZE = (60, 30)
+
+
+class TestTieredCountingMethods(unittest.TestCase):
+    """Test case for tiered counting methods."""
+
+    def setUp(self) -> None:
+        self.rng = np.random.default_rng(0)
+        self.background = self.rng.integers(60, 120, (480, 640, 3), dtype=np.uint8)
+        self.full_counts = []
+
+    def make_frame(self, count: int) -> np.ndarray:
+        """Draws ``count`` bright people at random positions on the background.
+
+        :param count: Number of people
+        :type count: int
+        :return: BGR frame
+        :rtype: np.ndarray
+        """
+        frame = self.background.copy()
+        height, width = PERSON_SIZE
+        for _ in range(count):
+            x = self.rng.integers(0, frame.shape[1] - width)
+            y = self.rng.integers(0, frame.shape[0] - height)
+            frame[y : y + height, x : x + width] = self.rng.integers(200, 255)
+        return frame
+
+    def make_counter(self, true_count: list[int]) -> TieredPeopleCounter:
+        """Creates a counter whose full counter returns the true count.
+
+        :param true_count: Single element list holding the current true count
+        :type true_count: list[int]
+        :return: Counter with a learnt background
+        :rtype: TieredPeopleCounter
+        """
+
+        def count_fn(_) -> int:
+            self.full_counts.append(true_count[0])
+            return true_count[0]
+
+        counter = TieredPeopleCounter(count_fn, yolo_interval=5)
+        for _ in range(20):
+            counter.foreground_ratio(self.background)
+        return counter
+
+    def test_bounded_error(self) -> None:
+        """Tests that most cycles skip the full counter with a small error."""
+        counts = np.clip(10 + np.cumsum(self.rng.normal(0, 0.7, 80)), 0, 30)
+        true_count = [0]
+        counter = self.make_counter(true_count)
+
+        errors = []
+        for count in np.round(counts).astype(int):
+            true_count[0] = count
+            errors.append(abs(counter.count(self.make_frame(count)) - count))
+
+        self.assertLessEqual(len(self.full_counts), len(counts) // 3)
+        self.assertLess(np.mean(errors), 1.5)
+
+    def test_sharp_shift_runs_full(self) -> None:
+        """Tests that a sudden crowd change triggers the full counter."""
+        true_count = [5]
+        counter = self.make_counter(true_count)
+        counter.count(self.make_frame(5))
+        counter.count(self.make_frame(5))
+        self.assertFalse(counter.last_was_full)
+
+        true_count[0] = 25
+        self.assertEqual(counter.count(self.make_frame(25)), 25)
+        self.assertTrue(counter.last_was_full)
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for tiered counting methods.
+
+    :return: Test suite for tiered counting methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestTieredCountingMethods("test_bounded_error"))
+    s.addTest(TestTieredCountingMethods("test_sharp_shift_runs_full"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""Runs tests for the latency tracing in util/tracing.py.
+"""
+
+import asyncio
+import json
+import time
+import unittest
+
+from deployment import api
+from util.tracing import LatencyRecorder, mark_received, mark_sent, new_trace, span
+
+
+class TestTracingMethods(unittest.TestCase):
+    """Test case for tracing methods."""
+
+    def test_trace_hops(self) -> None:
+        """Tests that the spans survive serialisation between hosts."""
+        trace = new_trace(2)
+        with span(trace, "acquisition"):
+            time.sleep(0.01)
+        payload = json.dumps({"trace": mark_sent(trace)})
+
+        received = json.loads(payload)["trace"]
+        mark_received(received, "transport")
+        mark_received(received, "transport")  # Only counted once per send.
+
+        stages = [trace_span["stage"] for trace_span in received["spans"]]
+        self.assertEqual(stages, ["acquisition", "transport"])
+        self.assertGreaterEqual(received["spans"][0]["duration"], 0.01)
+
+    def test_latency_summary(self) -> None:
+        """Tests the percentiles per stage and device."""
+        recorder = LatencyRecorder()
+        for device_id in range(2):
+            for i in range(100):
+                trace = new_trace(device_id)
+                trace["spans"].append(
+                    {"stage": "inference", "start": 0.0, "duration": (i + 1) / 100}
+                )
+                recorder.record(trace)
+
+        summary = recorder.summary()
+        self.assertEqual(set(summary), {"end_to_end", "inference"})
+        self.assertEqual(summary["inference"]["all"]["count"], 200)
+        self.assertAlmostEqual(summary["inference"]["0"]["p50"], 0.505)
+        self.assertAlmostEqual(summary["inference"]["1"]["p99"], 0.9901)
+        self.assertEqual(set(recorder.summary(1)["inference"]), {"1", "all"})
+
+    def test_api_records_traces(self) -> None:
+        """Tests that the API appends its spans and exposes the latencies."""
+        api.latency_recorder = LatencyRecorder()
+        trace = new_trace(0)
+        asyncio.run(
+            api.update_crowd_status(
+                api.CrowdStatusUpdate(
+                    status=42,
+                    err=1.5,
+                    timestamp="2024-04-05T12:00:00+00:00",
+                    trace=mark_sent(trace),
+                )
+            )
+        )
+        asyncio.run(
+            api.update_crowd_status(
+                api.CrowdStatusUpdate(status=43, timestamp="2024-04-05T12:01:00")
+            )
+        )
+
+        self.assertEqual(api.get_snapshot().status["status"], 43.0)
+        metrics = asyncio.run(api.get_latency_metrics())
+        self.assertEqual(set(metrics), {"api_update", "end_to_end", "fog_to_api"})
+        self.assertEqual(metrics["end_to_end"]["0"]["count"], 1)
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for tracing methods.
+
+    :return: Test suite for tracing methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestTracingMethods("test_trace_hops"))
+    s.addTest(TestTracingMethods("test_latency_summary"))
+    s.addTest(TestTracingMethods("test_api_records_traces"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
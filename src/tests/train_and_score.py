@@ -0,0 +1,162 @@
+"""Runs tests for the cross-validation and crowd models in train_and_score.py.
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+from sklearn.model_selection import KFold, cross_validate
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from tests.model_search import make_combined_tabular
+from train_and_score import (
+    MODEL_BACKENDS,
+    cross_validate_parallel,
+    make_crowd_model,
+    train_and_save_model,
+    train_and_score_tabular1,
+    train_and_score_tabular2,
+)
+from util.gpr_predictor import PREDICTOR_FILENAME
+from util.model_artifact import load_model_artifact
+
+
+def make_tabular(num_rows: int = 40) -> tuple[pd.DataFrame, pd.Series]:
+    """Makes a small table of noisy linear features and counts.
+
+    :param num_rows: Number of rows, defaults to 40
+    :type num_rows: int, optional
+    :return: Features and counts
+    :rtype: tuple[pd.DataFrame, pd.Series]
+    """
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(num_rows, 4)), columns=list("abcd"))
+    y = pd.Series(X.to_numpy() @ [3, -2, 1, 0] + rng.normal(size=num_rows))
+    return X, y
+
+
+class TestTrainAndScoreMethods(unittest.TestCase):
+    """Test case for train and score methods."""
+
+    def test_cross_validate_parallel(self) -> None:
+        """Tests that the folds score as in a serial cross-validation."""
+        X, y = make_tabular()
+        kf = KFold(n_splits=4, shuffle=True, random_state=0)
+        expected = cross_validate(
+            make_pipeline(StandardScaler(), LinearRegression()), X, y, cv=kf
+        )["test_score"]
+        for n_jobs in (1, 2):
+            np.testing.assert_allclose(
+                train_and_score_tabular1(X, y, kf, n_jobs=n_jobs), expected
+            )
+
+        results = cross_validate_parallel(
+            LinearRegression(), X.to_numpy(), y.to_numpy(), list(kf.split(X)), 2
+        )
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result["fit_time"] >= 0 for result in results))
+
+    def test_cross_validate_by_timestamp(self) -> None:
+        """Tests that timestamp folds score as when filtering the rows per fold,
+        and that misaligned features and targets are rejected.
+        """
+        X, y = make_tabular()
+        X["binned_timestamp"] = np.arange(len(X)) // 4
+        Y = pd.DataFrame({"count": y, "binned_timestamp": X["binned_timestamp"]})
+        timestamps = pd.Series(np.unique(X["binned_timestamp"]))
+        kf = KFold(n_splits=5)
+
+        expected = []
+        for train_idx, test_idx in kf.split(timestamps):
+            train = X["binned_timestamp"].isin(timestamps[train_idx])
+            test = X["binned_timestamp"].isin(timestamps[test_idx])
+            model = make_pipeline(StandardScaler(), LinearRegression())
+            model.fit(X.loc[train].drop(columns="binned_timestamp"), y[train])
+            expected.append(
+                model.score(X.loc[test].drop(columns="binned_timestamp"), y[test])
+            )
+        for n_jobs in (1, 2):
+            np.testing.assert_allclose(
+                train_and_score_tabular2(X, Y, kf, timestamps, n_jobs=n_jobs),
+                expected,
+            )
+
+        with self.assertRaises(ValueError):
+            train_and_score_tabular2(X, Y.iloc[::-1], kf, timestamps)
+
+    def test_model_backends(self) -> None:
+        """Tests that every backend predicts a mean and a positive standard
+        deviation per row, as the fog expects.
+        """
+        X, y = make_tabular()
+        for backend in MODEL_BACKENDS:
+            model = make_crowd_model(backend, n_components=10)
+            model.fit(X.to_numpy()[:30], y.to_numpy()[:30])  # type: ignore
+            mean, std = model.predict(  # type: ignore
+                X.to_numpy()[30:], return_std=True
+            )
+            self.assertEqual(mean.shape, (10,))
+            self.assertEqual(std.shape, (10,))
+            self.assertTrue((std > 0).all())
+            self.assertGreater(model.score(X[30:], y[30:]), 0.5)  # type: ignore
+
+        with self.assertRaises(ValueError):
+            make_crowd_model("svm")
+
+    def test_save_approximate_model(self) -> None:
+        """Tests that an approximate backend is saved as an artifact that loads
+        back, without the exported predictor of the exact GPR.
+        """
+        combined_tabular = make_combined_tabular(2)
+        features = combined_tabular.drop(columns=["timestamp", "count", "comment"])
+        with tempfile.TemporaryDirectory() as model_out_dir:
+            train_and_save_model(combined_tabular, 2, model_out_dir, "gpr")
+            artifact_dir = os.path.join(model_out_dir, "gpr")
+            self.assertTrue(
+                os.path.exists(os.path.join(artifact_dir, PREDICTOR_FILENAME))
+            )
+
+            train_and_save_model(
+                combined_tabular, 2, model_out_dir, "nystroem", n_components=10
+            )
+            model, manifest = load_model_artifact(artifact_dir)
+            self.assertFalse(
+                os.path.exists(os.path.join(artifact_dir, PREDICTOR_FILENAME))
+            )
+            self.assertTrue(manifest["model_class"].endswith("Pipeline"))
+            self.assertEqual(manifest["feature_layout"]["n_features"], 4)
+            self.assertEqual(manifest["metrics"]["train_size"], 14)
+            X = features.to_numpy()
+            mean, std = model.predict(X, return_std=True)
+            self.assertTrue((std > 0).all())
+
+            # Fitted on the rows before the koufu rows, as train_and_save_model.
+            expected = make_crowd_model("nystroem", n_components=10)
+            expected.fit(X[:14], combined_tabular["count"][:14])  # type: ignore
+            expected_mean, expected_std = expected.predict(  # type: ignore
+                X, return_std=True
+            )
+            np.testing.assert_allclose(mean, expected_mean)
+            np.testing.assert_allclose(std, expected_std)
+
+
+def suite() -> unittest.TestSuite:
+    """Returns a test suite for train and score methods.
+
+    :return: Test suite for train and score methods
+    :rtype: unittest.TestSuite
+    """
+    s = unittest.TestSuite()
+    s.addTest(TestTrainAndScoreMethods("test_cross_validate_parallel"))
+    s.addTest(TestTrainAndScoreMethods("test_cross_validate_by_timestamp"))
+    s.addTest(TestTrainAndScoreMethods("test_model_backends"))
+    s.addTest(TestTrainAndScoreMethods("test_save_approximate_model"))
+    return s
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,35 +3,190 @@
 
 import argparse
 import os
-import pickle
+import tempfile
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Optional, TypedDict
 
+import joblib
 import numpy as np
 import pandas as pd
-from sklearn.base import RegressorMixin
+from sklearn.base import RegressorMixin, clone
 from sklearn.gaussian_process import GaussianProcessRegressor
-from sklearn.gaussian_process.kernels import RBF, DotProduct, WhiteKernel
-from sklearn.linear_model import LinearRegression
+from sklearn.gaussian_process.kernels import RBF, DotProduct, Kernel, WhiteKernel
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.linear_model import BayesianRidge, LinearRegression
 from sklearn.model_selection import KFold
-from sklearn.pipeline import make_pipeline
-from sklearn.preprocessing import StandardScaler
+from sklearn.pipeline import make_pipeline, make_union
+from sklearn.preprocessing import FunctionTransformer, StandardScaler
 
 from dataset.build_dataframe import (
+    align_to_reference_timestamps,
     get_bbox_df,
     get_bluetooth_dataframe,
-    get_nearest_timestamp,
     get_population_count_df,
     get_top_N_wifi_aps_only,
     get_wifi_dataframe,
     merge_dfs,
     pivot_tables,
 )
+from dataset.feature_store import build_feature_store, load_feature_table
 from deployment.config import TOP_N_APS
+from util.gpr_predictor import PREDICTOR_FILENAME, export_gpr_predictor
+from util.model_artifact import FeatureLayout, save_model_artifact
+
+
+#: Crowd model backends, see :func:`make_crowd_model`.
+MODEL_BACKENDS = ("gpr", "nystroem", "rff")
+
+#: Cross-validation folds of the training rows in :func:`train_and_save_model`.
+CV_SPLITS = 5
+
+
+def make_crowd_model(
+    backend: str = "gpr",
+    n_components: int = 100,
+    random_state: int = 42,
+    kernel: Optional[Kernel] = None,
+) -> RegressorMixin:
+    r"""Creates an unfitted crowd model. Every backend supports
+    ``predict(X, return_std=True)`` as used by :mod:`deployment.fog_subscriber`.
+
+    - ``gpr``: Exact Gaussian process with a
+      :math:`\text{DotProduct} + \text{RBF} + \text{White}` kernel.
+      Training is :math:`O(n^3)` and prediction :math:`O(n)` in the number of
+      training samples :math:`n`, and the pickle grows with :math:`n`.
+    - ``nystroem``: Bayesian linear regression on the standardised features
+      and a Nyström approximation of the RBF kernel with ``n_components``
+      inducing points.
+    - ``rff``: As ``nystroem``, with ``n_components`` random Fourier features.
+
+    The approximate backends train in :math:`O(n m^2)` and predict in
+    :math:`O(m^2)` for :math:`m` components, with a pickle size independent of
+    :math:`n`.
+
+    :param backend: One of :data:`MODEL_BACKENDS`, defaults to "gpr"
+    :type backend: str, optional
+    :param n_components: Number of kernel approximation components, defaults to 100
+    :type n_components: int, optional
+    :param random_state: Random state, defaults to 42
+    :type random_state: int, optional
+    :param kernel: Kernel of the ``gpr`` backend, defaults to None for
+        :math:`\text{DotProduct} + \text{RBF} + \text{White}`
+    :type kernel: Optional[Kernel], optional
+    :raises ValueError: If the backend is unknown
+    :return: Unfitted model
+    :rtype: RegressorMixin
+    """
+    if backend == "gpr":
+        return GaussianProcessRegressor(
+            kernel=(
+                kernel if kernel is not None else DotProduct() + RBF() + WhiteKernel()
+            ),
+            random_state=random_state,
+        )
+    if backend == "nystroem":
+        rbf_features = Nystroem(n_components=n_components, random_state=random_state)
+    elif backend == "rff":
+        rbf_features = RBFSampler(
+            gamma="scale", n_components=n_components, random_state=random_state
+        )
+    else:
+        raise ValueError(f"Unknown model backend: {backend}")
+
+    # The identity features play the role of the DotProduct kernel, and the
+    # noise precision learnt by BayesianRidge the role of the WhiteKernel.
+    return make_pipeline(
+        StandardScaler(),
+        make_union(FunctionTransformer(), rbf_features),
+        BayesianRidge(),
+    )
+
+
+class FoldResult(TypedDict):
+    """Result of fitting and scoring one cross-validation fold.
+
+    :param score: Score of the model on the test indices
+    :type score: float
+    :param fit_time: Wall time of fitting the model in seconds
+    :type fit_time: float
+    :param score_time: Wall time of scoring the model in seconds
+    :type score_time: float
+    """
+
+    score: float
+    fit_time: float
+    score_time: float
+
+
+def _fit_and_score_fold(
+    model: RegressorMixin,
+    X: np.ndarray,
+    y: np.ndarray,
+    train_index: np.ndarray,
+    test_index: np.ndarray,
+) -> FoldResult:
+    model = clone(model)
+    start = time.perf_counter()
+    model.fit(X[train_index], y[train_index])  # type: ignore
+    fit_end = time.perf_counter()
+    score = model.score(X[test_index], y[test_index])  # type: ignore
+    return FoldResult(
+        score=score,
+        fit_time=fit_end - start,
+        score_time=time.perf_counter() - fit_end,
+    )
+
+
+def cross_validate_parallel(
+    model: RegressorMixin,
+    X: np.ndarray,
+    y: np.ndarray,
+    folds: list[tuple[np.ndarray, np.ndarray]],
+    n_jobs: int = 1,
+) -> list[FoldResult]:
+    """Fits and scores a clone of the model on each fold in a process pool.
+
+    ``X`` and ``y`` are dumped once to memory-mapped files that the workers
+    open read-only, so they are not pickled for every fold.
+
+    :param model: Unfitted model, cloned for every fold
+    :type model: RegressorMixin
+    :param X: Input features
+    :type X: np.ndarray
+    :param y: Target variable
+    :type y: np.ndarray
+    :param folds: Precomputed train and test row indices of each fold
+    :type folds: list[tuple[np.ndarray, np.ndarray]]
+    :param n_jobs: Number of worker processes, -1 for all CPUs, defaults to 1
+    :type n_jobs: int, optional
+    :return: Result of each fold, in the order of ``folds``
+    :rtype: list[FoldResult]
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        X_path, y_path = os.path.join(tmp_dir, "X.pkl"), os.path.join(tmp_dir, "y.pkl")
+        joblib.dump(np.ascontiguousarray(X), X_path)
+        joblib.dump(np.ascontiguousarray(y), y_path)
+        X_mmap = joblib.load(X_path, mmap_mode="r")
+        y_mmap = joblib.load(y_path, mmap_mode="r")
+
+        results = joblib.Parallel(n_jobs=n_jobs)(
+            joblib.delayed(_fit_and_score_fold)(
+                model, X_mmap, y_mmap, train_index, test_index
+            )
+            for train_index, test_index in folds
+        )
+
+    for i, result in enumerate(results):  # type: ignore
+        print(
+            f"Fold {i}: score {result['score']:.4f}, "
+            f"fit {result['fit_time']:.3f}s, score {result['score_time']:.3f}s"
+        )
+    return results  # type: ignore
 
 
 def train_and_score_tabular1(
-    X: pd.DataFrame, y: pd.DataFrame, kf: KFold
+    X: pd.DataFrame, y: pd.DataFrame, kf: KFold, n_jobs: int = 1
 ) -> list[float]:
     """Train and score a linear regression model using tabular data.
 
@@ -41,21 +196,24 @@ def train_and_score_tabular1(
     :type y: pd.DataFrame
     :param kf: KFold object
     :type kf: KFold
+    :param n_jobs: Number of worker processes for the folds, defaults to 1
+    :type n_jobs: int, optional
     :return: List of scores
     :rtype: list[float]
     """
-    scores = []
-    for train_index, test_index in kf.split(X):
-        x_train, x_test = X.iloc[train_index], X.iloc[test_index]
-        y_train, y_test = y.iloc[train_index], y.iloc[test_index]
-        reg = make_pipeline(StandardScaler(), LinearRegression())
-        reg.fit(x_train, y_train)
-        scores.append(reg.score(x_test, y_test))
-    return scores
+    folds = list(kf.split(X))
+    results = cross_validate_parallel(
+        make_pipeline(StandardScaler(), LinearRegression()),
+        X.to_numpy(),
+        y.to_numpy(),
+        folds,
+        n_jobs=n_jobs,
+    )
+    return [result["score"] for result in results]
 
 
 def train_and_score_tabular2(
-    X: pd.DataFrame, Y: pd.DataFrame, kf: KFold, timestamps: pd.Series
+    X: pd.DataFrame, Y: pd.DataFrame, kf: KFold, timestamps: pd.Series, n_jobs: int = 1
 ) -> list[float]:
     """Trains and scores a linear regression model using tabular data.
 
@@ -67,30 +225,35 @@ def train_and_score_tabular2(
     :type kf: KFold
     :param timestamps: Timestamps for splitting the data
     :type timestamps: pd.Series
+    :param n_jobs: Number of worker processes for the folds, defaults to 1
+    :type n_jobs: int, optional
+    :raises ValueError: If the rows of X and Y do not have the same
+        ``binned_timestamp``, as the folds are mapped to the same row indices
     :return: List of scores
     :rtype: list[float]
     """
 
-    scores = []
-    for train_timestamp_idx, test_timestamp_idx in kf.split(timestamps):  # type: ignore
-        train_timestamp = timestamps[train_timestamp_idx]
-        test_timestamp = timestamps[test_timestamp_idx]
-        x_train, y_train = (
-            X.loc[X["binned_timestamp"].isin(train_timestamp)],
-            Y.loc[Y["binned_timestamp"].isin(train_timestamp)],
-        )
-        x_test, y_test = (
-            X.loc[X["binned_timestamp"].isin(test_timestamp)],
-            Y.loc[Y["binned_timestamp"].isin(test_timestamp)],
+    # Map the timestamp folds to row indices once instead of filtering per fold.
+    x_timestamps = X["binned_timestamp"].to_numpy()
+    y_timestamps = Y["binned_timestamp"].to_numpy()
+    if not np.array_equal(x_timestamps, y_timestamps):
+        raise ValueError("X and Y must be aligned on binned_timestamp.")
+    folds = [
+        (
+            np.flatnonzero(np.isin(x_timestamps, timestamps[train_timestamp_idx])),
+            np.flatnonzero(np.isin(x_timestamps, timestamps[test_timestamp_idx])),
         )
-        x_train.drop(columns="binned_timestamp", inplace=True)
-        x_test.drop(columns="binned_timestamp", inplace=True)
-        y_train.drop(columns="binned_timestamp", inplace=True)
-        y_test.drop(columns="binned_timestamp", inplace=True)
-        reg = make_pipeline(StandardScaler(), LinearRegression())
-        reg.fit(x_train, y_train)
-        scores.append(reg.score(x_test, y_test))
-    return scores
+        for train_timestamp_idx, test_timestamp_idx in kf.split(timestamps)  # type: ignore
+    ]
+
+    results = cross_validate_parallel(
+        make_pipeline(StandardScaler(), LinearRegression()),
+        X.drop(columns="binned_timestamp").to_numpy(),
+        Y.drop(columns="binned_timestamp").to_numpy(),
+        folds,
+        n_jobs=n_jobs,
+    )
+    return [result["score"] for result in results]
 
 
 def fit_model_with_koufu_as_test(
@@ -157,15 +320,97 @@ def load_data(
     population_count_df = get_population_count_df(pop_count_csv_path, pop_count_cols)
 
     for df in [wifi_df, bt_df, bbox_df]:
-        df["timestamp"] = df["timestamp"].apply(
-            lambda x: get_nearest_timestamp(x, population_count_df["timestamp"])
-        )
+        align_to_reference_timestamps(df, population_count_df["timestamp"])
 
     return wifi_df, bt_df, bbox_df, population_count_df
 
 
+def train_and_save_model(
+    combined_tabular: pd.DataFrame,
+    top_n_aps: int = TOP_N_APS,
+    model_out_dir: Optional[str | os.PathLike | Path] = None,
+    model_backend: str = "gpr",
+    n_components: int = 100,
+    n_jobs: int = 1,
+):
+    """Trains the crowd model on the combined features, with the koufu rows as
+    the test set, and saves it as an artifact with its scores, see
+    :mod:`util.model_artifact`. The mean score of a cross-validation on the
+    training rows is saved as ``cv_score``.
+
+    :param combined_tabular: Combined features with the timestamp, count and
+        comment columns, see :func:`merge_dfs`
+    :type combined_tabular: pd.DataFrame
+    :param top_n_aps: Top :math:`N` WiFi APs of the features, defaults to TOP_N_APS
+    :type top_n_aps: int, optional
+    :param model_out_dir: Directory to save the model, defaults to None for
+        ``src/deployment/models``
+    :type model_out_dir: Optional[str | os.PathLike | Path], optional
+    :param model_backend: Crowd model backend, see :func:`make_crowd_model`,
+        defaults to "gpr"
+    :type model_backend: str, optional
+    :param n_components: Kernel approximation components for the approximate
+        backends, defaults to 100
+    :type n_components: int, optional
+    :param n_jobs: Number of worker processes for the cross-validation folds,
+        -1 for all CPUs, defaults to 1
+    :type n_jobs: int, optional
+    """
+    # Set X and y
+    features = combined_tabular.drop(columns=["timestamp", "count", "comment"])
+    X = features.to_numpy()
+    y = combined_tabular["count"].to_numpy()
+
+    # Train the model
+    koufu_idx = min(14, len(X) - 1)
+    gpr = make_crowd_model(model_backend, n_components=n_components)
+    kf = KFold(n_splits=min(CV_SPLITS, koufu_idx), shuffle=True, random_state=42)
+    cv_results = cross_validate_parallel(
+        gpr, X[:koufu_idx], y[:koufu_idx], list(kf.split(X[:koufu_idx])), n_jobs
+    )
+    gpr = fit_model_with_koufu_as_test(gpr, X, y, koufu_idx)
+    metrics = {
+        "train_score": gpr.score(X[:koufu_idx], y[:koufu_idx]),  # type: ignore
+        "test_score": gpr.score(X[koufu_idx:], y[koufu_idx:]),  # type: ignore
+        "cv_score": np.mean([result["score"] for result in cv_results]),
+        "train_size": koufu_idx,
+        "test_size": len(X) - koufu_idx,
+    }
+
+    # Check the model output directory
+    if model_out_dir is None:
+        model_out_dir = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "deployment", "models")
+        )
+
+    # Create the directory if it does not exist
+    if not os.path.exists(model_out_dir):
+        os.makedirs(model_out_dir)
+
+    # Save the model with its feature layout, see util.model_artifact
+    feature_layout = FeatureLayout(
+        top_n_aps=top_n_aps,
+        total_devices=sum(
+            col.startswith("('bt_device_count'") for col in features.columns
+        ),
+        n_features=X.shape[1],
+        columns=[str(col) for col in features.columns],
+    )
+    artifact_dir = os.path.join(model_out_dir, "gpr")
+    save_model_artifact(gpr, artifact_dir, feature_layout, X, y, metrics)
+
+    # Export the closed-form predictor for the fog, see util.gpr_predictor
+    if isinstance(gpr, GaussianProcessRegressor):
+        export_gpr_predictor(gpr, os.path.join(artifact_dir, PREDICTOR_FILENAME))
+
+
 def main(
-    top_n_aps: int = TOP_N_APS, model_out_dir: Optional[str | os.PathLike | Path] = None
+    top_n_aps: int = TOP_N_APS,
+    model_out_dir: Optional[str | os.PathLike | Path] = None,
+    feature_store_dir: Optional[str | os.PathLike | Path] = None,
+    model_backend: str = "gpr",
+    n_components: int = 100,
+    n_jobs: int = 1,
 ):
     """Runs the main training and scoring pipeline.
 
@@ -173,53 +418,69 @@ def main(
     :type top_n_aps: int, optional
     :param model_out_dir: Directory to save the model, defaults to None
     :type model_out_dir: Optional[str | os.PathLike | Path], optional
+    :param feature_store_dir: Directory of the Parquet feature store, see
+        :mod:`dataset.feature_store`. Defaults to None to rebuild the features
+        from the raw data in memory.
+    :type feature_store_dir: Optional[str | os.PathLike | Path], optional
+    :param model_backend: Crowd model backend, see :func:`make_crowd_model`,
+        defaults to "gpr"
+    :type model_backend: str, optional
+    :param n_components: Kernel approximation components for the approximate
+        backends, defaults to 100
+    :type n_components: int, optional
+    :param n_jobs: Number of worker processes for the cross-validation folds,
+        -1 for all CPUs, defaults to 1
+    :type n_jobs: int, optional
     """
     # Set paths
     project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-    deployment_root = os.path.abspath(os.path.join(project_root, "src", "deployment"))
     raw_data_path = os.path.join(project_root, "data", "raw_data")
     bbox_csv_path = os.path.join(project_root, "data", "bbox_results.csv")
     pop_count_csv_path = os.path.join(project_root, "data", "manual_counts.csv")
 
-    # Get DataFrames
-    wifi_df, bt_df, bbox_df, population_count_df = load_data(
-        raw_data_path, bbox_csv_path, pop_count_csv_path
-    )
-
-    # Combined DataFrames into tabular format
-    top_n_wifi_aps = get_top_N_wifi_aps_only(wifi_df, top_n_aps)
-    wifi_tabular, bt_tabular, bbox_tabular = pivot_tables(
-        top_n_wifi_aps, bt_df, bbox_df
-    )
-    combined_tabular = merge_dfs(
-        wifi_tabular, bt_tabular, bbox_tabular, population_count_df
-    )
+    if feature_store_dir is not None:
+        # Only rebuild the partitions whose raw inputs changed.
+        build_feature_store(
+            raw_data_path,
+            bbox_csv_path,
+            pop_count_csv_path,
+            feature_store_dir,
+            top_n_aps=top_n_aps,
+        )
+        combined_tabular = load_feature_table(feature_store_dir)
+    else:
+        # Get DataFrames
+        wifi_df, bt_df, bbox_df, population_count_df = load_data(
+            raw_data_path, bbox_csv_path, pop_count_csv_path
+        )
 
-    # Set X and y
-    X = combined_tabular.drop(columns=["timestamp", "count", "comment"]).to_numpy()
-    y = combined_tabular["count"].to_numpy()
+        # Combined DataFrames into tabular format
+        top_n_wifi_aps = get_top_N_wifi_aps_only(wifi_df, top_n_aps)
+        wifi_tabular, bt_tabular, bbox_tabular = pivot_tables(
+            top_n_wifi_aps, bt_df, bbox_df
+        )
+        combined_tabular = merge_dfs(
+            wifi_tabular, bt_tabular, bbox_tabular, population_count_df
+        )
 
-    # Train the model
-    gpr = GaussianProcessRegressor(
-        kernel=(DotProduct() + RBF() + WhiteKernel()), random_state=42
+    train_and_save_model(
+        combined_tabular,
+        top_n_aps,
+        model_out_dir,
+        model_backend,
+        n_components,
+        n_jobs,
     )
-    gpr = fit_model_with_koufu_as_test(gpr, X, y)
-
-    # Check the model output directory
-    if model_out_dir is None:
-        model_out_dir = os.path.join(deployment_root, "models")
-
-    # Create the directory if it does not exist
-    if not os.path.exists(model_out_dir):
-        os.makedirs(model_out_dir)
-
-    # Pickle and dump the model
-    with open(os.path.join(model_out_dir, "gpr.pkl"), "wb") as f:
-        pickle.dump(gpr, f)
 
 
 if __name__ == "__main__":
     args = argparse.ArgumentParser()
     args.add_argument("--top_n_aps", type=int, default=TOP_N_APS)
     args.add_argument("--model_out_dir", type=str, default=None)
+    args.add_argument("--feature_store_dir", type=str, default=None)
+    args.add_argument(
+        "--model_backend", type=str, default="gpr", choices=MODEL_BACKENDS
+    )
+    args.add_argument("--n_components", type=int, default=100)
+    args.add_argument("--n_jobs", type=int, default=1)
     main(**vars(args.parse_args()))
@@ -12,6 +12,7 @@ import cv2
 def take_picture(
     output_dir: Optional[str | os.PathLike] = None,
     use_demo_data: bool = False,
+    out: Optional[cv2.typing.MatLike] = None,
     **kwargs,
 ) -> cv2.typing.MatLike:
     """Takes a picture using the webcam and saves it to the specified directory if provided.
@@ -20,6 +21,10 @@ def take_picture(
     :type output_dir: Optional[str | os.PathLike], optional
     :param use_demo_data: Whether to load demo data, defaults to False
     :type use_demo_data: bool, optional
+    :param out: Array to capture the picture into without copying it, e.g. a
+        slot of util.frame_ring.FrameRingBuffer. A new array is returned if the
+        picture does not have its shape. Defaults to None for a new array
+    :type out: Optional[cv2.typing.MatLike], optional
     :param ``**kwargs``: Keyword arguments for cv2.imread if use_demo_data is True
         (e.g., filename, flags)
     :raises exc: Any exception that occurs during the process
@@ -34,7 +39,7 @@ def take_picture(
 
     try:
         # Capture the picture
-        _, frame = camera.read()
+        _, frame = camera.read(out)
 
         if output_dir:
             timestamp = time.strftime("%Y%m%d%H%M")
@@ -65,6 +70,69 @@ def encode_image(frame: cv2.typing.MatLike) -> str:
     return img_bytes
 
 
+#: JPEG start of frame markers, which hold the image size.
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+#: Scale factors of cv2.imdecode's reduced modes, largest first.
+REDUCED_COLOR_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def get_jpeg_size(data: bytes | memoryview) -> Optional[tuple[int, int]]:
+    """Reads the size of a JPEG image from its headers without decoding it.
+
+    :param data: JPEG file contents
+    :type data: bytes | memoryview
+    :return: ``(width, height)``, None if the data is not a JPEG image
+    :rtype: Optional[tuple[int, int]]
+    """
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker.
+            i += 1
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            height = int.from_bytes(data[i + 5 : i + 7], "big")
+            width = int.from_bytes(data[i + 7 : i + 9], "big")
+            return width, height
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Markers without a payload.
+            i += 2
+            continue
+        i += 2 + int.from_bytes(data[i + 2 : i + 4], "big")
+    return None
+
+
+def get_decode_flag(data: bytes | memoryview, min_long_side: Optional[int]) -> int:
+    """Chooses the cv2.imdecode flag that decodes a JPEG image straight to the
+    smallest scale whose long side is still at least ``min_long_side``.
+
+    :param data: Encoded image
+    :type data: bytes | memoryview
+    :param min_long_side: Minimum long side of the decoded image, e.g. the
+        detector input size. None to decode at full resolution.
+    :type min_long_side: Optional[int]
+    :return: ``cv2.IMREAD_REDUCED_COLOR_{8,4,2}`` or ``cv2.IMREAD_COLOR``
+    :rtype: int
+    """
+    size = get_jpeg_size(data) if min_long_side else None
+    if size is None:
+        return cv2.IMREAD_COLOR
+    for factor, flag in REDUCED_COLOR_FLAGS:
+        if max(size) // factor >= min_long_side:  # type: ignore
+            return flag
+    return cv2.IMREAD_COLOR
+
+
 if __name__ == "__main__":
     OUTPUT_DIR = "images"
 
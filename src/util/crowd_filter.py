@@ -0,0 +1,150 @@
+"""Streaming smoothing and short-term forecasting of the crowd status.
+
+The fog's crowd model predicts each status from the latest readings alone, so
+the status jumps whenever any device reports. :class:`CrowdFilter` is a Kalman
+filter over the crowd level and its trend (a local linear trend model) that
+weighs each prediction by the model's own standard deviation, so that
+uncertain predictions move the smoothed status less. Its state is five floats,
+and forecasts extrapolate the trend with its growing uncertainty.
+"""
+
+import math
+from typing import Optional, Sequence, TypedDict
+
+#: Smallest measurement standard deviation, so that a (near) zero GPR standard
+#: deviation does not make the filter follow every prediction exactly.
+MIN_MEASUREMENT_STD = 1.0
+
+
+class CrowdForecast(TypedDict):
+    """Forecast of the crowd status.
+
+    :param horizon_minutes: Minutes ahead of the last prediction
+    :type horizon_minutes: int
+    :param status: Forecast number of people
+    :type status: float
+    :param err: Standard deviation of the forecast
+    :type err: float
+    """
+
+    horizon_minutes: int
+    status: float
+    err: float
+
+
+class CrowdFilter:
+    """Kalman filter of the crowd level and trend, see the module description.
+
+    :param level_noise: Variance the level drifts by per second, in people^2/s,
+        defaults to 1.0
+    :type level_noise: float, optional
+    :param trend_noise: Variance the trend drifts by per second, in
+        (people/s)^2/s, defaults to 1e-4
+    :type trend_noise: float, optional
+    :param default_std: Measurement standard deviation of predictions without
+        one (e.g. from models other than GPR), defaults to 10.0
+    :type default_std: float, optional
+    """
+
+    def __init__(
+        self,
+        level_noise: float = 1.0,
+        trend_noise: float = 1e-4,
+        default_std: float = 10.0,
+    ):
+        self.level_noise = level_noise
+        self.trend_noise = trend_noise
+        self.default_std = default_std
+
+        # Level (people), trend (people/s) and their covariance.
+        self.level = 0.0
+        self.trend = 0.0
+        self.p_level = 0.0
+        self.p_cross = 0.0
+        self.p_trend = 0.0
+        self.last_time: Optional[float] = None
+
+    def _predict(self, dt: float) -> None:
+        self.level += self.trend * dt
+        self.p_level += (
+            2 * dt * self.p_cross + dt**2 * self.p_trend + self.level_noise * dt
+        )
+        self.p_cross += dt * self.p_trend
+        self.p_trend += self.trend_noise * dt
+
+    def update(
+        self, measurement: float, std: Optional[float], t: float
+    ) -> tuple[float, float]:
+        """Adds a crowd model prediction.
+
+        :param measurement: Predicted number of people
+        :type measurement: float
+        :param std: Standard deviation of the prediction, None for default_std
+        :type std: Optional[float]
+        :param t: Time of the prediction in seconds
+        :type t: float
+        :return: Smoothed number of people and its standard deviation
+        :rtype: tuple[float, float]
+        """
+        std = self.default_std if std is None else max(std, MIN_MEASUREMENT_STD)
+        if self.last_time is None:
+            self.level = measurement
+            self.p_level = std**2
+            self.p_trend = self.trend_noise * 60.0
+            self.last_time = t
+            return self.level, std
+
+        # Predictions handled out of order are treated as simultaneous.
+        self._predict(max(0.0, t - self.last_time))
+        self.last_time = max(t, self.last_time)
+
+        innovation_var = self.p_level + std**2
+        gain_level = self.p_level / innovation_var
+        gain_trend = self.p_cross / innovation_var
+        innovation = measurement - self.level
+        self.level += gain_level * innovation
+        self.trend += gain_trend * innovation
+        self.p_trend -= gain_trend * self.p_cross
+        self.p_cross *= 1 - gain_level
+        self.p_level *= 1 - gain_level
+        return self.level, math.sqrt(self.p_level)
+
+    def forecast(self, horizon: float) -> tuple[float, float]:
+        """Forecasts the number of people after the last prediction.
+
+        :param horizon: Seconds after the last prediction
+        :type horizon: float
+        :raises ValueError: If there have been no predictions yet
+        :return: Forecast number of people (at least 0) and its standard
+            deviation
+        :rtype: tuple[float, float]
+        """
+        if self.last_time is None:
+            raise ValueError("The filter has no predictions to forecast from.")
+        mean = self.level + self.trend * horizon
+        var = (
+            self.p_level
+            + 2 * horizon * self.p_cross
+            + horizon**2 * self.p_trend
+            + self.level_noise * horizon
+            + self.trend_noise * horizon**3 / 3
+        )
+        return max(0.0, mean), math.sqrt(var)
+
+    def forecasts(self, horizons_minutes: Sequence[int]) -> list[CrowdForecast]:
+        """Forecasts the number of people at several horizons.
+
+        :param horizons_minutes: Minutes after the last prediction
+        :type horizons_minutes: Sequence[int]
+        :return: A forecast per horizon, empty if there have been no predictions
+        :rtype: list[CrowdForecast]
+        """
+        if self.last_time is None:
+            return []
+        forecasts = []
+        for minutes in horizons_minutes:
+            status, err = self.forecast(60.0 * minutes)
+            forecasts.append(
+                CrowdForecast(horizon_minutes=minutes, status=status, err=err)
+            )
+        return forecasts
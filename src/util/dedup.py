@@ -0,0 +1,101 @@
+"""Drops redelivered and outdated edge messages before they are processed.
+
+Each edge publisher stamps its messages with a random session id, new every
+time it starts, and a sequence number counting up from 0 within the session.
+The fog only keeps the latest reading of each device, so a message is only
+worth processing if it is newer than the last one accepted from its device:
+redeliveries (e.g. at QoS > 0 after a reconnect) and readings overtaken by a
+newer one are dropped. The window of each device is its current session, the
+highest sequence number accepted in it and its previous session, so that
+messages of a restarted publisher's old session are dropped too.
+
+Messages are handled concurrently, so an accepted message may finish after a
+newer one of its device. A second window of the messages whose reading was
+stored drops its reading then, see :meth:`SequenceWindow.commit`.
+"""
+
+import threading
+from typing import Any, Optional
+
+
+class SequenceWindow:
+    """Per-device window of the sequence numbers already processed, see the
+    module description. Safe to use from several threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Current session, highest sequence number and previous session, of
+        # the messages accepted and of the messages whose reading was stored.
+        self.windows: dict[Any, tuple[str, int, Optional[str]]] = {}
+        self.committed: dict[Any, tuple[str, int, Optional[str]]] = {}
+
+    def accept(
+        self, device_id: Any, session: Optional[str], seq: Optional[int]
+    ) -> bool:
+        """Records a message, returning whether it should be processed.
+
+        :param device_id: Device ID
+        :type device_id: Any
+        :param session: Session id of the publisher, None for publishers
+            without sequence numbers
+        :type session: Optional[str]
+        :param seq: Sequence number within the session, None for publishers
+            without sequence numbers
+        :type seq: Optional[int]
+        :return: False if the message was already processed or is older than
+            the last processed message of the device
+        :rtype: bool
+        """
+        with self.lock:
+            return _advance(self.windows, device_id, session, seq)
+
+    def commit(
+        self, device_id: Any, session: Optional[str], seq: Optional[int]
+    ) -> bool:
+        """Records that a processed message's reading is stored, returning
+        whether it should be. Messages handled concurrently may finish out of
+        order, so an accepted message is only stored if no newer message of
+        its device was stored in the meantime.
+
+        :param device_id: Device ID
+        :type device_id: Any
+        :param session: Session id of the publisher, None for publishers
+            without sequence numbers
+        :type session: Optional[str]
+        :param seq: Sequence number within the session, None for publishers
+            without sequence numbers
+        :type seq: Optional[int]
+        :return: False if a newer message of the device was already stored
+        :rtype: bool
+        """
+        with self.lock:
+            return _advance(self.committed, device_id, session, seq)
+
+
+def _advance(
+    windows: dict[Any, tuple[str, int, Optional[str]]],
+    device_id: Any,
+    session: Optional[str],
+    seq: Optional[int],
+) -> bool:
+    if session is None or seq is None:
+        return True
+
+    window = windows.get(device_id)
+    if window is None:
+        windows[device_id] = (session, seq, None)
+        return True
+
+    current, highest, previous = window
+    if session == current:
+        if seq <= highest:
+            return False
+        windows[device_id] = (session, seq, previous)
+        return True
+    if session == previous:
+        return False
+
+    # The publisher restarted.
+    windows[device_id] = (session, seq, current)
+    return True
@@ -0,0 +1,113 @@
+"""Caches people counts by a perceptual hash of the frame, so that a static
+    scene sending the same or a nearly identical frame is not detected again.
+
+The hash is a difference hash: the frame is downscaled to a
+``(HASH_SIZE + 1) x HASH_SIZE`` grey thumbnail and each bit records whether a
+pixel is brighter than its right neighbour. Small changes such as sensor noise
+or JPEG artefacts flip few bits, so frames are matched within a Hamming
+distance. Counts are cached per device, as each device has its own regions of
+interest.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import cv2
+
+#: Side of the difference hash grid, giving HASH_SIZE ** 2 bit hashes.
+HASH_SIZE = 16
+
+
+def perceptual_hash(image: "cv2.typing.MatLike") -> int:
+    """Computes the difference hash of a frame.
+
+    :param image: BGR or grey frame
+    :type image: cv2.typing.MatLike
+    :return: HASH_SIZE ** 2 bit hash
+    :rtype: int
+    """
+    # pylint: disable=import-outside-toplevel
+    import cv2
+
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    thumbnail = cv2.resize(
+        image, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA
+    )
+    bits = np.packbits(thumbnail[:, 1:] > thumbnail[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+class DetectionCache:
+    """Least recently used cache of people counts by perceptual hash. Safe to
+    use from several threads.
+
+    :param max_size: Maximum number of cached counts over all devices
+    :type max_size: int
+    :param max_distance: Maximum Hamming distance between the hashes of
+        matching frames, defaults to 0 for identical hashes only
+    :type max_distance: int, optional
+    """
+
+    def __init__(self, max_size: int, max_distance: int = 0):
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[tuple[Any, int], int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, device_id: Any, image_hash: int) -> Optional[int]:
+        """Looks up the count of the closest cached frame of a device.
+
+        :param device_id: Device ID
+        :type device_id: Any
+        :param image_hash: Hash of the frame, see :func:`perceptual_hash`
+        :type image_hash: int
+        :return: Cached people count, None if no frame is within max_distance
+        :rtype: Optional[int]
+        """
+        key = (device_id, image_hash)
+        with self.lock:
+            if key not in self.entries and self.max_distance > 0:
+                closest = self.max_distance + 1
+                for cached_key in self.entries:
+                    if cached_key[0] != device_id:
+                        continue
+                    distance = (cached_key[1] ^ image_hash).bit_count()
+                    if distance < closest:
+                        key, closest = cached_key, distance
+
+            count = self.entries.get(key)
+            if count is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return count
+
+    def put(self, device_id: Any, image_hash: int, count: int) -> None:
+        """Caches the count of a frame, evicting the least recently used.
+
+        :param device_id: Device ID
+        :type device_id: Any
+        :param image_hash: Hash of the frame, see :func:`perceptual_hash`
+        :type image_hash: int
+        :param count: People count of the frame
+        :type count: int
+        """
+        with self.lock:
+            self.entries[(device_id, image_hash)] = count
+            self.entries.move_to_end((device_id, image_hash))
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of the lookups that were hits, 0 before any lookup."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -0,0 +1,395 @@
+"""Shared-memory ring buffer for handing frames to detector processes without
+    copying them.
+
+A producer (the camera loop on the edge, or the image decoding on the fog)
+writes each frame once into the next fixed-size slot of a
+:class:`multiprocessing.shared_memory.SharedMemory` block. The camera captures
+straight into the slot (see :func:`capture_frame_people`), while decoded
+images are copied in. Detector processes
+attach to the block by name and read the frame as a NumPy view, so only the
+slot's sequence number is sent between processes instead of the pickled frame.
+
+Each slot has a header with the sequence number of the frame it holds and its
+shape. The sequence number is cleared while a slot is being written, so a
+reader can check with :meth:`FrameRingBuffer.is_current` that the frame was not
+overwritten while it was being used.
+"""
+
+import atexit
+import functools
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+from typing import TYPE_CHECKING, Callable, Optional
+
+import numpy as np
+
+from deployment.config import DETECTION_WORKERS, FRAME_SLOT_BYTES
+
+if TYPE_CHECKING:
+    import cv2
+
+#: Number of int64 values in the buffer header: slots, slot bytes, next sequence.
+BUFFER_HEADER_LEN = 3
+
+#: Number of int64 values in each slot header: sequence, height, width, channels.
+SLOT_HEADER_LEN = 4
+
+#: Sequence number of an empty or partially written slot.
+EMPTY_SEQ = -1
+
+
+class FrameRingBuffer:
+    """Fixed-slot ring buffer of ``uint8`` frames in shared memory.
+
+    Use :meth:`create` in the producer and :meth:`attach` in the readers. Writes
+    are serialised within the producer process, so there should only be one
+    producer process per buffer.
+
+    :param shm: Shared memory block
+    :type shm: shared_memory.SharedMemory
+    :param owner: Whether this instance created the block and unlinks it,
+        defaults to False
+    :type owner: bool, optional
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool = False):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((BUFFER_HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+        self.n_slots, self.slot_bytes = int(self.header[0]), int(self.header[1])
+        self.slot_headers = np.ndarray(
+            (self.n_slots, SLOT_HEADER_LEN),
+            dtype=np.int64,
+            buffer=shm.buf,
+            offset=self.header.nbytes,
+        )
+        self.data_offset = self.header.nbytes + self.slot_headers.nbytes
+        self.lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        """Name of the shared memory block, to :meth:`attach` to it.
+
+        :return: Name of the block
+        :rtype: str
+        """
+        return self.shm.name
+
+    @classmethod
+    def create(
+        cls, n_slots: int, slot_bytes: int, name: Optional[str] = None
+    ) -> "FrameRingBuffer":
+        """Creates a ring buffer.
+
+        :param n_slots: Number of frames the buffer holds
+        :type n_slots: int
+        :param slot_bytes: Maximum size of a frame in bytes
+        :type slot_bytes: int
+        :param name: Name of the shared memory block, defaults to None for a
+            random name
+        :type name: Optional[str], optional
+        :return: The ring buffer, which unlinks the block when closed
+        :rtype: FrameRingBuffer
+        """
+        size = (
+            8 * (BUFFER_HEADER_LEN + n_slots * SLOT_HEADER_LEN) + n_slots * slot_bytes
+        )
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((BUFFER_HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+        header[:] = [n_slots, slot_bytes, 0]
+        ring = cls(shm, owner=True)
+        ring.slot_headers[:, 0] = EMPTY_SEQ
+        return ring
+
+    @classmethod
+    def attach(cls, name: str) -> "FrameRingBuffer":
+        """Attaches to a ring buffer created by another process.
+
+        :param name: Name of the shared memory block
+        :type name: str
+        :return: The ring buffer
+        :rtype: FrameRingBuffer
+        """
+        return cls(shared_memory.SharedMemory(name=name))
+
+    def _slot_view(self, seq: int, shape: tuple[int, ...]) -> np.ndarray:
+        offset = self.data_offset + (seq % self.n_slots) * self.slot_bytes
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=offset)
+
+    def reserve(self, shape: tuple[int, ...]) -> tuple[int, np.ndarray]:
+        """Reserves the next slot for a frame to be written into in place.
+
+        :param shape: Shape of the frame
+        :type shape: tuple[int, ...]
+        :raises ValueError: If the frame does not fit in a slot
+        :return: Sequence number and writable view of the slot, call
+            :meth:`commit` with the sequence number once written
+        :rtype: tuple[int, np.ndarray]
+        """
+        if int(np.prod(shape)) > self.slot_bytes:
+            raise ValueError(
+                f"Frame of shape {shape} does not fit in {self.slot_bytes} bytes."
+            )
+        with self.lock:
+            seq = int(self.header[2])
+            self.header[2] = seq + 1
+            self.slot_headers[seq % self.n_slots, 0] = EMPTY_SEQ
+        return seq, self._slot_view(seq, shape)
+
+    def commit(self, seq: int, shape: tuple[int, ...]) -> None:
+        """Publishes a frame written into a slot from :meth:`reserve`.
+
+        :param seq: Sequence number from :meth:`reserve`
+        :type seq: int
+        :param shape: Shape of the frame
+        :type shape: tuple[int, ...]
+        """
+        slot_header = self.slot_headers[seq % self.n_slots]
+        slot_header[1:] = (tuple(shape) + (1,))[:3]
+        slot_header[0] = seq
+
+    def write(self, frame: np.ndarray) -> int:
+        """Copies a frame into the next slot.
+
+        :param frame: ``uint8`` frame of shape ``(height, width[, channels])``
+        :type frame: np.ndarray
+        :raises ValueError: If the frame does not fit in a slot
+        :return: Sequence number of the frame
+        :rtype: int
+        """
+        seq, view = self.reserve(frame.shape)
+        np.copyto(view, frame, casting="unsafe")
+        self.commit(seq, frame.shape)
+        return seq
+
+    def read(self, seq: int) -> Optional[np.ndarray]:
+        """Returns a read-only view of a frame, without copying it.
+
+        :param seq: Sequence number of the frame
+        :type seq: int
+        :return: View of the frame, None if it has been overwritten. Check
+            :meth:`is_current` after using it.
+        :rtype: Optional[np.ndarray]
+        """
+        slot_header = self.slot_headers[seq % self.n_slots]
+        if slot_header[0] != seq:
+            return None
+        height, width, channels = (int(value) for value in slot_header[1:])
+        if slot_header[0] != seq:
+            return None
+        view = self._slot_view(seq, (height, width, channels))
+        view.flags.writeable = False
+        return view[..., 0] if channels == 1 else view
+
+    def is_current(self, seq: int) -> bool:
+        """Returns whether a slot still holds the frame of a sequence number.
+
+        :param seq: Sequence number of the frame
+        :type seq: int
+        :return: Whether the frame has not been overwritten
+        :rtype: bool
+        """
+        return bool(self.slot_headers[seq % self.n_slots, 0] == seq)
+
+    def close(self) -> None:
+        """Closes the buffer, and unlinks it if this instance created it."""
+        # The views must be released before the block can be closed.
+        del self.header, self.slot_headers
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+_worker_ring: Optional[FrameRingBuffer] = None
+
+
+def _attach_worker(name: str) -> None:
+    global _worker_ring  # pylint: disable=global-statement
+    _worker_ring = FrameRingBuffer.attach(name)
+
+
+def _count_slot(seq: int, device_id: Optional[int]) -> Optional[int]:
+    # Imported here so that importing this module does not load the detector.
+    # pylint: disable=import-outside-toplevel
+    from util.people_detection import count_people
+
+    assert _worker_ring is not None
+    frame = _worker_ring.read(seq)
+    if frame is None:
+        return None
+    count = count_people(frame, device_id=device_id)
+    return count if _worker_ring.is_current(seq) else None
+
+
+class FrameDetectionPool:
+    """Counts people in detector processes that read frames from a
+    :class:`FrameRingBuffer`.
+
+    :param n_workers: Number of detector processes
+    :type n_workers: int
+    :param slot_bytes: Maximum size of a frame in bytes
+    :type slot_bytes: int
+    :param n_slots: Number of frames the buffer holds, defaults to twice the
+        number of workers
+    :type n_slots: Optional[int], optional
+    """
+
+    def __init__(self, n_workers: int, slot_bytes: int, n_slots: Optional[int] = None):
+        self.ring = FrameRingBuffer.create(n_slots or 2 * n_workers, slot_bytes)
+        self.executor = ProcessPoolExecutor(
+            n_workers,
+            mp_context=get_context("spawn"),
+            initializer=_attach_worker,
+            initargs=(self.ring.name,),
+        )
+        # Shape of the last captured frame, to reserve a slot for the next one.
+        self.frame_shape: Optional[tuple[int, ...]] = None
+
+    def submit(self, seq: int, device_id: Optional[int] = None) -> Future:
+        """Counts the people in a frame of the ring buffer in a detector process.
+
+        :param seq: Sequence number of the frame
+        :type seq: int
+        :param device_id: Device that captured the frame, defaults to None
+        :type device_id: Optional[int], optional
+        :return: Future of the number of people detected, None if the frame was
+            overwritten before it was detected
+        :rtype: Future
+        """
+        return self.executor.submit(_count_slot, seq, device_id)
+
+    def count_people(
+        self, frame: "cv2.typing.MatLike", device_id: Optional[int] = None
+    ) -> int:
+        """Counts the people in a frame in a detector process.
+
+        Frames that do not fit in a slot, or that are overwritten before they
+        are detected, are counted in this process instead.
+
+        :param frame: BGR frame
+        :type frame: cv2.typing.MatLike
+        :param device_id: Device that captured the frame, defaults to None
+        :type device_id: Optional[int], optional
+        :return: Number of people detected
+        :rtype: int
+        """
+        # pylint: disable=import-outside-toplevel
+        from util.people_detection import count_people
+
+        try:
+            seq = self.ring.write(np.asarray(frame))
+        except ValueError:
+            return count_people(frame, device_id=device_id)
+
+        count = self.submit(seq, device_id).result()
+        return count if count is not None else count_people(frame, device_id=device_id)
+
+    def capture_and_count(
+        self,
+        capture: Callable[[Optional[np.ndarray]], "cv2.typing.MatLike"],
+        device_id: Optional[int] = None,
+    ) -> tuple["cv2.typing.MatLike", int]:
+        """Captures a frame straight into the next slot, without copying it,
+        and counts the people in it in a detector process.
+
+        The slot is reserved for the shape of the previous frame, so the first
+        frame, and frames of another shape, are copied in by
+        :meth:`count_people` instead.
+
+        :param capture: Captures a frame into the given array if it has the
+            frame's shape, or into a new array (e.g.
+            :func:`util.capture_image.take_picture` with ``out``)
+        :type capture: Callable[[Optional[np.ndarray]], cv2.typing.MatLike]
+        :param device_id: Device that captured the frame, defaults to None
+        :type device_id: Optional[int], optional
+        :return: The frame, a view of the slot that is only valid until the
+            slot is reused, and the number of people detected
+        :rtype: tuple[cv2.typing.MatLike, int]
+        """
+        # pylint: disable=import-outside-toplevel
+        from util.people_detection import count_people
+
+        shape = self.frame_shape
+        if shape is None or int(np.prod(shape)) > self.ring.slot_bytes:
+            frame = capture(None)
+        else:
+            seq, view = self.ring.reserve(shape)
+            frame = capture(view)
+            if frame is not None and np.shares_memory(frame, view):
+                self.ring.commit(seq, shape)
+                count = self.submit(seq, device_id).result()
+                if count is None:
+                    count = count_people(frame, device_id=device_id)
+                return frame, count
+
+        self.frame_shape = tuple(np.shape(frame))
+        return frame, self.count_people(frame, device_id=device_id)
+
+    def close(self) -> None:
+        """Stops the detector processes and releases the ring buffer."""
+        self.executor.shutdown()
+        self.ring.close()
+
+
+@functools.lru_cache(maxsize=1)
+def get_detection_pool() -> Optional[FrameDetectionPool]:
+    """Starts the detector processes once, if DETECTION_WORKERS is set.
+
+    :return: The detection pool, None if detection runs in this process
+    :rtype: Optional[FrameDetectionPool]
+    """
+    if DETECTION_WORKERS <= 0:
+        return None
+    pool = FrameDetectionPool(DETECTION_WORKERS, FRAME_SLOT_BYTES)
+    atexit.register(pool.close)
+    return pool
+
+
+def count_frame_people(
+    frame: "cv2.typing.MatLike", device_id: Optional[int] = None
+) -> int:
+    """Counts the people in a frame, in the detector processes if
+    DETECTION_WORKERS is set and in this process otherwise.
+
+    :param frame: BGR frame
+    :type frame: cv2.typing.MatLike
+    :param device_id: Device that captured the frame, defaults to None
+    :type device_id: Optional[int], optional
+    :return: Number of people detected
+    :rtype: int
+    """
+    # pylint: disable=import-outside-toplevel
+    from util.people_detection import count_people
+
+    pool = get_detection_pool()
+    if pool is None:
+        return count_people(frame, device_id=device_id)
+    return pool.count_people(frame, device_id=device_id)
+
+
+def capture_frame_people(
+    capture: Callable[[Optional[np.ndarray]], "cv2.typing.MatLike"],
+    device_id: Optional[int] = None,
+) -> tuple["cv2.typing.MatLike", int]:
+    """Captures a frame and counts the people in it, capturing it straight
+    into the ring buffer of the detector processes if DETECTION_WORKERS is set.
+
+    :param capture: Captures a frame into the given array if it has the
+        frame's shape, or into a new array, see
+        :meth:`FrameDetectionPool.capture_and_count`
+    :type capture: Callable[[Optional[np.ndarray]], cv2.typing.MatLike]
+    :param device_id: Device that captured the frame, defaults to None
+    :type device_id: Optional[int], optional
+    :return: The frame, only valid until the next capture, and the number of
+        people detected
+    :rtype: tuple[cv2.typing.MatLike, int]
+    """
+    # pylint: disable=import-outside-toplevel
+    from util.people_detection import count_people
+
+    pool = get_detection_pool()
+    if pool is None:
+        frame = capture(None)
+        return frame, count_people(frame, device_id=device_id)
+    return pool.capture_and_count(capture, device_id=device_id)
@@ -0,0 +1,252 @@
+"""Closed-form Gaussian process predictor that only depends on NumPy.
+
+``GaussianProcessRegressor.predict`` validates its input, re-evaluates the
+kernel tree and solves a triangular system on every call. For a fitted model
+all of that except the kernel against the training points can be done once,
+so :func:`export_gpr_predictor` stores:
+
+- the training inputs :math:`X`,
+- :math:`\\alpha = K^{-1} y`,
+- the inverse :math:`L^{-1}` of the Cholesky factor of :math:`K`, so that the
+  predictive variance is a matrix product instead of a triangular solve,
+- the target normalisation (mean and standard deviation),
+- the fitted kernel hyperparameters as JSON.
+
+:class:`GPRPredictor` then predicts the same mean and standard deviation as
+sklearn with a couple of matrix products, and importing this module does not
+import sklearn (or scipy), which matters on the fog.
+"""
+
+import json
+import os
+from typing import Any
+
+import numpy as np
+
+#: Filename of the exported predictor inside a model artifact directory.
+PREDICTOR_FILENAME = "predictor.npz"
+
+
+def export_kernel(kernel: Any) -> dict[str, Any]:
+    """Converts a fitted sklearn kernel into a JSON-serialisable spec.
+
+    Supports sums and products of ``ConstantKernel``, ``DotProduct``,
+    ``RBF``, ``Matern`` (:math:`\\nu \\in \\{0.5, 1.5, 2.5, \\infty\\}`),
+    ``RationalQuadratic`` and ``WhiteKernel``.
+
+    :param kernel: Fitted kernel, e.g. ``GaussianProcessRegressor.kernel_``
+    :type kernel: Any
+    :raises ValueError: If the kernel is not supported
+    :return: Kernel spec
+    :rtype: dict[str, Any]
+    """
+    name = type(kernel).__name__
+    if name in ("Sum", "Product"):
+        return {
+            "name": name,
+            "k1": export_kernel(kernel.k1),
+            "k2": export_kernel(kernel.k2),
+        }
+    if name == "ConstantKernel":
+        return {"name": name, "constant_value": float(kernel.constant_value)}
+    if name == "DotProduct":
+        return {"name": name, "sigma_0": float(kernel.sigma_0)}
+    if name == "WhiteKernel":
+        return {"name": name, "noise_level": float(kernel.noise_level)}
+    if name in ("RBF", "Matern", "RationalQuadratic"):
+        spec = {
+            "name": name,
+            "length_scale": np.atleast_1d(kernel.length_scale).astype(float).tolist(),
+        }
+        if name == "Matern":
+            if kernel.nu not in (0.5, 1.5, 2.5, np.inf):
+                raise ValueError(f"Unsupported Matern nu: {kernel.nu}")
+            spec["nu"] = float(kernel.nu)
+        if name == "RationalQuadratic":
+            spec["alpha"] = float(kernel.alpha)
+        return spec
+    raise ValueError(f"Unsupported kernel: {name}")
+
+
+def _sq_dists(X: np.ndarray, Y: np.ndarray, length_scale: list[float]) -> np.ndarray:
+    scale = np.asarray(length_scale)
+    X, Y = X / scale, Y / scale
+    d = (
+        np.sum(X**2, axis=1)[:, np.newaxis]
+        + np.sum(Y**2, axis=1)[np.newaxis, :]
+        - 2 * X @ Y.T
+    )
+    return np.maximum(d, 0)
+
+
+def evaluate_kernel(spec: dict[str, Any], X: np.ndarray, Y: np.ndarray) -> np.ndarray:
+    """Evaluates a kernel spec between two sets of points.
+
+    :param spec: Kernel spec from :func:`export_kernel`
+    :type spec: dict[str, Any]
+    :param X: Points of shape :math:`(n_X, d)`
+    :type X: np.ndarray
+    :param Y: Points of shape :math:`(n_Y, d)`, distinct from ``X``
+    :type Y: np.ndarray
+    :return: Kernel matrix of shape :math:`(n_X, n_Y)`
+    :rtype: np.ndarray
+    """
+    name = spec["name"]
+    if name == "Sum":
+        return evaluate_kernel(spec["k1"], X, Y) + evaluate_kernel(spec["k2"], X, Y)
+    if name == "Product":
+        return evaluate_kernel(spec["k1"], X, Y) * evaluate_kernel(spec["k2"], X, Y)
+    if name == "ConstantKernel":
+        return np.full((len(X), len(Y)), spec["constant_value"])
+    if name == "DotProduct":
+        return X @ Y.T + spec["sigma_0"] ** 2
+    if name == "WhiteKernel":
+        # Like sklearn, white noise only contributes to the diagonal.
+        return np.zeros((len(X), len(Y)))
+
+    d2 = _sq_dists(X, Y, spec["length_scale"])
+    if name == "RBF" or (name == "Matern" and np.isinf(spec["nu"])):
+        return np.exp(-0.5 * d2)
+    if name == "RationalQuadratic":
+        return (1 + d2 / (2 * spec["alpha"])) ** -spec["alpha"]
+
+    d = np.sqrt(d2)
+    if spec["nu"] == 0.5:
+        return np.exp(-d)
+    if spec["nu"] == 1.5:
+        d = np.sqrt(3) * d
+        return (1 + d) * np.exp(-d)
+    d = np.sqrt(5) * d
+    return (1 + d + d**2 / 3) * np.exp(-d)
+
+
+def evaluate_kernel_diag(spec: dict[str, Any], X: np.ndarray) -> np.ndarray:
+    """Evaluates the diagonal of a kernel spec, :math:`k(x, x)`.
+
+    :param spec: Kernel spec from :func:`export_kernel`
+    :type spec: dict[str, Any]
+    :param X: Points of shape :math:`(n, d)`
+    :type X: np.ndarray
+    :return: Diagonal of shape :math:`(n,)`
+    :rtype: np.ndarray
+    """
+    name = spec["name"]
+    if name == "Sum":
+        return evaluate_kernel_diag(spec["k1"], X) + evaluate_kernel_diag(spec["k2"], X)
+    if name == "Product":
+        return evaluate_kernel_diag(spec["k1"], X) * evaluate_kernel_diag(spec["k2"], X)
+    if name == "ConstantKernel":
+        return np.full(len(X), spec["constant_value"])
+    if name == "DotProduct":
+        return np.sum(X**2, axis=1) + spec["sigma_0"] ** 2
+    if name == "WhiteKernel":
+        return np.full(len(X), spec["noise_level"])
+    return np.ones(len(X))
+
+
+class GPRPredictor:
+    """NumPy-only predictor of a fitted ``GaussianProcessRegressor``.
+
+    Has the same ``predict`` interface, so it can be used in place of the
+    sklearn model by :func:`deployment.fog_subscriber.model_inference`.
+
+    :param kernel: Kernel spec from :func:`export_kernel`
+    :type kernel: dict[str, Any]
+    :param X_train: Training inputs
+    :type X_train: np.ndarray
+    :param alpha: Dual coefficients :math:`K^{-1} y`
+    :type alpha: np.ndarray
+    :param L_inv: Inverse of the lower Cholesky factor of :math:`K`
+    :type L_inv: np.ndarray
+    :param y_train_mean: Target mean
+    :type y_train_mean: float
+    :param y_train_std: Target standard deviation
+    :type y_train_std: float
+    """
+
+    def __init__(
+        self,
+        kernel: dict[str, Any],
+        X_train: np.ndarray,
+        alpha: np.ndarray,
+        L_inv: np.ndarray,
+        y_train_mean: float,
+        y_train_std: float,
+    ):
+        self.kernel = kernel
+        self.X_train = X_train
+        self.alpha = alpha
+        self.L_inv = L_inv
+        self.y_train_mean = y_train_mean
+        self.y_train_std = y_train_std
+        self.n_features_in_ = X_train.shape[1]
+
+    def predict(
+        self, X: np.ndarray, return_std: bool = False
+    ) -> np.ndarray | tuple[np.ndarray, np.ndarray]:
+        """Predicts the posterior mean (and standard deviation).
+
+        :param X: Inputs of shape :math:`(n, d)`
+        :type X: np.ndarray
+        :param return_std: Whether to return the standard deviation, defaults to False
+        :type return_std: bool, optional
+        :return: Mean, or mean and standard deviation
+        :rtype: np.ndarray | tuple[np.ndarray, np.ndarray]
+        """
+        X = np.asarray(X, dtype=float)
+        K_trans = evaluate_kernel(self.kernel, X, self.X_train)
+        mean = self.y_train_std * (K_trans @ self.alpha) + self.y_train_mean
+        if not return_std:
+            return mean
+
+        V = self.L_inv @ K_trans.T
+        var = evaluate_kernel_diag(self.kernel, X) - np.sum(V**2, axis=0)
+        std = np.sqrt(np.maximum(var, 0)) * self.y_train_std
+        return mean, std
+
+
+def export_gpr_predictor(model: Any, path: str | os.PathLike) -> None:
+    """Exports a fitted ``GaussianProcessRegressor`` for :class:`GPRPredictor`.
+
+    :param model: Fitted single-target ``GaussianProcessRegressor``
+    :type model: Any
+    :param path: Path of the ``.npz`` file to write
+    :type path: str | os.PathLike
+    :raises ValueError: If the kernel is not supported or the model has
+        several targets
+    """
+    if np.ndim(model.alpha_) != 1:
+        raise ValueError("Only single-target models can be exported.")
+
+    L = np.asarray(model.L_, dtype=float)
+    L_inv = np.linalg.solve(L, np.eye(len(L)))
+    tmp_path = f"{os.fspath(path)}.tmp.npz"
+    np.savez(
+        tmp_path,
+        kernel=np.array(json.dumps(export_kernel(model.kernel_))),
+        X_train=np.asarray(model.X_train_, dtype=float),
+        alpha=np.asarray(model.alpha_, dtype=float),
+        L_inv=L_inv,
+        y_train_mean=np.asarray(model._y_train_mean, dtype=float).reshape(()),
+        y_train_std=np.asarray(model._y_train_std, dtype=float).reshape(()),
+    )
+    os.replace(tmp_path, path)
+
+
+def load_gpr_predictor(path: str | os.PathLike) -> GPRPredictor:
+    """Loads a predictor exported by :func:`export_gpr_predictor`.
+
+    :param path: Path of the ``.npz`` file
+    :type path: str | os.PathLike
+    :return: The predictor
+    :rtype: GPRPredictor
+    """
+    with np.load(path, allow_pickle=False) as data:
+        return GPRPredictor(
+            kernel=json.loads(str(data["kernel"])),
+            X_train=data["X_train"],
+            alpha=data["alpha"],
+            L_inv=data["L_inv"],
+            y_train_mean=float(data["y_train_mean"]),
+            y_train_std=float(data["y_train_std"]),
+        )
@@ -0,0 +1,336 @@
+"""In-process counters, gauges and histograms exported in the Prometheus text
+    exposition format.
+
+Metrics register themselves in :data:`REGISTRY` when created, and each labelled
+series is a small object updated under its own lock, so recording a value is a
+dictionary lookup and an addition. :meth:`Registry.render` formats every metric
+for a ``/metrics`` endpoint, e.g. the API's or the one started by
+:func:`start_metrics_server` in other processes.
+"""
+
+import abc
+import bisect
+import contextlib
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator, Optional
+
+#: Content type of the text exposition format.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+#: Default histogram buckets in seconds, from 1 ms to 10 s.
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self.metrics: list["Metric"] = []
+        self.lock = threading.Lock()
+
+    def register(self, metric: "Metric") -> None:
+        """Adds a metric to the registry.
+
+        :param metric: The metric
+        :type metric: Metric
+        :raises ValueError: If a metric with the same name is registered
+        """
+        with self.lock:
+            if any(existing.name == metric.name for existing in self.metrics):
+                raise ValueError(f"Metric {metric.name} is already registered.")
+            self.metrics.append(metric)
+
+    def render(self) -> str:
+        """Renders all metrics in the text exposition format.
+
+        :return: Exposition text
+        :rtype: str
+        """
+        with self.lock:
+            metrics = list(self.metrics)
+        return "".join(metric.render() for metric in metrics)
+
+
+#: Default registry of the process.
+REGISTRY = Registry()
+
+
+class Metric(abc.ABC):
+    """Base class of the metric types, with one series per label values.
+
+    :param name: Metric name
+    :type name: str
+    :param documentation: Help text
+    :type documentation: str
+    :param labelnames: Label names, defaults to ()
+    :type labelnames: tuple[str, ...], optional
+    :param registry: Registry to register in, defaults to REGISTRY
+    :type registry: Optional[Registry], optional
+    """
+
+    metric_type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.series: dict[tuple[str, ...], "Metric"] = {}
+        self.lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    @abc.abstractmethod
+    def _new_series(self) -> "Metric":
+        """Creates the series of a set of label values."""
+
+    def labels(self, *values: object, **kwargs: object) -> "Metric":
+        """Returns the series of a set of label values, creating it if needed.
+
+        :return: The series, with the same methods as an unlabelled metric
+        :rtype: Metric
+        """
+        key = tuple(str(value) for value in values) or tuple(
+            str(kwargs[name]) for name in self.labelnames
+        )
+        series = self.series.get(key)
+        if series is None:
+            with self.lock:
+                series = self.series.setdefault(key, self._new_series())
+        return series
+
+    @abc.abstractmethod
+    def _samples(self) -> Iterator[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        """Yields the suffix, label names, label values and value of each
+        sample.
+        """
+
+    def render(self) -> str:
+        """Renders the metric in the text exposition format.
+
+        :return: Exposition text
+        :rtype: str
+        """
+        lines = [
+            f"# HELP {self.name} {_escape(self.documentation)}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        for suffix, names, values, value in self._samples():
+            lines.append(
+                f"{self.name}{suffix}{_format_labels(names, values)} "
+                f"{_format_value(value)}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def _series_items(self) -> list[tuple[tuple[str, ...], "Metric"]]:
+        if not self.labelnames:
+            return [((), self)]
+        with self.lock:
+            return sorted(self.series.items())
+
+
+class Counter(Metric):
+    """Monotonically increasing count, e.g. of messages received."""
+
+    metric_type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        self.value = 0.0
+        super().__init__(*args, **kwargs)
+
+    def _new_series(self) -> "Counter":
+        return Counter(self.name, self.documentation, registry=None)
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increments the counter.
+
+        :param amount: Non-negative increment, defaults to 1.0
+        :type amount: float, optional
+        """
+        with self.lock:
+            self.value += amount
+
+    def _samples(self):
+        for values, series in self._series_items():
+            yield "", self.labelnames, values, series.value
+
+
+class Gauge(Metric):
+    """Value that can go up and down, e.g. a queue depth."""
+
+    metric_type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+        super().__init__(*args, **kwargs)
+
+    def _new_series(self) -> "Gauge":
+        return Gauge(self.name, self.documentation, registry=None)
+
+    def set(self, value: float) -> None:
+        """Sets the gauge.
+
+        :param value: New value
+        :type value: float
+        """
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increments the gauge.
+
+        :param amount: Increment, defaults to 1.0
+        :type amount: float, optional
+        """
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        """Decrements the gauge.
+
+        :param amount: Decrement, defaults to 1.0
+        :type amount: float, optional
+        """
+        self.inc(-amount)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Reads the gauge from a function when rendered instead.
+
+        :param function: Function returning the current value
+        :type function: Callable[[], float]
+        """
+        self.function = function
+
+    def _samples(self):
+        for values, series in self._series_items():
+            value = series.function() if series.function else series.value
+            yield "", self.labelnames, values, value
+
+
+class Histogram(Metric):
+    """Distribution of observations in cumulative buckets, e.g. latencies.
+
+    :param buckets: Upper bounds of the buckets, defaults to DEFAULT_BUCKETS
+    :type buckets: tuple[float, ...], optional
+    """
+
+    metric_type = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        super().__init__(*args, **kwargs)
+
+    def _new_series(self) -> "Histogram":
+        return Histogram(
+            self.name, self.documentation, buckets=self.buckets, registry=None
+        )
+
+    def observe(self, value: float) -> None:
+        """Adds an observation.
+
+        :param value: Observed value
+        :type value: float
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextlib.contextmanager
+    def time(self) -> Iterator[None]:
+        """Observes the duration of a block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def _samples(self):
+        names = self.labelnames + ("le",)
+        for values, series in self._series_items():
+            with series.lock:
+                counts, total = list(series.counts), series.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield "_bucket", names, values + (_format_value(bound),), cumulative
+            yield "_sum", self.labelnames, values, total
+            yield "_count", self.labelnames, values, cumulative
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serves the registry at any path."""
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def start_metrics_server(
+    port: int, host: str = "0.0.0.0", registry: Registry = REGISTRY
+) -> ThreadingHTTPServer:
+    """Serves a registry over HTTP in a daemon thread, for processes without a
+    web server of their own such as the fog subscriber.
+
+    :param port: Port to listen on, 0 for any free port
+    :type port: int
+    :param host: Host to listen on, defaults to "0.0.0.0"
+    :type host: str, optional
+    :param registry: Registry to serve, defaults to REGISTRY
+    :type registry: Registry, optional
+    :return: The running server, ``server.server_address`` has the port
+    :rtype: ThreadingHTTPServer
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
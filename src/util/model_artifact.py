@@ -0,0 +1,295 @@
+"""Saves and loads versioned crowd model artifacts.
+
+An artifact is a directory with the following layout::
+
+    <artifact_dir>/manifest.json
+    <artifact_dir>/model.pkl
+    <artifact_dir>/arrays/<array_id>.npy
+
+``model.pkl`` is the pickled model with every large NumPy array (training
+inputs, ``alpha_``, Cholesky factor, kernel approximation components, etc.)
+replaced by a reference to an ``.npy`` file. On loading, the arrays are
+memory-mapped read-only instead of being read and copied, so loading is
+near-instant regardless of the training set size.
+
+The manifest records the feature layout the model expects, a hash of the
+training data and the training metrics, so that the fog can refuse a model
+that does not match its own ``TOP_N_APS`` and ``TOTAL_DEVICES``.
+
+.. note::
+    ``model.pkl`` is still a pickle, so only load artifacts from trusted sources.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from typing import Any, Optional, TypedDict
+
+import numpy as np
+
+#: Version of the artifact layout, bump when it changes incompatibly.
+ARTIFACT_VERSION = 1
+
+#: Arrays of at least this many bytes are stored as separate ``.npy`` files.
+ARRAY_THRESHOLD_BYTES = 1024
+
+MANIFEST_FILENAME = "manifest.json"
+MODEL_FILENAME = "model.pkl"
+ARRAYS_DIRNAME = "arrays"
+
+
+class FeatureLayout(TypedDict):
+    """Layout of the feature vector the model was trained on.
+
+    :param top_n_aps: Top :math:`N` WiFi APs per device
+    :type top_n_aps: int
+    :param total_devices: Total number of edge devices
+    :type total_devices: int
+    :param n_features: Number of features
+    :type n_features: int
+    :param columns: Feature column names, in order
+    :type columns: list[str]
+    """
+
+    top_n_aps: int
+    total_devices: int
+    n_features: int
+    columns: list[str]
+
+
+class ArtifactManifest(TypedDict):
+    """Manifest of a model artifact.
+
+    :param version: Artifact layout version, see :data:`ARTIFACT_VERSION`
+    :type version: int
+    :param model_class: Fully qualified class name of the model
+    :type model_class: str
+    :param created: Creation time in ISO 8601 format
+    :type created: str
+    :param sklearn_version: scikit-learn version used for training
+    :type sklearn_version: str
+    :param feature_layout: Feature layout of the model
+    :type feature_layout: FeatureLayout
+    :param training_data_sha256: SHA-256 digest of the training inputs and targets
+    :type training_data_sha256: str
+    :param feature_means: Mean of each feature in the training inputs, e.g. to
+        fill in the features of devices that stopped reporting
+    :type feature_means: list[float]
+    :param metrics: Training and evaluation metrics
+    :type metrics: dict[str, float]
+    :param arrays: Shape and dtype of each stored array, keyed by array id
+    :type arrays: dict[str, dict[str, Any]]
+    """
+
+    version: int
+    model_class: str
+    created: str
+    sklearn_version: str
+    feature_layout: FeatureLayout
+    training_data_sha256: str
+    feature_means: list[float]
+    metrics: dict[str, float]
+    arrays: dict[str, dict[str, Any]]
+
+
+class _ArtifactPickler(pickle.Pickler):
+    def __init__(self, file, arrays_dir: str):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.arrays_dir = arrays_dir
+        self.arrays: dict[str, dict[str, Any]] = {}
+        self.array_ids: dict[int, str] = {}
+
+    def persistent_id(self, obj: Any) -> Optional[str]:
+        if (
+            not isinstance(obj, np.ndarray)
+            or obj.dtype.hasobject
+            or obj.nbytes < ARRAY_THRESHOLD_BYTES
+        ):
+            return None
+        if id(obj) not in self.array_ids:
+            array_id = f"array_{len(self.arrays):03d}"
+            np.save(os.path.join(self.arrays_dir, f"{array_id}.npy"), obj)
+            self.arrays[array_id] = {"shape": list(obj.shape), "dtype": str(obj.dtype)}
+            self.array_ids[id(obj)] = array_id
+        return self.array_ids[id(obj)]
+
+
+class _ArtifactUnpickler(pickle.Unpickler):
+    def __init__(self, file, arrays_dir: str, mmap_mode: Optional[str]):
+        super().__init__(file)
+        self.arrays_dir = arrays_dir
+        self.mmap_mode = mmap_mode
+
+    def persistent_load(self, pid: str) -> np.ndarray:
+        return np.load(
+            os.path.join(self.arrays_dir, f"{pid}.npy"), mmap_mode=self.mmap_mode
+        )
+
+
+def hash_training_data(X: np.ndarray, y: np.ndarray) -> str:
+    """Hashes the training inputs and targets.
+
+    :param X: Training inputs
+    :type X: np.ndarray
+    :param y: Training targets
+    :type y: np.ndarray
+    :return: SHA-256 digest
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    for array in (X, y):
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def save_model_artifact(
+    model: Any,
+    artifact_dir: str | os.PathLike,
+    feature_layout: FeatureLayout,
+    X: np.ndarray,
+    y: np.ndarray,
+    metrics: Optional[dict[str, float]] = None,
+) -> ArtifactManifest:
+    """Saves a fitted model as an artifact, replacing any existing artifact.
+
+    :param model: Fitted model
+    :type model: Any
+    :param artifact_dir: Artifact directory
+    :type artifact_dir: str | os.PathLike
+    :param feature_layout: Feature layout the model was trained on
+    :type feature_layout: FeatureLayout
+    :param X: Training inputs, only hashed and averaged
+    :type X: np.ndarray
+    :param y: Training targets, only hashed
+    :type y: np.ndarray
+    :param metrics: Training and evaluation metrics, defaults to None
+    :type metrics: Optional[dict[str, float]], optional
+    :return: Manifest of the saved artifact
+    :rtype: ArtifactManifest
+    """
+    # Only needed for training, so loading does not depend on sklearn.
+    import sklearn  # pylint: disable=import-outside-toplevel
+
+    artifact_dir = os.fspath(artifact_dir)
+    tmp_dir = f"{artifact_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    arrays_dir = os.path.join(tmp_dir, ARRAYS_DIRNAME)
+    os.makedirs(arrays_dir)
+
+    with open(os.path.join(tmp_dir, MODEL_FILENAME), "wb") as f:
+        pickler = _ArtifactPickler(f, arrays_dir)
+        pickler.dump(model)
+
+    manifest = ArtifactManifest(
+        version=ARTIFACT_VERSION,
+        model_class=f"{type(model).__module__}.{type(model).__qualname__}",
+        created=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        sklearn_version=sklearn.__version__,
+        feature_layout=feature_layout,
+        training_data_sha256=hash_training_data(X, y),
+        feature_means=np.asarray(X, dtype=float).mean(axis=0).tolist(),
+        metrics={k: float(v) for k, v in (metrics or {}).items()},
+        arrays=pickler.arrays,
+    )
+    with open(os.path.join(tmp_dir, MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Swap the directories so that readers never see a partial artifact.
+    old_dir = f"{artifact_dir}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(artifact_dir):
+        os.replace(artifact_dir, old_dir)
+    os.replace(tmp_dir, artifact_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+def read_artifact_manifest(artifact_dir: str | os.PathLike) -> ArtifactManifest:
+    """Reads the manifest of an artifact.
+
+    :param artifact_dir: Artifact directory
+    :type artifact_dir: str | os.PathLike
+    :return: Manifest of the artifact
+    :rtype: ArtifactManifest
+    """
+    with open(
+        os.path.join(artifact_dir, MANIFEST_FILENAME), "r", encoding="utf-8"
+    ) as f:
+        return json.load(f)
+
+
+def check_artifact_version(manifest: ArtifactManifest) -> None:
+    """Checks that an artifact has the layout version this code reads, also
+    before using a model exported next to it.
+
+    :param manifest: Manifest of the artifact
+    :type manifest: ArtifactManifest
+    :raises ValueError: If the artifact version is not supported
+    """
+    if manifest["version"] != ARTIFACT_VERSION:
+        raise ValueError(
+            f"Unsupported model artifact version {manifest['version']}, "
+            f"expected {ARTIFACT_VERSION}."
+        )
+
+
+def check_feature_layout(
+    manifest: ArtifactManifest, top_n_aps: int, total_devices: int, n_features: int
+) -> None:
+    """Checks that the model's feature layout matches the caller's.
+
+    :param manifest: Manifest of the artifact
+    :type manifest: ArtifactManifest
+    :param top_n_aps: Top :math:`N` WiFi APs of the caller
+    :type top_n_aps: int
+    :param total_devices: Total number of edge devices of the caller
+    :type total_devices: int
+    :param n_features: Number of features of the caller
+    :type n_features: int
+    :raises ValueError: If the layouts do not match
+    """
+    layout = manifest["feature_layout"]
+    expected = {
+        "top_n_aps": top_n_aps,
+        "total_devices": total_devices,
+        "n_features": n_features,
+    }
+    mismatches = {
+        key: (layout[key], value)  # type: ignore
+        for key, value in expected.items()
+        if layout[key] != value  # type: ignore
+    }
+    if mismatches:
+        raise ValueError(
+            "Model feature layout does not match, (model, expected): "
+            + ", ".join(f"{key}={value}" for key, value in mismatches.items())
+        )
+
+
+def load_model_artifact(
+    artifact_dir: str | os.PathLike, mmap_mode: Optional[str] = "r"
+) -> tuple[Any, ArtifactManifest]:
+    """Loads a model artifact.
+
+    :param artifact_dir: Artifact directory
+    :type artifact_dir: str | os.PathLike
+    :param mmap_mode: Memory-map mode of the arrays, None to read them into
+        memory, defaults to "r"
+    :type mmap_mode: Optional[str], optional
+    :raises ValueError: If the artifact version is not supported
+    :return: The model and the manifest
+    :rtype: tuple[Any, ArtifactManifest]
+    """
+    manifest = read_artifact_manifest(artifact_dir)
+    check_artifact_version(manifest)
+
+    with open(os.path.join(artifact_dir, MODEL_FILENAME), "rb") as f:
+        model = _ArtifactUnpickler(
+            f, os.path.join(artifact_dir, ARRAYS_DIRNAME), mmap_mode
+        ).load()
+    return model, manifest
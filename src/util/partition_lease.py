@@ -0,0 +1,123 @@
+"""Elects the one replica of a fog partition that handles its readings, so that
+    the others stand by and take over when it fails.
+
+The holder of a partition is the worker whose id is the retained message on
+the partition's lease topic. Each replica subscribes to the lease topic and
+sets a will that clears it, so the lease is cleared when a replica
+disconnects without notice. When the lease is cleared, the holder reclaims it
+at once and the standby replicas claim it after a delay, if it is still clear.
+If several replicas claim it together, the last claim retained by the broker
+wins, as every replica receives the claims in the same order.
+
+Only the holder subscribes to the partition's device topics. A device's
+readings therefore always reach the same worker, which keeps its per-device
+state (see :mod:`util.dedup` and :mod:`util.detection_cache`). An MQTT v5
+shared subscription would instead spread them over the replicas.
+"""
+
+import threading
+from typing import Any, Optional
+
+
+class PartitionLease:
+    """Lease on a partition of the devices, see the module description.
+
+    :param client: MQTT client of this worker, with ``publish``, ``subscribe``
+        and ``unsubscribe`` methods
+    :type client: Any
+    :param topic: Lease topic of the partition
+    :type topic: str
+    :param device_topics: Topic filters of the partition's readings, subscribed
+        while this worker holds the lease
+    :type device_topics: list[str]
+    :param worker_id: Id of this worker, unique across the replicas
+    :type worker_id: str
+    :param claim_delay: Seconds a standby waits before claiming a clear lease,
+        so that the holder can reclaim it first, defaults to 2.0
+    :type claim_delay: float, optional
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        topic: str,
+        device_topics: list[str],
+        worker_id: str,
+        claim_delay: float = 2.0,
+    ):
+        self.client = client
+        self.topic = topic
+        self.device_topics = device_topics
+        self.worker_id = worker_id
+        self.claim_delay = claim_delay
+        self.lock = threading.Lock()
+        self.holder: Optional[str] = None
+        self.active = False
+        self.timer: Optional[threading.Timer] = None
+
+    def reset(self) -> None:
+        """Starts over on (re)connection, as the subscriptions were lost. The
+        lease is claimed after the delay unless a holder is retained.
+        """
+        with self.lock:
+            self.holder = None
+            self.active = False
+            self._schedule_claim()
+
+    def on_lease(self, payload: bytes) -> None:
+        """Handles a message on the lease topic.
+
+        :param payload: Id of the worker holding the lease, empty if cleared
+        :type payload: bytes
+        """
+        with self.lock:
+            self.holder = payload.decode() or None
+            if self.holder is None:
+                if self.active:
+                    self._claim()
+                else:
+                    self._schedule_claim()
+            else:
+                self._set_active(self.holder == self.worker_id)
+
+    def release(self) -> Any:
+        """Clears the lease if this worker holds it, e.g. on shutdown, so that
+        a standby takes over at once.
+
+        :return: Publish result of the clearing message, None if this worker
+            did not hold the lease
+        :rtype: Any
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            if not self.active:
+                return None
+            self._set_active(False)
+            return self.client.publish(self.topic, b"", qos=1, retain=True)
+
+    def _schedule_claim(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = threading.Timer(self.claim_delay, self._claim_if_clear)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def _claim_if_clear(self) -> None:
+        with self.lock:
+            if self.holder is None:
+                self._claim()
+
+    def _claim(self) -> None:
+        self.client.publish(self.topic, self.worker_id.encode(), qos=1, retain=True)
+
+    def _set_active(self, active: bool) -> None:
+        if active == self.active:
+            return
+        self.active = active
+        if active:
+            print(f"Holding the lease on {self.topic}")
+            self.client.subscribe([(topic, 1) for topic in self.device_topics])
+        else:
+            print(f"Standing by for the lease on {self.topic}")
+            self.client.unsubscribe(self.device_topics)
@@ -2,17 +2,56 @@
 """
 
 import argparse
+import functools
+import json
 import os
 from pathlib import Path
+from typing import Any, Optional
 
-import torch
 import cv2
+import numpy as np
 from PIL import Image
-from ultralytics import YOLO
+
+from deployment.config import (
+    DETECTOR_BACKEND,
+    DETECTOR_IMGSZ,
+    DETECTOR_MODEL,
+    DETECTOR_ROI_PATH,
+    DETECTOR_TILE_OVERLAP,
+    DETECTOR_TILE_SIZE,
+)
 
 DATA_PATH = "./data"
 COLLECTORS = ["bryan", "chris", "jiayu", "jurgen"]
 
+#: Detector backends, see :func:`count_people`.
+DETECTOR_BACKENDS = ("yolo", "onnx")
+
+#: Minimum person confidence, as ultralytics' default.
+CONF_THRESHOLD = 0.25
+
+#: IoU threshold of non-maximum suppression, as ultralytics' default.
+IOU_THRESHOLD = 0.7
+
+#: Padding colour of letterboxed images, as ultralytics.
+LETTERBOX_COLOUR = (114, 114, 114)
+
+#: Intersection over the smaller box above which boxes of overlapping tiles
+#: are merged, see :func:`merge_tile_boxes`.
+TILE_MERGE_THRESHOLD = 0.6
+
+
+@functools.lru_cache(maxsize=2)
+def _load_yolo(model_path: str) -> Any:
+    # Imported here so that the ONNX backend does not load torch.
+    # pylint: disable=import-outside-toplevel
+    import torch
+    from ultralytics import YOLO
+
+    # Check if GPU is available, otherwise use CPU
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    return YOLO(model_path).to(device)
+
 
 def detect(image: cv2.typing.MatLike | Image.Image) -> list:
     """Function to perform object detection on an image.
@@ -22,11 +61,8 @@ def detect(image: cv2.typing.MatLike | Image.Image) -> list:
     :return: List of results from object detection
     :rtype: list
     """
-    # Check if GPU is available, otherwise use CPU
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-
-    # Load YOLO model
-    model = YOLO("yolov8s.pt").to(device)
+    # Load YOLO model, only once per process
+    model = _load_yolo(DETECTOR_MODEL if DETECTOR_BACKEND == "yolo" else "yolov8s.pt")
 
     # Perform object detection on the image
     return model.predict(image, classes=[0])  # type: ignore
@@ -52,6 +88,439 @@ def get_people_count(results: list) -> int:
     return 0
 
 
+def letterbox(
+    image: cv2.typing.MatLike, imgsz: int
+) -> tuple[np.ndarray, float, tuple[int, int]]:
+    """Resizes an image to fit a square input, keeping its aspect ratio.
+
+    :param image: BGR image
+    :type image: cv2.typing.MatLike
+    :param imgsz: Side of the square input
+    :type imgsz: int
+    :return: The ``(1, 3, imgsz, imgsz)`` RGB input blob in :math:`[0, 1]`, the
+        scale and the ``(x, y)`` padding
+    :rtype: tuple[np.ndarray, float, tuple[int, int]]
+    """
+    height, width = image.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    new_width, new_height = round(width * scale), round(height * scale)
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(
+            image, (new_width, new_height), interpolation=cv2.INTER_LINEAR
+        )
+
+    pad_x, pad_y = (imgsz - new_width) // 2, (imgsz - new_height) // 2
+    image = cv2.copyMakeBorder(
+        image,
+        pad_y,
+        imgsz - new_height - pad_y,
+        pad_x,
+        imgsz - new_width - pad_x,
+        cv2.BORDER_CONSTANT,
+        value=LETTERBOX_COLOUR,
+    )
+    blob = cv2.dnn.blobFromImage(image, 1 / 255.0, swapRB=True)
+    return blob, scale, (pad_x, pad_y)
+
+
+def postprocess_person_output(
+    output: np.ndarray,
+    scale: float,
+    pad: tuple[int, int],
+    conf_threshold: float = CONF_THRESHOLD,
+    iou_threshold: float = IOU_THRESHOLD,
+) -> np.ndarray:
+    """Decodes the person boxes of a YOLOv8 ONNX output.
+
+    :param output: Output of shape ``(1, 4 + classes, anchors)``, with rows
+        ``cx, cy, w, h`` followed by the class scores (person first)
+    :type output: np.ndarray
+    :param scale: Letterbox scale from :func:`letterbox`
+    :type scale: float
+    :param pad: Letterbox padding from :func:`letterbox`
+    :type pad: tuple[int, int]
+    :param conf_threshold: Minimum person score, defaults to CONF_THRESHOLD
+    :type conf_threshold: float, optional
+    :param iou_threshold: NMS IoU threshold, defaults to IOU_THRESHOLD
+    :type iou_threshold: float, optional
+    :return: Boxes of shape ``(n, 5)`` as ``x1, y1, x2, y2, score`` in the
+        original image's pixels
+    :rtype: np.ndarray
+    """
+    # Only the person class is decoded.
+    predictions = output[0]
+    scores = predictions[4]
+    keep = scores > conf_threshold
+    cx, cy, w, h = predictions[:4, keep]
+    scores = scores[keep]
+
+    boxes = np.stack(
+        [
+            (cx - w / 2 - pad[0]) / scale,
+            (cy - h / 2 - pad[1]) / scale,
+            w / scale,
+            h / scale,
+        ],
+        axis=1,
+    )
+    indices = cv2.dnn.NMSBoxes(
+        boxes.tolist(), scores.tolist(), conf_threshold, iou_threshold
+    )
+    indices = np.asarray(indices, dtype=int).reshape(-1)
+
+    boxes = boxes[indices]
+    boxes[:, 2:] += boxes[:, :2]
+    return np.column_stack([boxes, scores[indices]])
+
+
+class OnnxPersonDetector:
+    """Person detector for a YOLOv8 model exported to ONNX, run with OpenCV DNN.
+
+    Export with e.g. ``yolo export model=yolov8s.pt format=onnx imgsz=320`` on a
+    development machine, the edges then only need OpenCV and not torch. Add
+    ``dynamic=True`` to the export to detect on several tiles in one batch.
+    Models exported with a fixed batch size detect one tile at a time.
+
+    :param model_path: Path to the ONNX model
+    :type model_path: str | os.PathLike
+    :param imgsz: Input size the model was exported with, defaults to 640
+    :type imgsz: int, optional
+    """
+
+    def __init__(self, model_path: str | os.PathLike, imgsz: int = 640):
+        self.net = cv2.dnn.readNetFromONNX(os.fspath(model_path))
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.imgsz = imgsz
+        # Whether the model takes several images per forward pass, None until
+        # the first batch.
+        self.dynamic_batch: Optional[bool] = None
+
+    def detect(self, image: cv2.typing.MatLike | Image.Image) -> np.ndarray:
+        """Detects people in an image.
+
+        :param image: BGR image, or PIL image
+        :type image: cv2.typing.MatLike | Image.Image
+        :return: Boxes of shape ``(n, 5)`` as ``x1, y1, x2, y2, score``
+        :rtype: np.ndarray
+        """
+        return self.detect_batch([to_bgr(image)])[0]
+
+    def detect_batch(self, images: list[cv2.typing.MatLike]) -> list[np.ndarray]:
+        """Detects people in several BGR images, with one forward pass if the
+        model was exported with a dynamic batch size and one per image if not.
+
+        :param images: BGR images
+        :type images: list[cv2.typing.MatLike]
+        :return: Boxes of each image, see :meth:`detect`
+        :rtype: list[np.ndarray]
+        """
+        letterboxed = [letterbox(image, self.imgsz) for image in images]
+        blobs = [blob for blob, _, _ in letterboxed]
+        outputs = None
+        if len(blobs) > 1 and self.dynamic_batch is not False:
+            outputs = self._forward_batch(blobs)
+        if outputs is None:
+            outputs = [self._forward(blob) for blob in blobs]
+        return [
+            postprocess_person_output(output, scale, pad)
+            for output, (_, scale, pad) in zip(outputs, letterboxed)
+        ]
+
+    def _forward(self, blob: np.ndarray) -> np.ndarray:
+        self.net.setInput(blob)
+        return self.net.forward()
+
+    def _forward_batch(self, blobs: list[np.ndarray]) -> Optional[list[np.ndarray]]:
+        # A fixed batch size either fails in OpenCV or only outputs one image.
+        try:
+            output = self._forward(np.concatenate(blobs))
+        except cv2.error:
+            output = None
+        self.dynamic_batch = output is not None and len(output) == len(blobs)
+        if not self.dynamic_batch:
+            print("The ONNX model has a fixed batch size, detecting one at a time")
+            return None
+        return [output[i : i + 1] for i in range(len(blobs))]
+
+
+@functools.lru_cache(maxsize=2)
+def get_onnx_detector(model_path: str, imgsz: int) -> OnnxPersonDetector:
+    """Loads an ONNX person detector once per process.
+
+    :param model_path: Path to the ONNX model
+    :type model_path: str
+    :param imgsz: Input size the model was exported with
+    :type imgsz: int
+    :return: The detector
+    :rtype: OnnxPersonDetector
+    """
+    return OnnxPersonDetector(model_path, imgsz)
+
+
+def to_bgr(image: cv2.typing.MatLike | Image.Image) -> cv2.typing.MatLike:
+    """Converts a PIL image to a BGR array, other images are returned as is.
+
+    :param image: BGR image, or PIL image
+    :type image: cv2.typing.MatLike | Image.Image
+    :return: BGR image
+    :rtype: cv2.typing.MatLike
+    """
+    if isinstance(image, Image.Image):
+        return cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+    return image
+
+
+@functools.lru_cache(maxsize=1)
+def load_roi_polygons(roi_path: str) -> dict[int, list[np.ndarray]]:
+    """Loads the per-device regions of interest.
+
+    The JSON file maps device IDs to polygons of the floor area where people
+    can be, in coordinates relative to the image size, e.g.
+    ``{"0": [[[0, 0.4], [1, 0.4], [1, 1], [0, 1]]]}``. Devices that are not in
+    the file use the whole image.
+
+    :param roi_path: Path to the JSON file
+    :type roi_path: str
+    :return: Polygons of each device
+    :rtype: dict[int, list[np.ndarray]]
+    """
+    with open(roi_path, "r", encoding="utf-8") as f:
+        rois = json.load(f)
+    return {
+        int(device_id): [np.asarray(polygon, dtype=float) for polygon in polygons]
+        for device_id, polygons in rois.items()
+    }
+
+
+def make_roi_mask(shape: tuple[int, ...], polygons: list[np.ndarray]) -> np.ndarray:
+    """Rasterises relative ROI polygons into a mask.
+
+    :param shape: Image shape, ``(height, width, ...)``
+    :type shape: tuple[int, ...]
+    :param polygons: Polygons in relative coordinates
+    :type polygons: list[np.ndarray]
+    :return: ``uint8`` mask of shape ``(height, width)``, 255 inside the ROI
+    :rtype: np.ndarray
+    """
+    height, width = shape[:2]
+    mask = np.zeros((height, width), dtype=np.uint8)
+    cv2.fillPoly(
+        mask,
+        [np.round(polygon * [width, height]).astype(np.int32) for polygon in polygons],
+        255,
+    )
+    return mask
+
+
+def get_tiles(
+    shape: tuple[int, ...],
+    tile_size: int,
+    overlap: float = 0.2,
+    mask: Optional[np.ndarray] = None,
+) -> list[tuple[int, int, int, int]]:
+    """Splits an image into overlapping square tiles.
+
+    :param shape: Image shape, ``(height, width, ...)``
+    :type shape: tuple[int, ...]
+    :param tile_size: Side of the tiles in pixels, clipped to the image size
+    :type tile_size: int
+    :param overlap: Fraction of a tile that overlaps its neighbours, defaults to 0.2
+    :type overlap: float, optional
+    :param mask: ROI mask from :func:`make_roi_mask`, tiles outside it are
+        skipped. Defaults to None.
+    :type mask: Optional[np.ndarray], optional
+    :return: Tiles as ``x1, y1, x2, y2``
+    :rtype: list[tuple[int, int, int, int]]
+    """
+    height, width = shape[:2]
+
+    def starts(length: int) -> list[int]:
+        size = min(tile_size, length)
+        stride = max(1, int(size * (1 - overlap)))
+        positions = list(range(0, length - size + 1, stride))
+        if positions[-1] != length - size:
+            positions.append(length - size)
+        return positions
+
+    tiles = [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+    if mask is not None:
+        tiles = [
+            (x1, y1, x2, y2) for x1, y1, x2, y2 in tiles if mask[y1:y2, x1:x2].any()
+        ]
+    return tiles
+
+
+def merge_tile_boxes(
+    boxes: np.ndarray, overlap_threshold: float = TILE_MERGE_THRESHOLD
+) -> np.ndarray:
+    """Merges the boxes of overlapping tiles with greedy NMS.
+
+    Overlap is measured as the intersection over the smaller box rather than the
+    IoU, so that a person cut by a tile border is suppressed by the full box of
+    the neighbouring tile.
+
+    :param boxes: Boxes of shape ``(n, 5)`` as ``x1, y1, x2, y2, score``
+    :type boxes: np.ndarray
+    :param overlap_threshold: Overlap above which the lower scoring box is
+        dropped, defaults to TILE_MERGE_THRESHOLD
+    :type overlap_threshold: float, optional
+    :return: Merged boxes
+    :rtype: np.ndarray
+    """
+    boxes = boxes[np.argsort(-boxes[:, 4])]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    remaining = np.arange(len(boxes))
+    while len(remaining):
+        i, remaining = remaining[0], remaining[1:]
+        keep.append(i)
+        width = np.minimum(boxes[i, 2], boxes[remaining, 2]) - np.maximum(
+            boxes[i, 0], boxes[remaining, 0]
+        )
+        height = np.minimum(boxes[i, 3], boxes[remaining, 3]) - np.maximum(
+            boxes[i, 1], boxes[remaining, 1]
+        )
+        intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+        smaller = np.maximum(np.minimum(areas[i], areas[remaining]), 1e-9)
+        remaining = remaining[intersection / smaller <= overlap_threshold]
+    return boxes[keep]
+
+
+def _detect_batch(
+    images: list[cv2.typing.MatLike], backend: str, model_path: str, imgsz: int
+) -> list[np.ndarray]:
+    if backend == "yolo":
+        results = _load_yolo(model_path).predict(images, classes=[0], verbose=False)
+        return [
+            np.column_stack(
+                [result.boxes.xyxy.cpu().numpy(), result.boxes.conf.cpu().numpy()]
+            )
+            for result in results
+        ]
+    if backend == "onnx":
+        return get_onnx_detector(model_path, imgsz).detect_batch(images)
+    raise ValueError(f"Unknown detector backend: {backend}")
+
+
+def detect_people_boxes(
+    image: cv2.typing.MatLike | Image.Image,
+    backend: str = DETECTOR_BACKEND,
+    model_path: str = DETECTOR_MODEL,
+    imgsz: int = DETECTOR_IMGSZ,
+    roi_mask: Optional[np.ndarray] = None,
+    tile_size: int = DETECTOR_TILE_SIZE,
+    tile_overlap: float = DETECTOR_TILE_OVERLAP,
+) -> np.ndarray:
+    """Detects people, optionally only within a ROI and on overlapping tiles.
+
+    Without tiling, the image is cropped to the bounding box of the ROI. With
+    tiling, the tiles outside the ROI are skipped and the others are detected in
+    one batch, so that distant people are not downscaled away. Pixels outside
+    the ROI are blanked, and boxes whose bottom centre (where the person
+    stands) is outside it are dropped.
+
+    :param image: Image to detect the people in
+    :type image: cv2.typing.MatLike | Image.Image
+    :param backend: One of :data:`DETECTOR_BACKENDS`, defaults to DETECTOR_BACKEND
+    :type backend: str, optional
+    :param model_path: Detector weights, defaults to DETECTOR_MODEL
+    :type model_path: str, optional
+    :param imgsz: Input size of the ``onnx`` backend, defaults to DETECTOR_IMGSZ
+    :type imgsz: int, optional
+    :param roi_mask: ROI mask from :func:`make_roi_mask`, defaults to None for
+        the whole image
+    :type roi_mask: Optional[np.ndarray], optional
+    :param tile_size: Side of the tiles in pixels, 0 to disable tiling. Defaults
+        to DETECTOR_TILE_SIZE.
+    :type tile_size: int, optional
+    :param tile_overlap: Overlap of the tiles, defaults to DETECTOR_TILE_OVERLAP
+    :type tile_overlap: float, optional
+    :raises ValueError: If the backend is unknown
+    :return: Boxes of shape ``(n, 5)`` as ``x1, y1, x2, y2, score``
+    :rtype: np.ndarray
+    """
+    image = to_bgr(image)
+    if roi_mask is not None:
+        if not roi_mask.any():
+            return np.zeros((0, 5))
+        image = np.where(roi_mask[..., np.newaxis] > 0, image, LETTERBOX_COLOUR)
+        image = image.astype(np.uint8)
+
+    if tile_size > 0:
+        regions = get_tiles(image.shape, tile_size, tile_overlap, roi_mask)
+    elif roi_mask is not None:
+        x, y, width, height = cv2.boundingRect(roi_mask)
+        regions = [(x, y, x + width, y + height)]
+    else:
+        regions = [(0, 0, image.shape[1], image.shape[0])]
+
+    crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in regions]
+    boxes = np.concatenate(
+        [
+            crop_boxes + [x1, y1, x1, y1, 0]
+            for crop_boxes, (x1, y1, _, _) in zip(
+                _detect_batch(crops, backend, model_path, imgsz), regions
+            )
+        ]
+    )
+    if len(regions) > 1:
+        boxes = merge_tile_boxes(boxes)
+
+    if roi_mask is not None and len(boxes):
+        feet_x = np.clip((boxes[:, 0] + boxes[:, 2]) / 2, 0, roi_mask.shape[1] - 1)
+        feet_y = np.clip(boxes[:, 3], 0, roi_mask.shape[0] - 1)
+        boxes = boxes[roi_mask[feet_y.astype(int), feet_x.astype(int)] > 0]
+    return boxes
+
+
+def count_people(
+    image: cv2.typing.MatLike | Image.Image,
+    backend: str = DETECTOR_BACKEND,
+    model_path: str = DETECTOR_MODEL,
+    imgsz: int = DETECTOR_IMGSZ,
+    device_id: Optional[int] = None,
+    tile_size: int = DETECTOR_TILE_SIZE,
+) -> int:
+    """Counts the people in an image with the configured detector backend.
+
+    :param image: Image to count the people in
+    :type image: cv2.typing.MatLike | Image.Image
+    :param backend: One of :data:`DETECTOR_BACKENDS`, defaults to DETECTOR_BACKEND
+    :type backend: str, optional
+    :param model_path: Detector weights, defaults to DETECTOR_MODEL
+    :type model_path: str, optional
+    :param imgsz: Input size of the ``onnx`` backend, defaults to DETECTOR_IMGSZ
+    :type imgsz: int, optional
+    :param device_id: Device that captured the image, to look up its ROI in
+        DETECTOR_ROI_PATH. Defaults to None for the whole image.
+    :type device_id: Optional[int], optional
+    :param tile_size: Side of the tiles in pixels, 0 to disable tiling. Defaults
+        to DETECTOR_TILE_SIZE.
+    :type tile_size: int, optional
+    :raises ValueError: If the backend is unknown
+    :return: Number of people detected
+    :rtype: int
+    """
+    roi_mask = None
+    if DETECTOR_ROI_PATH and device_id is not None:
+        polygons = load_roi_polygons(DETECTOR_ROI_PATH).get(device_id)
+        if polygons is not None:
+            roi_mask = make_roi_mask(to_bgr(image).shape, polygons)
+
+    if backend == "yolo" and roi_mask is None and tile_size <= 0:
+        return get_people_count(_load_yolo(model_path).predict(image, classes=[0]))
+    return len(
+        detect_people_boxes(
+            image, backend, model_path, imgsz, roi_mask=roi_mask, tile_size=tile_size
+        )
+    )
+
+
 def open_image(image_path: str | bytes | Path) -> Image.Image:
     """Function to open an image.
 
@@ -94,7 +563,7 @@ def training_output(data_dir: str | Path, out_dir: str | Path) -> None:
                 img = open_image(f"{data_dir}/{collector}/images/{image}")
 
                 # Perform object detection and count people
-                count = get_people_count(detect(img))
+                count = count_people(img, device_id=COLLECTORS.index(collector))
 
                 # Save results to CSV
                 with open(
@@ -0,0 +1,156 @@
+"""Serves static files from memory, compressed once when they are loaded.
+
+Each file is kept as is and gzip compressed (and brotli compressed if the
+``brotli`` package is installed), when that makes it smaller. Every
+representation has a strong ETag from the hash of the file and its encoding,
+so clients revalidate with ``If-None-Match`` and get a 304 without a body.
+Versioned files, with a content hash in their name such as ``app.3f2a9c1d.js``,
+never change and are cached for a year; the others, e.g. ``index.html``, are
+revalidated on every use.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from typing import NamedTuple, Optional
+
+#: Cache-Control of the versioned files, cached for a year.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+#: Cache-Control of the other files, revalidated with their ETag on every use.
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+#: Matches the names of versioned files, with a hash of 8 or more hex digits.
+VERSIONED_NAME = re.compile(r"\.[0-9a-f]{8,}\.[^.]+$")
+
+
+class StaticAsset(NamedTuple):
+    """Static file and its compressed representations.
+
+    :param media_type: Media type of the file
+    :type media_type: str
+    :param cache_control: Cache-Control header of the file
+    :type cache_control: str
+    :param bodies: Body of each content coding ("identity" for the file as is),
+        only with the codings smaller than the file
+    :type bodies: dict[str, bytes]
+    :param etags: Strong ETag of each content coding in bodies
+    :type etags: dict[str, str]
+    """
+
+    media_type: str
+    cache_control: str
+    bodies: dict[str, bytes]
+    etags: dict[str, str]
+
+
+def _brotli_compress(body: bytes) -> Optional[bytes]:
+    try:
+        # pylint: disable=import-outside-toplevel
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(body, quality=11)
+
+
+def make_asset(name: str, body: bytes) -> StaticAsset:
+    """Compresses a file for serving.
+
+    :param name: File name, for the media type and whether it is versioned
+    :type name: str
+    :param body: Contents of the file
+    :type body: bytes
+    :return: The file and its compressed representations
+    :rtype: StaticAsset
+    """
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    cache_control = (
+        IMMUTABLE_CACHE_CONTROL
+        if VERSIONED_NAME.search(name)
+        else REVALIDATE_CACHE_CONTROL
+    )
+
+    bodies = {"identity": body}
+    for encoding, compressed in (
+        ("br", _brotli_compress(body)),
+        ("gzip", gzip.compress(body, compresslevel=9, mtime=0)),
+    ):
+        if compressed is not None and len(compressed) < len(body):
+            bodies[encoding] = compressed
+
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    etags = {
+        encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+        for encoding in bodies
+    }
+    return StaticAsset(media_type, cache_control, bodies, etags)
+
+
+def load_assets(directory: str) -> dict[str, StaticAsset]:
+    """Loads and compresses every file in a directory, except hidden ones.
+
+    :param directory: Directory of the files
+    :type directory: str
+    :return: Files by their path relative to the directory, with "/"
+        separators, empty if the directory does not exist
+    :rtype: dict[str, StaticAsset]
+    """
+    assets = {}
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for file_name in files:
+            if file_name.startswith("."):
+                continue
+            path = os.path.join(root, file_name)
+            with open(path, "rb") as f:
+                body = f.read()
+            relative_path = os.path.relpath(path, directory).replace(os.sep, "/")
+            assets[relative_path] = make_asset(file_name, body)
+    return assets
+
+
+def choose_encoding(asset: StaticAsset, accept_encoding: str) -> str:
+    """Chooses the smallest representation that the client accepts.
+
+    :param asset: The file
+    :type asset: StaticAsset
+    :param accept_encoding: Accept-Encoding header of the request
+    :type accept_encoding: str
+    :return: Content coding of the representation, "identity" for the file as is
+    :rtype: str
+    """
+    accepted = set()
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.strip().partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip().lower())
+
+    candidates = [
+        encoding
+        for encoding in asset.bodies
+        if encoding != "identity" and (encoding in accepted or "*" in accepted)
+    ]
+    if not candidates:
+        return "identity"
+    return min(candidates, key=lambda encoding: len(asset.bodies[encoding]))
+
+
+def etag_matches(etag: str, if_none_match: str) -> bool:
+    """Checks an ETag against an If-None-Match header, with the weak comparison.
+
+    :param etag: ETag of the representation
+    :type etag: str
+    :param if_none_match: If-None-Match header of the request
+    :type if_none_match: str
+    :return: Whether the client's copy is current
+    :rtype: bool
+    """
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
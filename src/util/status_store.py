@@ -0,0 +1,212 @@
+"""Shared-memory store of the latest crowd status, so that several API worker
+    processes serve the same status.
+
+The status is stored as JSON in a memory-mapped file in ``/dev/shm`` (the
+temporary directory where there is none), after a header with a version and
+the length of the JSON. Writers make
+the version odd while they write and even again once done (a sequence lock),
+so readers never block: they read the version, copy the JSON and retry if the
+version changed in between, for at most :data:`READ_TIMEOUT`. Readers that
+already hold the current version only read the header. Writers in different
+processes are serialised with a file lock on the file, and the threads of a
+process with a thread lock, as the file lock does not exclude threads that
+share the open file. Coroutines take both locks with :meth:`async_write_lock`,
+which retries without blocking the event loop.
+
+A plain memory-mapped file is used rather than
+:class:`multiprocessing.shared_memory.SharedMemory`, whose resource tracker
+unlinks the block when any process that attached to it exits, before Python
+3.13.
+"""
+
+import asyncio
+import contextlib
+import fcntl
+import mmap
+import os
+import secrets
+import tempfile
+import threading
+import time
+from typing import AsyncIterator, BinaryIO, Iterator, Optional
+
+#: Number of int64 values in the header: version and JSON length.
+HEADER_LEN = 2
+
+#: Default maximum size of the JSON in bytes.
+DEFAULT_SIZE = 64 * 1024
+
+#: Directory of the stores, in memory on Linux.
+STORE_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+#: Seconds a reader retries while a write is in progress, much longer than a
+#: write takes unless the writer died during it.
+READ_TIMEOUT = 0.1
+
+#: Seconds between attempts of :meth:`SharedStatusStore.async_write_lock`.
+LOCK_POLL_INTERVAL = 0.001
+
+
+class SharedStatusStore:
+    """Latest crowd status as JSON in shared memory, see the module description.
+
+    Use :meth:`create` in the parent process and :meth:`attach` in the workers.
+
+    :param file: Open store file
+    :type file: BinaryIO
+    :param owner: Whether this instance created the file and removes it,
+        defaults to False
+    :type owner: bool, optional
+    """
+
+    def __init__(self, file: BinaryIO, owner: bool = False):
+        self.file = file
+        self.owner = owner
+        self.mmap = mmap.mmap(file.fileno(), 0)
+        self.buf = memoryview(self.mmap)
+        self.header = self.buf[: 8 * HEADER_LEN].cast("q")
+        self.data_offset = self.header.nbytes
+        self.thread_lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        """Name of the store, to :meth:`attach` to it.
+
+        :return: Name of the store
+        :rtype: str
+        """
+        return os.path.basename(self.file.name)
+
+    @classmethod
+    def create(
+        cls, size: int = DEFAULT_SIZE, name: Optional[str] = None
+    ) -> "SharedStatusStore":
+        """Creates an empty store, with version 0.
+
+        :param size: Maximum size of the JSON in bytes, defaults to DEFAULT_SIZE
+        :type size: int, optional
+        :param name: Name of the store, defaults to None for a random name
+        :type name: Optional[str], optional
+        :return: The store, which removes its file when closed
+        :rtype: SharedStatusStore
+        """
+        name = name or f"crowd_status_{secrets.token_hex(8)}"
+        # pylint: disable=consider-using-with
+        file = open(os.path.join(STORE_DIR, name), "x+b")
+        file.truncate(8 * HEADER_LEN + size)
+        return cls(file, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedStatusStore":
+        """Attaches to a store created by another process.
+
+        :param name: Name of the store
+        :type name: str
+        :return: The store
+        :rtype: SharedStatusStore
+        """
+        # pylint: disable=consider-using-with
+        return cls(open(os.path.join(STORE_DIR, name), "r+b"))
+
+    def version(self) -> int:
+        """Returns the version of the stored status, without copying it.
+
+        :return: Version, odd while a write is in progress
+        :rtype: int
+        """
+        return int(self.header[0])
+
+    def read(self, timeout: float = READ_TIMEOUT) -> tuple[int, bytes]:
+        """Copies the stored status.
+
+        :param timeout: Seconds to retry while a write is in progress, defaults
+            to READ_TIMEOUT
+        :type timeout: float, optional
+        :raises TimeoutError: If no write completed within the timeout
+        :return: Version (even) and JSON of the status, empty for version 0
+        :rtype: tuple[int, bytes]
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            version = int(self.header[0])
+            if version % 2 == 0:
+                length = int(self.header[1])
+                body = bytes(self.buf[self.data_offset : self.data_offset + length])
+                if int(self.header[0]) == version:
+                    return version, body
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Status store {self.name} is still being written.")
+            time.sleep(0)
+
+    @contextlib.contextmanager
+    def write_lock(self) -> Iterator[None]:
+        """Locks out writers in other processes and threads, e.g. to read,
+        update and write the status. Blocks until the lock is free.
+
+        :yield: Nothing, the lock is held until the context exits
+        :rtype: Iterator[None]
+        """
+        with self.thread_lock:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+
+    @contextlib.asynccontextmanager
+    async def async_write_lock(
+        self, poll_interval: float = LOCK_POLL_INTERVAL
+    ) -> AsyncIterator[None]:
+        """Locks out writers in other processes and threads as
+        :meth:`write_lock`, retrying while they hold the lock instead of
+        blocking the event loop.
+
+        :param poll_interval: Seconds between attempts, defaults to
+            LOCK_POLL_INTERVAL
+        :type poll_interval: float, optional
+        :yield: Nothing, the lock is held until the context exits
+        :rtype: AsyncIterator[None]
+        """
+        while True:
+            if self.thread_lock.acquire(blocking=False):
+                try:
+                    fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    self.thread_lock.release()
+            await asyncio.sleep(poll_interval)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.thread_lock.release()
+
+    def write(self, body: bytes) -> int:
+        """Stores a status. Hold :meth:`write_lock` if several processes write.
+
+        :param body: JSON of the status
+        :type body: bytes
+        :raises ValueError: If the JSON does not fit in the store
+        :return: New version of the status
+        :rtype: int
+        """
+        if len(body) > len(self.buf) - self.data_offset:
+            raise ValueError(f"Status of {len(body)} bytes does not fit the store.")
+        # An odd version is left by a writer that died during its write.
+        version = int(self.header[0])
+        version += version % 2
+        self.header[0] = version + 1
+        self.buf[self.data_offset : self.data_offset + len(body)] = body
+        self.header[1] = len(body)
+        self.header[0] = version + 2
+        return version + 2
+
+    def close(self) -> None:
+        """Closes the store, and removes its file if this instance created it."""
+        # The views must be released before the map can be closed.
+        self.header.release()
+        self.buf.release()
+        self.mmap.close()
+        self.file.close()
+        if self.owner:
+            os.remove(self.file.name)
@@ -0,0 +1,147 @@
+"""Tiered people counting for edge devices where YOLO is too slow to run on
+    every cycle.
+
+Every cycle, a cheap estimate is computed from the ratio of foreground pixels
+given by a background subtractor on a downscaled grey frame. The full
+detector only runs every ``yolo_interval`` cycles, or when the foreground ratio
+shifts sharply from the last detection. Each detection also calibrates a linear
+map from the foreground ratio to the people count, with exponentially decaying
+weights so that the calibration follows lighting and camera changes.
+"""
+
+import math
+from typing import Callable, Optional
+
+import cv2
+import numpy as np
+
+#: Width that frames are downscaled to before background subtraction.
+ESTIMATOR_WIDTH = 160
+
+#: Minimum foreground ratio that shifts are measured relative to.
+MIN_SHIFT_RATIO = 0.01
+
+
+class TieredPeopleCounter:
+    """Counts people with a calibrated foreground ratio, falling back to a
+    full detector periodically and on sharp changes.
+
+    :param count_fn: Full people counter, e.g.
+        :func:`util.people_detection.count_people`
+    :type count_fn: Callable[[cv2.typing.MatLike], int]
+    :param yolo_interval: Run the full counter at least every this many
+        cycles, defaults to 5
+    :type yolo_interval: int, optional
+    :param shift_threshold: Relative change of the foreground ratio since the
+        last full count that triggers a full count, defaults to 0.5
+    :type shift_threshold: float, optional
+    :param decay: Weight decay of older calibration samples per full count,
+        defaults to 0.9
+    :type decay: float, optional
+    """
+
+    def __init__(
+        self,
+        count_fn: Callable[[cv2.typing.MatLike], int],
+        yolo_interval: int = 5,
+        shift_threshold: float = 0.5,
+        decay: float = 0.9,
+    ):
+        self.count_fn = count_fn
+        self.yolo_interval = yolo_interval
+        self.shift_threshold = shift_threshold
+        self.decay = decay
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows=True)
+
+        # Exponentially weighted sums of 1, x, y, x^2 and xy for the calibration.
+        self.sums = np.zeros(5)
+        self.samples = 0
+        self.cycles_since_full = 0
+        self.last_full_ratio: Optional[float] = None
+        self.last_full_count = 0
+        self.last_was_full = False
+
+    def foreground_ratio(self, image: cv2.typing.MatLike) -> float:
+        """Updates the background model and returns the foreground ratio.
+
+        :param image: BGR image
+        :type image: cv2.typing.MatLike
+        :return: Fraction of foreground pixels, excluding shadows
+        :rtype: float
+        """
+        height, width = image.shape[:2]
+        if width > ESTIMATOR_WIDTH:
+            size = (ESTIMATOR_WIDTH, max(1, round(height * ESTIMATOR_WIDTH / width)))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        foreground = self.subtractor.apply(image)
+        # MOG2 marks shadows as 127 and foreground as 255.
+        return float(np.count_nonzero(foreground == 255)) / foreground.size
+
+    def calibrate(self, ratio: float, count: int) -> None:
+        """Adds a full count to the calibration.
+
+        :param ratio: Foreground ratio of the frame
+        :type ratio: float
+        :param count: Full count of the frame
+        :type count: int
+        """
+        self.sums = self.decay * self.sums + [1, ratio, count, ratio**2, ratio * count]
+        self.samples += 1
+
+    def estimate(self, ratio: float) -> float:
+        """Estimates the people count from a foreground ratio.
+
+        :param ratio: Foreground ratio
+        :type ratio: float
+        :return: Estimated count, the last full count if not calibrated yet
+        :rtype: float
+        """
+        weight, sum_x, sum_y, sum_xx, sum_xy = self.sums
+        if self.samples == 0:
+            return self.last_full_count
+        var = weight * sum_xx - sum_x**2
+        if self.samples >= 2 and var > 1e-12 * weight**2:
+            slope = (weight * sum_xy - sum_x * sum_y) / var
+            return max(0.0, (sum_y + slope * (ratio * weight - sum_x)) / weight)
+        if sum_xx > 0:
+            # Not enough spread for a line yet, scale through the origin.
+            return max(0.0, ratio * sum_xy / sum_xx)
+        return sum_y / weight
+
+    def should_run_full(self, ratio: float) -> bool:
+        """Returns whether the full counter should run for this cycle.
+
+        :param ratio: Foreground ratio of the frame
+        :type ratio: float
+        :return: Whether to run the full counter
+        :rtype: bool
+        """
+        if self.last_full_ratio is None:
+            return True
+        if self.cycles_since_full + 1 >= self.yolo_interval:
+            return True
+        shift = abs(ratio - self.last_full_ratio)
+        return shift > self.shift_threshold * max(self.last_full_ratio, MIN_SHIFT_RATIO)
+
+    def count(self, image: cv2.typing.MatLike) -> int:
+        """Counts the people in a frame, see the class description.
+
+        :param image: BGR image
+        :type image: cv2.typing.MatLike
+        :return: Number of people, full or estimated
+        :rtype: int
+        """
+        ratio = self.foreground_ratio(image)
+        self.last_was_full = self.should_run_full(ratio)
+        if not self.last_was_full:
+            self.cycles_since_full += 1
+            return math.floor(self.estimate(ratio) + 0.5)
+
+        count = self.count_fn(image)
+        self.calibrate(ratio, count)
+        self.cycles_since_full = 0
+        self.last_full_ratio = ratio
+        self.last_full_count = count
+        return count
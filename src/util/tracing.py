@@ -0,0 +1,209 @@
+"""Lightweight tracing of a reading from the edge, through the broker and the
+    fog, to the API.
+
+A trace is a JSON-serialisable dictionary that travels inside the payloads.
+Each host appends spans for its own stages. The duration of a span is measured
+with the host's monotonic clock (:func:`time.perf_counter`), so it is not
+affected by clock adjustments. Hops between hosts (``transport`` and
+``fog_to_api``) can only be measured with the wall clock, so they assume that
+the clocks are synchronised (e.g. with NTP).
+"""
+
+import contextlib
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from typing import Iterator, Optional, TypedDict
+
+#: Number of most recent samples kept per stage and device.
+RESERVOIR_SIZE = 1024
+
+#: Percentiles reported by :meth:`LatencyRecorder.summary`.
+PERCENTILES = (50, 95, 99)
+
+
+class Span(TypedDict):
+    """A timed stage of a trace.
+
+    :param stage: Stage name, e.g. ``acquisition`` or ``inference``
+    :type stage: str
+    :param start: Wall clock start time in seconds since the epoch
+    :type start: float
+    :param duration: Duration in seconds
+    :type duration: float
+    """
+
+    stage: str
+    start: float
+    duration: float
+
+
+class Trace(TypedDict):
+    """Trace of a reading.
+
+    :param trace_id: Unique ID of the reading
+    :type trace_id: str
+    :param device_id: Edge device that took the reading
+    :type device_id: int
+    :param created_at: Wall clock time the reading started, in seconds since
+        the epoch
+    :type created_at: float
+    :param sent_at: Wall clock time the trace was last sent to another host
+    :type sent_at: float | None
+    :param spans: Spans of the stages so far
+    :type spans: list[Span]
+    """
+
+    trace_id: str
+    device_id: int
+    created_at: float
+    sent_at: float | None
+    spans: list[Span]
+
+
+def new_trace(device_id: int) -> Trace:
+    """Starts a trace for a reading.
+
+    :param device_id: Edge device taking the reading
+    :type device_id: int
+    :return: The trace
+    :rtype: Trace
+    """
+    return Trace(
+        trace_id=uuid.uuid4().hex,
+        device_id=device_id,
+        created_at=time.time(),
+        sent_at=None,
+        spans=[],
+    )
+
+
+@contextlib.contextmanager
+def span(trace: Trace, stage: str) -> Iterator[None]:
+    """Times a stage and appends its span to the trace.
+
+    :param trace: The trace
+    :type trace: Trace
+    :param stage: Stage name
+    :type stage: str
+    """
+    start_wall = time.time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace["spans"].append(
+            Span(stage=stage, start=start_wall, duration=time.perf_counter() - start)
+        )
+
+
+def mark_sent(trace: Trace) -> Trace:
+    """Stamps the time a trace is sent to another host.
+
+    :param trace: The trace
+    :type trace: Trace
+    :return: The same trace
+    :rtype: Trace
+    """
+    trace["sent_at"] = time.time()
+    return trace
+
+
+def mark_received(
+    trace: Trace, stage: str, received_at: Optional[float] = None
+) -> None:
+    """Appends the span of the hop since :func:`mark_sent`, if it was sent.
+
+    :param trace: The trace
+    :type trace: Trace
+    :param stage: Stage name of the hop
+    :type stage: str
+    :param received_at: Wall clock time the trace was received, defaults to
+        None for now
+    :type received_at: Optional[float], optional
+    """
+    if trace.get("sent_at") is None:
+        return
+    now = received_at if received_at is not None else time.time()
+    trace["spans"].append(
+        Span(
+            stage=stage,
+            start=trace["sent_at"],  # type: ignore
+            duration=max(0.0, now - trace["sent_at"]),  # type: ignore
+        )
+    )
+    trace["sent_at"] = None
+
+
+class LatencyRecorder:
+    """Keeps the most recent span durations per stage and device, and
+    summarises them as percentiles.
+
+    :param reservoir_size: Number of samples kept per stage and device,
+        defaults to RESERVOIR_SIZE
+    :type reservoir_size: int, optional
+    """
+
+    def __init__(self, reservoir_size: int = RESERVOIR_SIZE):
+        self.samples: defaultdict[tuple[str, int], deque[float]] = defaultdict(
+            lambda: deque(maxlen=reservoir_size)
+        )
+        self.lock = threading.Lock()
+
+    def record(self, trace: Trace) -> None:
+        """Records the spans of a finished trace, plus its ``end_to_end`` span
+        from its creation until now.
+
+        :param trace: The trace
+        :type trace: Trace
+        """
+        device_id = int(trace.get("device_id", -1))
+        end_to_end = time.time() - trace["created_at"]
+        with self.lock:
+            for trace_span in trace["spans"]:
+                self.samples[trace_span["stage"], device_id].append(
+                    trace_span["duration"]
+                )
+            self.samples["end_to_end", device_id].append(max(0.0, end_to_end))
+
+    def summary(self, device_id: Optional[int] = None) -> dict[str, dict]:
+        """Summarises the recorded latencies.
+
+        :param device_id: Only summarise this device, defaults to None for all
+        :type device_id: Optional[int], optional
+        :return: For each stage, the sample count and the percentiles in
+            seconds for each device and for ``all`` devices, e.g.
+            ``{"inference": {"all": {"count": 10, "p50": ...}, "0": {...}}}``
+        :rtype: dict[str, dict]
+        """
+        # pylint: disable=import-outside-toplevel
+        import numpy as np
+
+        with self.lock:
+            samples = {
+                key: list(values)
+                for key, values in self.samples.items()
+                if device_id is None or key[1] == device_id
+            }
+
+        by_stage: defaultdict[str, dict[str, list[float]]] = defaultdict(dict)
+        for (stage, device), values in samples.items():
+            by_stage[stage][str(device)] = values
+            by_stage[stage].setdefault("all", []).extend(values)
+
+        return {
+            stage: {
+                device: {
+                    "count": len(values),
+                    **{
+                        f"p{q}": float(value)
+                        for q, value in zip(
+                            PERCENTILES, np.percentile(values, PERCENTILES)
+                        )
+                    },
+                }
+                for device, values in devices.items()
+            }
+            for stage, devices in sorted(by_stage.items())
+        }
@@ -8,8 +8,6 @@ import re
 import subprocess
 from typing import Sequence
 
-import pandas as pd
-
 from deployment.config import DEVICE_IDX, TOTAL_DEVICES, TOP_N_APS
 
 
@@ -166,6 +164,10 @@ def get_demo_data(
     :rtype: tuple[list[int], int]
     """
 
+    # Imported here as pandas is slow to import and only needed for the demo.
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
     # Load the data from the csv file
     df = pd.read_csv(koufu_csv_path)
 